@@ -0,0 +1,65 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Times loading people, projects, tasks and clients with a cold and warm cache.'''
+
+import time
+import shutil
+import tempfile
+import argparse
+from reap.api.cache import Cache
+from reap.api.admin import Harvest
+from reap.api.fake import FakeHarvest
+
+def run(fake, cache):
+    hv = Harvest(fake.base_uri, fake.username, fake.password, cache = cache)
+    fake.reset_counts()
+    began = time.time()
+    hv.people()
+    hv.projects()
+    hv.tasks()
+    hv.clients()
+    return (len(fake.requests), time.time() - began)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--people', type = int, default = 200)
+    parser.add_argument('--projects', type = int, default = 500)
+    parser.add_argument('--tasks', type = int, default = 50)
+    options = parser.parse_args()
+    path = tempfile.mkdtemp()
+    try:
+        with FakeHarvest() as fake:
+            fake.seed(
+                people = options.people,
+                projects = options.projects,
+                tasks = options.tasks,
+                entries = 0,
+            )
+            for label, cache in (
+                ('none', None),
+                ('cold', Cache(path)),
+                ('warm', Cache(path)),
+            ):
+                requests, elapsed = run(fake, cache)
+                print str.format(
+                    '{:5} cache: {} requests in {:.3f}s',
+                    label,
+                    requests,
+                    elapsed,
+                )
+    finally:
+        shutil.rmtree(path)
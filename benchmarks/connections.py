@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Counts connections opened by `reap-reports hours` with and without pooling.
+
+Runs the hours report against a local fake Harvest server, once with a pool
+	that never keeps connections alive (one connection per request, as with
+	urllib2.urlopen) and once with the default keep-alive pool.'''
+
+import sys
+import time
+import StringIO
+import argparse
+from reap.api.base import ConnectionPool, DEFAULT_POOL_SIZE
+from reap.api.admin import Harvest
+from reap.api.fake import FakeHarvest
+import reap.commands.reports
+
+def run(fake, ids, pool_size):
+    fake.reset_counts()
+    pool = ConnectionPool(maxsize = pool_size)
+    hv = Harvest(fake.base_uri, fake.username, fake.password, pool = pool)
+    # the fake server does not throttle, so do not hold requests back.
+    hv.limiter = None
+    reap.commands.reports.get_harvest = lambda args: hv
+    args = argparse.Namespace(
+        personids = ids,
+        start = None,
+        end = None,
+        concurrency = 1,
+    )
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    began = time.time()
+    try:
+        reap.commands.reports.hours(args)
+    finally:
+        sys.stdout = stdout
+    elapsed = time.time() - began
+    pool.close()
+    return (pool.opened, len(fake.requests), elapsed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--people', type = int, default = 30)
+    parser.add_argument('--projects', type = int, default = 5)
+    parser.add_argument('--tasks', type = int, default = 3)
+    parser.add_argument('--entries', type = int, default = 300)
+    options = parser.parse_args()
+    with FakeHarvest() as fake:
+        fake.seed(
+            people = options.people,
+            projects = options.projects,
+            tasks = options.tasks,
+            entries = options.entries,
+        )
+        ids = [p['id'] for p in fake.people]
+        for label, size in (('before', 0), ('after', DEFAULT_POOL_SIZE)):
+            opened, requests, elapsed = run(fake, ids, size)
+            print str.format(
+                '{:7} pool size {}: {} connections for {} requests in {:.3f}s',
+                label,
+                size,
+                opened,
+                requests,
+                elapsed,
+            )
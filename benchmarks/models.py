@@ -0,0 +1,119 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Measures the memory and load time of many entries, old and new models.
+
+Each model is measured in its own process, so the memory one leaves behind
+	does not hide the growth of the next. The legacy model is the entry class
+	as it was before it got slots and lazy timestamps.'''
+
+import os
+import gc
+import sys
+import time
+import random
+import argparse
+import datetime
+import subprocess
+from reap.api.admin import Entry
+
+class LegacyEntry:
+    def __init__(self, hv, json):
+        self.id = json['id']
+        self.hours = float(json['hours'])
+        self.project_id = json['project_id']
+        self.notes = json['notes']
+        self.task_id = json['task_id']
+        self.user_id = json['user_id']
+        self.billed = json['is_billed']
+        self.closed = json['is_closed']
+        self.updated = datetime.datetime.strptime(json['updated_at'], '%Y-%m-%dT%H:%M:%SZ')
+        self.created = datetime.datetime.strptime(json['created_at'], '%Y-%m-%dT%H:%M:%SZ')
+        self.spent = datetime.datetime.strptime(json['spent_at'], '%Y-%m-%d')
+
+MODELS = {
+    'legacy': LegacyEntry,
+    'slots': Entry,
+}
+
+def entry_json(count, random_seed = 0):
+    rand = random.Random(random_seed)
+    first = datetime.datetime(2013, 1, 1)
+    for i in xrange(count):
+        spent = first + datetime.timedelta(days = rand.randrange(365))
+        stamp = (spent + datetime.timedelta(hours = 17)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        yield {
+            'id': i + 1,
+            'hours': str(rand.randrange(1, 33) / 4.0),
+            'project_id': rand.randrange(100),
+            'notes': '',
+            'task_id': rand.randrange(20),
+            'user_id': rand.randrange(100),
+            'is_billed': False,
+            'is_closed': False,
+            'updated_at': stamp,
+            'created_at': stamp,
+            'spent_at': spent.strftime('%Y-%m-%d'),
+        }
+
+def resident():
+    '''Returns the resident set size of this process in bytes (Linux only).'''
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def measure(model, count):
+    model_class = MODELS[model]
+    # Parsed JSON is thrown away as reports go, so only the models are kept.
+    began = time.time()
+    for ej in entry_json(count):
+        pass
+    generating = time.time() - began
+    gc.collect()
+    before = resident()
+    began = time.time()
+    entries = [model_class(None, ej) for ej in entry_json(count)]
+    loaded = time.time() - began - generating
+    grown = resident() - before
+    began = time.time()
+    for e in entries:
+        e.spent
+        e.updated
+    decoded = time.time() - began
+    print str.format(
+        '{:7} {} entries: load {:.3f}s, read dates {:.3f}s, {:.1f} MB ({:.0f} bytes each)',
+        model,
+        count,
+        loaded,
+        decoded,
+        grown / 1048576.0,
+        grown / float(count),
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--entries', type = int, default = 500000)
+    parser.add_argument('--model', choices = sorted(MODELS), help = 'Only measure this model, in this process.')
+    options = parser.parse_args()
+    if options.model:
+        measure(options.model, options.entries)
+    else:
+        for model in sorted(MODELS):
+            subprocess.check_call([
+                sys.executable,
+                os.path.abspath(__file__),
+                '--model', model,
+                '--entries', str(options.entries),
+            ])
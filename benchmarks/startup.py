@@ -0,0 +1,145 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Times how long each script takes to start, and which imports cost the most.
+
+Each script is run with -h in a fresh interpreter, which imports everything
+	it needs to parse a command and then exits. The time taken beyond
+	starting a bare interpreter is checked against the script's budget.
+	With --imports, the slowest imports of each script are listed too,
+	timed like python -X importtime does on newer Pythons.'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, 'reap')
+
+# Milliseconds each script may take to start, beyond the interpreter itself.
+BUDGETS = {
+    'reap': 40,
+    'reap-admin': 60,
+    'reap-reports': 60,
+}
+
+# Run in the child: times every import by itself, less the imports it made.
+IMPORT_TIMER = '''
+import sys, time, runpy, __builtin__
+real_import = __builtin__.__import__
+times = {}
+inner = []
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return real_import(name, *args, **kwargs)
+    inner.append(0.0)
+    began = time.time()
+    try:
+        return real_import(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - began
+        times[name] = times.get(name, 0.0) + elapsed - inner.pop()
+        if inner:
+            inner[-1] += elapsed
+__builtin__.__import__ = timed_import
+script = sys.argv[1]
+sys.argv = sys.argv[1:]
+try:
+    runpy.run_path(script, run_name = '__main__')
+except SystemExit:
+    pass
+__builtin__.__import__ = real_import
+import json
+sys.stderr.write(json.dumps(times))
+'''
+
+def environment():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + filter(None, [env.get('PYTHONPATH')])
+    )
+    return env
+
+def wall_time(argv, env):
+    with open(os.devnull, 'w') as devnull:
+        began = time.time()
+        subprocess.check_call(argv, env = env, stdout = devnull, stderr = devnull)
+        return time.time() - began
+
+def import_times(script, env):
+    '''Returns (seconds, module) of a script's imports, slowest first.'''
+    child = subprocess.Popen(
+        [sys.executable, '-c', IMPORT_TIMER, os.path.join(SCRIPTS, script), '-h'],
+        env = env,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.PIPE,
+    )
+    out, err = child.communicate()
+    times = json.loads(err)
+    return sorted(((seconds, name) for name, seconds in times.items()), reverse = True)
+
+def measure(repeat = 10):
+    '''Returns the median start up time of the interpreter and each script.'''
+    env = environment()
+    bare = sorted(
+        wall_time([sys.executable, '-c', 'pass'], env) for i in xrange(repeat)
+    )[repeat // 2]
+    results = {'python': bare, 'scripts': {}}
+    for script in sorted(BUDGETS):
+        seconds = sorted(
+            wall_time([sys.executable, os.path.join(SCRIPTS, script), '-h'], env)
+            for i in xrange(repeat)
+        )[repeat // 2]
+        results['scripts'][script] = {
+            'median': seconds,
+            'overhead': seconds - bare,
+            'budget': BUDGETS[script] / 1000.0,
+        }
+    return results
+
+def report(results, out = sys.stdout):
+    '''Prints each script's start up time, returning False if any is over budget.'''
+    within = True
+    print >> out, str.format('{:34} {:8.4f}s', 'python (bare)', results['python'])
+    for script, result in sorted(results['scripts'].items()):
+        over = result['overhead'] > result['budget']
+        within = within and not over
+        print >> out, str.format(
+            '{:34} {:8.4f}s {:+.4f}s over python, budget {:.3f}s{}',
+            script + ' -h',
+            result['median'],
+            result['overhead'],
+            result['budget'],
+            ' OVER BUDGET' if over else '',
+        )
+    return within
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--repeat', type = int, default = 10, help = 'Runs of each script.')
+    parser.add_argument('--imports', type = int, default = 0, metavar = 'COUNT', help = 'Also list the COUNT slowest imports of each script.')
+    options = parser.parse_args()
+    within = report(measure(options.repeat))
+    if options.imports:
+        for script in sorted(BUDGETS):
+            print
+            print script + ':'
+            for seconds, name in import_times(script, environment())[:options.imports]:
+                print str.format('    {:8.2f} ms  {}', seconds * 1000, name)
+    sys.exit(0 if within else 1)
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Compares peak memory and time of reading one large project, buffered or streamed.
+
+The fake server runs in a child process, so the peak resident size shown
+	is the client's alone. Each mode is measured in a fresh process.'''
+
+import os
+import sys
+import time
+import resource
+import argparse
+import subprocess
+import multiprocessing
+from reap.api.admin import Harvest
+from reap.api.table import EntryTable
+from reap.api.fake import FakeHarvest
+
+MODES = ['buffered', 'streamed']
+
+def serve(count, pipe):
+    with FakeHarvest() as fake:
+        fake.seed(people = 20, projects = 1, tasks = 5, entries = count, days = 3 * 365)
+        pipe.send((fake.base_uri, fake.username, fake.password))
+        pipe.recv()
+
+def measure(mode, count):
+    pipe, child_pipe = multiprocessing.Pipe()
+    server = multiprocessing.Process(target = serve, args = (count, child_pipe))
+    server.start()
+    try:
+        base_uri, username, password = pipe.recv()
+        hv = Harvest(base_uri, username, password)
+        hv.limiter = None
+        project = hv.projects()[0]
+        began = time.time()
+        if mode == 'buffered':
+            table = EntryTable(project.entries())
+        else:
+            table = EntryTable(project.iter_entries())
+        elapsed = time.time() - began
+    finally:
+        pipe.send('stop')
+        server.join()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    print str.format(
+        '{:9} {} entries in {:.3f}s, client peak {:.1f} MB',
+        mode,
+        len(table),
+        elapsed,
+        peak,
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--entries', type = int, default = 100000)
+    parser.add_argument('--mode', choices = MODES, help = 'Only run this mode, in this process.')
+    options = parser.parse_args()
+    if options.mode:
+        measure(options.mode, options.entries)
+    else:
+        for mode in MODES:
+            subprocess.check_call([
+                sys.executable,
+                os.path.abspath(__file__),
+                '--mode', mode,
+                '--entries', str(options.entries),
+            ])
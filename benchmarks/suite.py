@@ -0,0 +1,280 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Times every reap, reap-admin and reap-reports command against a fake server.
+
+Each command is run in-process, through its script, against a local fake
+	Harvest seeded with a dataset of the requested size. The wall clock time
+	and number of requests of every run are written to a JSON file, along
+	with how long each script takes to start (see startup.py). Pass an
+	earlier file with --baseline to compare against it.'''
+
+import os
+import sys
+import json
+import time
+import runpy
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import StringIO
+import startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = os.path.join(ROOT, 'reap')
+
+def today_entry(fake):
+    assignment = fake.task_assignments[0]
+    project = fake.find(fake.projects, assignment['project_id'])
+    task = fake.find(fake.tasks, assignment['task_id'])
+    return fake.add_entry(fake.user, project, task, 1.0)
+
+def report_range(fake):
+    days = sorted(e['spent_at'].replace('-', '') for e in fake.entries)
+    return ['--start', days[0], '--end', days[-1]]
+
+def import_file(fake, rows = 100):
+    '''Writes a new CSV of entries to import, so no run resumes another.'''
+    assignment = fake.task_assignments[0]
+    descriptor, path = tempfile.mkstemp(suffix = '.csv', dir = os.environ['HOME'])
+    with os.fdopen(descriptor, 'w') as file:
+        file.write('project_id,task_id,hours,notes,spent_at\n')
+        for i in xrange(rows):
+            file.write(str.format(
+                '{},{},1:00,Imported {},2013-02-01\n',
+                assignment['project_id'],
+                assignment['task_id'],
+                i,
+            ))
+    return path
+
+def people_ids(fake):
+    return [str(p['id']) for p in fake.people]
+
+def project_ids(fake):
+    return [str(p['id']) for p in fake.projects]
+
+# (script, command name, function giving the arguments for one run)
+COMMANDS = [
+    ('reap', 'status', lambda fake: ['status']),
+    ('reap', 'list', lambda fake: ['list']),
+    ('reap', 'create', lambda fake: [
+        'create',
+        str(fake.task_assignments[0]['project_id']),
+        str(fake.task_assignments[0]['task_id']),
+        '-t', '1:30',
+        '-n', 'Benchmark',
+    ]),
+    ('reap', 'start', lambda fake: ['start', str(today_entry(fake)['id'])]),
+    ('reap', 'stop', lambda fake: ['stop']),
+    ('reap', 'update', lambda fake: [
+        'update',
+        str(today_entry(fake)['id']),
+        '-n', 'Benchmark',
+        '-t', '2:00',
+    ]),
+    ('reap', 'delete', lambda fake: ['delete', str(today_entry(fake)['id'])]),
+    ('reap', 'import', lambda fake: ['import', import_file(fake)]),
+    ('reap-admin', 'list-people', lambda fake: ['list-people']),
+    ('reap-admin', 'create-person', lambda fake: [
+        'create-person',
+        'Bench',
+        'Mark',
+        'bench%d@example.com' % fake.next_id(),
+    ]),
+    ('reap-admin', 'delete-person', lambda fake: [
+        'delete-person',
+        str(fake.add_person('Bench', 'Mark', 'bench@example.com')['id']),
+    ]),
+    ('reap-admin', 'list-clients', lambda fake: ['list-clients']),
+    ('reap-admin', 'list-projects', lambda fake: ['list-projects']),
+    ('reap-admin', 'create-project', lambda fake: [
+        'create-project',
+        str(fake.clients[0]['id']),
+        'Benchmark',
+    ]),
+    ('reap-admin', 'delete-project', lambda fake: [
+        'delete-project',
+        str(fake.add_project('Benchmark', fake.clients[0]['id'])['id']),
+    ]),
+    ('reap-reports', 'hours', lambda fake:
+        ['hours'] + report_range(fake) + people_ids(fake)),
+    ('reap-reports', 'projects', lambda fake:
+        ['projects'] + report_range(fake) + people_ids(fake)),
+    ('reap-reports', 'tasks', lambda fake:
+        ['tasks'] + report_range(fake) + people_ids(fake)),
+    ('reap-reports', 'task-by-project', lambda fake:
+        ['task-by-project'] + report_range(fake) + project_ids(fake)),
+    ('reap-reports', 'hours --local', lambda fake:
+        ['--local', 'hours'] + report_range(fake) + people_ids(fake)),
+]
+
+def run(script, argv):
+    '''Runs a script in-process with the given arguments, returning seconds.'''
+    sys.argv = [script] + argv
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+    began = time.time()
+    try:
+        runpy.run_path(os.path.join(SCRIPTS, script), run_name = '__main__')
+    except SystemExit:
+        pass
+    finally:
+        sys.stdout = stdout
+    return time.time() - began
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd = ROOT,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def compare(results, baseline):
+    print str.format('{:34} {:>10} {:>10} {:>8} {:>8} {:>10} {:>10}', 'command', 'base (s)', 'now (s)', 'base req', 'now req', 'base bytes', 'now bytes')
+    for label, now in sorted(results['commands'].items()):
+        base = baseline['commands'].get(label)
+        if not base:
+            continue
+        print str.format(
+            '{:34} {:10.4f} {:10.4f} {:8d} {:8d} {:>10} {:>10}',
+            label,
+            base['median'],
+            now['median'],
+            base['requests'],
+            now['requests'],
+            # older results did not count bytes.
+            base.get('bytes', '-'),
+            now['bytes'],
+        )
+    if 'startup' in results and 'startup' in baseline:
+        print
+        print str.format('{:34} {:>10} {:>10} {:>10}', 'startup', 'base (s)', 'now (s)', 'budget (s)')
+        for script, now in sorted(results['startup']['scripts'].items()):
+            base = baseline['startup']['scripts'].get(script)
+            if not base:
+                continue
+            print str.format(
+                '{:34} {:10.4f} {:10.4f} {:10.4f}',
+                script + ' -h',
+                base['overhead'],
+                now['overhead'],
+                now['budget'],
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+    parser.add_argument('--people', type = int, default = 30)
+    parser.add_argument('--projects', type = int, default = 20)
+    parser.add_argument('--tasks', type = int, default = 10)
+    parser.add_argument('--entries', type = int, default = 3000)
+    parser.add_argument('--days', type = int, default = 60)
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'Seconds the fake server waits before each response.')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'Runs of each command.')
+    parser.add_argument('--only', help = 'Only run commands whose "script command" label contains this.')
+    parser.add_argument('--throttle', action = 'store_true', help = 'Keep the client side rate limit on.')
+    parser.add_argument('--output', default = 'benchmark.json', help = 'Where to write the results.')
+    parser.add_argument('--baseline', help = 'Results of an earlier run to compare against.')
+    options = parser.parse_args()
+
+    # Everything reap keeps under HOME goes into a scratch directory, which
+    # 	must be set before the commands are first imported.
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    sys.path.insert(0, ROOT)
+    import keyring
+    import reap.api.base
+    from reap.api.fake import FakeHarvest
+    if not options.throttle:
+        reap.api.base.default_limiter = lambda base_uri: None
+
+    results = {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'dataset': {
+            'people': options.people,
+            'projects': options.projects,
+            'tasks': options.tasks,
+            'entries': options.entries,
+            'days': options.days,
+        },
+        'latency': options.latency,
+        'commands': {},
+        'startup': startup.measure(max(options.repeat, 5)),
+    }
+    startup.report(results['startup'], sys.stderr)
+    try:
+        with FakeHarvest() as fake:
+            fake.seed(
+                people = options.people,
+                projects = options.projects,
+                tasks = options.tasks,
+                entries = options.entries,
+                days = options.days,
+            )
+            fake.latency = options.latency
+            with open(os.path.join(home, '.reaprc'), 'w') as file:
+                file.write(fake.base_uri + '\n' + fake.username + '\n')
+            keyring.get_password = lambda service, username: fake.password
+            for script, command, arguments in COMMANDS:
+                label = script + ' ' + command
+                if options.only and options.only not in label:
+                    continue
+                seconds = []
+                requests = []
+                sent = []
+                for i in xrange(options.repeat):
+                    argv = arguments(fake)
+                    fake.reset_counts()
+                    seconds.append(run(script, argv))
+                    requests.append(len(fake.requests))
+                    sent.append(fake.sent)
+                results['commands'][label] = {
+                    'seconds': seconds,
+                    'median': median(seconds),
+                    'requests': requests[-1],
+                    'first_requests': requests[0],
+                    'bytes': sent[-1],
+                }
+                print >> sys.stderr, str.format(
+                    '{:34} {:8.4f}s {:6d} requests (first run {}) {:9d} bytes',
+                    label,
+                    median(seconds),
+                    requests[-1],
+                    requests[0],
+                    sent[-1],
+                )
+    finally:
+        shutil.rmtree(home)
+    with open(options.output, 'w') as file:
+        json.dump(results, file, indent = 2, sort_keys = True)
+    if options.baseline:
+        with open(options.baseline) as file:
+            compare(results, json.load(file))
+
+if __name__ == '__main__':
+    main()
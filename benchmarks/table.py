@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Times the report aggregations over several years of entries.'''
+
+import time
+import argparse
+import reap.api.table
+from reap.api.table import EntryTable
+from models import entry_json
+from reap.api.admin import Entry
+
+GROUPINGS = [
+    ('hours', ('user_id', 'project_id', 'task_id')),
+    ('projects', ('user_id', 'project_id')),
+    ('tasks', ('user_id', 'task_id')),
+    ('task-by-project', ('project_id', 'task_id')),
+]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--entries', type = int, default = 500000)
+    options = parser.parse_args()
+    table = EntryTable(Entry(None, ej) for ej in entry_json(options.entries))
+    numpy = reap.api.table.numpy
+    for backend in ('numpy', 'python'):
+        if backend == 'numpy' and not numpy:
+            continue
+        reap.api.table.numpy = numpy if backend == 'numpy' else None
+        for report, keys in GROUPINGS:
+            began = time.time()
+            groups = len(table.group_sum(keys))
+            print str.format(
+                '{:6} {:15} {} entries, {} groups in {:.3f}s',
+                backend,
+                report,
+                len(table),
+                groups,
+                time.time() - began,
+            )
@@ -15,62 +15,205 @@
 '''An API for administrative functions on a Harvest time tracking system.'''
 
 import datetime
-from reap.api.base import ReapBase, parse_time, parse_short_time
+import urllib
+import threading
+from reap.api.base import ReapBase, LazyTime, parse_short_time
+from reap.api.budget import BUDGET_BY_TYPE
+from reap.api.fetch import fetch_all, DEFAULT_CONCURRENCY
+from reap.api.index import person_name
+from reap.api.trace import timed, timed_map
+
+# Entry queries spanning more days than this, about a quarter, are split
+# 	into monthly shards, or longer ones so there are at most MAX_SHARDS.
+# 	Shorter ones, like most reports, take a single request.
+SHARD_DAYS = 92
+MAX_SHARDS = 24
+
+# A shard this long past its last day is taken to be closed for edits, and
+# 	is cached for CLOSED_SHARD_TTL seconds. Harvest still allows late edits
+# 	and billing changes to closed entries, so they are refetched now and then.
+SHARD_CLOSED_AFTER = datetime.timedelta(days = 60)
+CLOSED_SHARD_TTL = 7 * 24 * 60 * 60
+
+def updated_since_param(updated_since):
+    '''Formats an updated_since datetime as an entries query parameter.'''
+    if not updated_since:
+        return ''
+    return '&updated_since=' + urllib.quote_plus(
+        updated_since.strftime('%Y-%m-%d %H:%M')
+    )
+
+def entries_path(owner, id, start, end, updated_since = None):
+    '''Builds the path listing the entries of a person or project.'''
+    url = str.format(
+        '{}/{}/entries?from={}&to={}',
+        owner,
+        id,
+        start.strftime('%Y%m%d'),
+        end.strftime('%Y%m%d'),
+    )
+    return url + updated_since_param(updated_since)
+
+def _month(index):
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+def shard_range(start, end, span = None):
+    '''Splits the days from start to end into calendar aligned shards.
+
+    span is the (first, last) days entries are expected on, like a project's
+    	record hints; it decides the shard size, and shards only break inside
+    	it. Returns a list of (start, end) pairs in date order.'''
+    first = datetime.datetime(start.year, start.month, start.day)
+    last = datetime.datetime(end.year, end.month, end.day)
+    if span and span[0] and span[1]:
+        first = max(first, span[0])
+        last = min(last, span[1])
+    days = (last - first).days
+    if days <= SHARD_DAYS:
+        return [(start, end)]
+    # never finer than a month, so no more shards than months in the range.
+    first_month = first.year * 12 + first.month - 1
+    last_month = last.year * 12 + last.month - 1
+    step = max(1, -(-(last_month - first_month) // (MAX_SHARDS - 1)))
+    boundaries = [
+        _month(month)
+        for month in xrange(first_month + step, last_month + 1, step)
+    ]
+    day = datetime.timedelta(days = 1)
+    starts = [start] + boundaries
+    ends = [boundary - day for boundary in boundaries] + [end]
+    return zip(starts, ends)
+
+def iter_entry_json(hv, owner, id, start, end, updated_since = None, span = None,
+	refresh = False):
+    '''Yields the day_entry JSON of a person or project from start to end.
+
+    A range long enough to be sharded is fetched shard by shard, up to
+    	hv.shard_concurrency at once, and yielded in date order. Shards of
+    	closed periods are cached for CLOSED_SHARD_TTL, unless refresh is set
+    	to fetch them again. Other ranges are streamed, in the order Harvest sends
+    	them.'''
+    if updated_since:
+        # only changes are fetched, which are few however long the range.
+        shards = [(start, end)]
+    else:
+        shards = shard_range(start, end, span)
+    closed = datetime.datetime.today() - SHARD_CLOSED_AFTER
+    if len(shards) == 1 and (updated_since or end >= closed):
+        path = entries_path(owner, id, start, end, updated_since)
+        for ej in hv.stream_request(path):
+            yield ej['day_entry']
+        return
+    def fetch(shard):
+        path = entries_path(owner, id, shard[0], shard[1])
+        if shard[1] < closed:
+            return hv.cached(path, lambda: hv.get_request(path), CLOSED_SHARD_TTL, refresh)
+        return hv.get_request(path)
+    # only a window of shards is held in memory at once.
+    window = max(1, hv.shard_concurrency)
+    for i in xrange(0, len(shards), window):
+        for response in fetch_all(fetch, shards[i:i + window], window):
+            day_entries = [ej['day_entry'] for ej in response or []]
+            day_entries.sort(key = lambda ej: ej['spent_at'])
+            for ej in day_entries:
+                yield ej
 
 class Harvest(ReapBase):
     '''Base class for accessing Harvest admin functions.'''
-    def __init__(self, base_uri, username, password):
+
+    # How many shards of a long entries query are fetched at once.
+    shard_concurrency = DEFAULT_CONCURRENCY
+
+    def __init__(self, base_uri, username, password, pool = None,
+    	cache = None, identity = None):
         '''Creates a new instance and logs the user in.
 
         This will send the user's username and password to Harvest and attempt
         	logging in. If the username and password given are invalid or are
-        	not an administrative account, a ValueError will be thrown.'''
-        self.base_uri = base_uri
-        self.username = username
-        self.password = password
-        login_response = self.get_request('account/who_am_i')
-        if not login_response:
-            raise ValueError('Unable to login with given info.')
-        if not login_response['user']['admin']:
+        	not an administrative account, a ValueError will be thrown.
+
+        Requests go through the given ConnectionPool, or the process wide
+        	default pool if none is given. People, projects, tasks and clients
+        	are kept in the given Cache, if any.
+
+        If an identity saved from an earlier who_am_i() is given, logging in
+        	is skipped and bad credentials raise a LoginError from the first
+        	request made instead.'''
+        ReapBase.__init__(self, base_uri, username, password, pool, cache)
+        self.__models = {}
+        self.__models_lock = threading.Lock()
+        self.identity = identity or self.who_am_i()
+        if not self.identity['admin']:
             raise ValueError('User is not an admin')
-        self.id = login_response['user']['id']
+        self.id = self.identity['id']
+
+    def model(self, cls, json):
+        '''Returns this session's one instance of cls for the given JSON.
+
+        The first time an id is seen a new instance is made. After that the
+        	same instance is updated from the newer JSON and returned, so every
+        	lookup of a person, project, client, task or task assignment sees
+        	the same object. Entries are too many to keep, so are not mapped.'''
+        key = (cls, json['id'])
+        with self.__models_lock:
+            instance = self.__models.get(key)
+            if instance is None:
+                instance = self.__models[key] = cls(self, json)
+            else:
+                instance.__init__(self, json)
+            return instance
 
     def people(self):
         '''Generates a list of all People.'''
-        people_response = self.get_request('people/')
-        return [Person(self, pjson['user']) for pjson in people_response]
+        people_response = self.cached('people/', lambda: self.get_request('people/'))
+        with timed('models'):
+            return [self.model(Person, pjson['user']) for pjson in people_response]
 
     def projects(self):
         '''Generates a list of all Projects.'''
-        projects_response = self.get_request('projects/')
-        return [Project(self, pjson['project']) for pjson in projects_response]
+        projects_response = self.cached('projects/', lambda: self.get_request('projects/'))
+        with timed('models'):
+            return [self.model(Project, pjson['project']) for pjson in projects_response]
 
     def tasks(self):
         '''Generates a list of all Tasks.'''
-        tasks_response = self.get_request('tasks/')
-        return [Task(self, tjson['task']) for tjson in tasks_response]
+        tasks_response = self.cached('tasks/', lambda: self.get_request('tasks/'))
+        with timed('models'):
+            return [self.model(Task, tjson['task']) for tjson in tasks_response]
 
     def clients(self):
         '''Generates a list of all Clients.'''
-        clients_response = self.get_request('clients/')
-        return [Client(self, cjson['client']) for cjson in clients_response]
+        clients_response = self.cached('clients/', lambda: self.get_request('clients/'))
+        with timed('models'):
+            return [self.model(Client, cjson['client']) for cjson in clients_response]
+
+    def people_index(self):
+        '''Returns an Index of all People, by id and full name.'''
+        return self.indexed('people/', self.people, person_name)
+
+    def projects_index(self):
+        '''Returns an Index of all Projects, by id and name.'''
+        return self.indexed('projects/', self.projects)
+
+    def clients_index(self):
+        '''Returns an Index of all Clients, by id and name.'''
+        return self.indexed('clients/', self.clients)
 
     def get_client(self, client_id):
         '''Gets a single client by id.'''
         client_response = self.get_request('clients/%s' % client_id)
-        return Client(self, client_response['client'])
+        return self.model(Client, client_response['client'])
 
     def get_client_by_name(self, name):
         '''Gets a single client by name.'''
-        cl = self.clients()
-        for client in cl:
+        for client in self.clients_index().named(name):
             if client.name == name:
                 return client
 
     def get_project(self, project_id):
         '''Gets a single project by id.'''
         project_response = self.get_request('projects/%s' % project_id)
-        return Project(self, project_response['project'])
+        return self.model(Project, project_response['project'])
 
     def create_person(self, first_name, last_name, email, department = None,
     	default_rate = None, admin = False, contractor = False):
@@ -85,8 +228,9 @@ class Harvest(ReapBase):
             'is_contractor': contractor,
         }}
         response = self.post_request('people/', person, follow = True)
+        self.invalidate('people/')
         if response:
-            return Person(self, response['user'])
+            return self.model(Person, response['user'])
 
     def create_project(self, name, client_id, budget = None, budget_by =
     	'none', notes = None, billable = True, code = None):
@@ -101,8 +245,10 @@ class Harvest(ReapBase):
             'code':code
         }}
         response = self.post_request('projects/', project, follow = True)
+        self.invalidate('projects/')
+        self.invalidate('daily/projects')
         if response:
-            return Project(self, response['project'])
+            return self.model(Project, response['project'])
 
     def create_client(self, name):
         '''Creates a Client with the given information.'''
@@ -110,11 +256,19 @@ class Harvest(ReapBase):
             'name': name,
         }}
         response = self.post_request('clients/', client, follow = True)
+        self.invalidate('clients/')
         if response:
-            return Client(self, response['client'])
+            return self.model(Client, response['client'])
 
-class Person:
+class Person(object):
     '''Represents a Person in the Harvest system.'''
+
+    __slots__ = (
+        'hv', 'id', 'email', 'first_name', 'last_name', 'all_future',
+        'default_rate', 'active', 'admin', 'contractor', 'telephone',
+        'department', 'timezone',
+    )
+
     def __init__(self, hv, json):
         self.hv = hv
         self.id = json['id']
@@ -133,26 +287,42 @@ class Person:
     def delete(self):
         '''Deletes the person immediately.'''
         response = self.hv.delete_request('people/' + str(self.id))
+        self.hv.invalidate('people/')
         return response
 
     def entries(self, start = datetime.datetime.today(), end =
-    	datetime.datetime.today()):
+    	datetime.datetime.today(), updated_since = None, refresh = False):
         '''Retrieves entries from all projects/tasks logged by this person.
 
-        Can be filtered based on time by specifying start/end datetimes.'''
-        fr = start.strftime('%Y%m%d')
-        to = end.strftime('%Y%m%d')
-        url = str.format(
-            'people/{}/entries?from={}&to={}',
-            str(self.id),
-            fr,
-            to,
+        Can be filtered based on time by specifying start/end datetimes, and
+        	to only entries changed after the updated_since UTC datetime.
+        	Long ranges are fetched in shards, see iter_entry_json.'''
+        return list(self.iter_entries(start, end, updated_since, refresh))
+
+    def iter_entries(self, start = datetime.datetime.today(), end =
+    	datetime.datetime.today(), updated_since = None, refresh = False):
+        '''Like entries, but yields each entry as it is read off the wire.'''
+        return timed_map(
+            'models',
+            lambda ej: Entry(self.hv, ej),
+            iter_entry_json(self.hv, 'people', self.id, start, end,
+            	updated_since, refresh = refresh),
         )
-        response = self.hv.get_request(url)
-        return [Entry(self.hv, ej['day_entry']) for ej in response]
 
-class Entry:
+class Entry(object):
     '''A timesheet entry.'''
+
+    # Reports load entries by the hundred thousand, so they carry no __dict__
+    # 	and only parse their timestamps when asked for them.
+    __slots__ = (
+        'id', 'hours', 'project_id', 'notes', 'task_id', 'user_id', 'billed',
+        'closed', '_updated', '_created', '_spent',
+    )
+
+    updated = LazyTime('_updated')
+    created = LazyTime('_created')
+    spent = LazyTime('_spent', parse_short_time)
+
     def __init__(self, hv, json):
         self.id = json['id']
         self.hours = float(json['hours'])
@@ -162,14 +332,25 @@ class Entry:
         self.user_id = json['user_id']
         self.billed = json['is_billed']
         self.closed = json['is_closed']
-        self.updated = parse_time(json['updated_at'])
-        self.created = parse_time(json['created_at'])
-        self.spent = parse_short_time(json['spent_at'])
+        self._updated = json['updated_at']
+        self._created = json['created_at']
+        self._spent = json['spent_at']
 
-class Project:
+class Project(object):
     '''A project in the Harvest system.'''
 
-    BUDGET_BY_TYPE = ['project', 'project_cost', 'task', 'person', 'none']
+    BUDGET_BY_TYPE = BUDGET_BY_TYPE
+
+    __slots__ = (
+        'hv', 'id', 'name', 'active', 'billable', 'bill_by', 'hourly_rate',
+        'client_id', 'code', 'notes', 'budget_by', 'budget', 'cost_budget',
+        '_latest_record', '_earliest_record', '_created', '_updated',
+    )
+
+    latest_record = LazyTime('_latest_record', parse_short_time)
+    earliest_record = LazyTime('_earliest_record', parse_short_time)
+    created = LazyTime('_created')
+    updated = LazyTime('_updated')
 
     def __init__(self, hv, json):
         self.hv = hv
@@ -185,34 +366,43 @@ class Project:
         self.budget_by = json['budget_by']
         self.budget = float(json['budget']) if json['budget'] else None
         self.cost_budget = float(json['cost_budget']) if json['cost_budget'] else None
-        self.latest_record = parse_short_time(json['hint_latest_record_at'])
-        self.earliest_record = parse_short_time(json['hint_earliest_record_at'])
-        self.created = parse_time(json['created_at'])
-        self.updated = parse_time(json['updated_at'])
+        self._latest_record = json['hint_latest_record_at']
+        self._earliest_record = json['hint_earliest_record_at']
+        self._created = json['created_at']
+        self._updated = json['updated_at']
 
     def delete(self):
         '''Immediately deletes the project.'''
         response = self.hv.delete_request('projects/' + str(self.id))
+        self.hv.invalidate('projects/')
+        self.hv.invalidate('daily/projects')
         return response
 
-    def entries(self, start = None, end = None):
+    def entries(self, start = None, end = None, updated_since = None, refresh = False):
         '''Retrieves entries from all people/tasks logged to this project.
 
-        Can be filtered based on time by specifying start/end datetimes.'''
+        Can be filtered based on time by specifying start/end datetimes, and
+        	to only entries changed after the updated_since UTC datetime.
+        	Long ranges are fetched in shards sized from the project's record
+        	hints, see iter_entry_json.'''
+        return list(self.iter_entries(start, end, updated_since, refresh))
+
+    def iter_entries(self, start = None, end = None, updated_since = None, refresh = False):
+        '''Like entries, but yields each entry as it is read off the wire.
+
+        Spanning the whole project by default, the response can be large;
+        	this keeps only one entry's JSON (or one window of shards) in
+        	memory at a time.'''
         if not start:
             start = self.earliest_record
         if not end:
             end = self.latest_record
-        fr = start.strftime('%Y%m%d')
-        to = end.strftime('%Y%m%d')
-        url = str.format(
-            'projects/{}/entries?from={}&to={}',
-            self.id,
-            fr,
-            to,
+        return timed_map(
+            'models',
+            lambda ej: Entry(self.hv, ej),
+            iter_entry_json(self.hv, 'projects', self.id, start, end,
+            	updated_since, (self.earliest_record, self.latest_record), refresh),
         )
-        response = self.hv.get_request(url)
-        return [Entry(self.hv, ej['day_entry']) for ej in response]
 
     def task_assignments(self):
         '''Retrieves all tasks currently assigned to this project.'''
@@ -221,16 +411,26 @@ class Project:
             self.id
         )
         response = self.hv.get_request(url)
-        return [TaskAssignment(self.hv, tj['task_assignment']) for tj in response]
+        return [self.hv.model(TaskAssignment, tj['task_assignment']) for tj in response]
 
-class Client:
+class Client(object):
     '''A client in the Harvest system.'''
+
+    __slots__ = (
+        'hv', 'name', 'id', '_created', '_updated', 'highrise_id',
+        'cache_version', 'currency', 'currency_symbol', 'active', 'details',
+        'invoice_timeframe', 'last_invoice_kind',
+    )
+
+    created = LazyTime('_created')
+    updated = LazyTime('_updated')
+
     def __init__(self, hv, json):
         self.hv = hv
         self.name = json['name'].encode('utf-8')
         self.id = json['id']
-        self.created = parse_time(json['created_at'])
-        self.updated = parse_time(json['updated_at'])
+        self._created = json['created_at']
+        self._updated = json['updated_at']
         self.highrise_id = json['highrise_id']
         self.cache_version = json['cache_version']
         self.currency = json['currency']
@@ -247,8 +447,17 @@ class Client:
             self.invoice_timeframe = None
         self.last_invoice_kind = json['last_invoice_kind']
 
-class Task:
+class Task(object):
     '''A Task in the Harvest system.'''
+
+    __slots__ = (
+        'default_billable', 'deactivated', 'default_hourly_rate', 'id', 'name',
+        'default', '_updated', '_created',
+    )
+
+    updated = LazyTime('_updated')
+    created = LazyTime('_created')
+
     def __init__(self, hv, json):
         self.default_billable = json['billable_by_default']
         self.deactivated = json['deactivated']
@@ -256,11 +465,20 @@ class Task:
         self.id = json['id']
         self.name = json['name']
         self.default = json['is_default']
-        self.updated = parse_time(json['updated_at'])
-        self.created = parse_time(json['created_at'])
+        self._updated = json['updated_at']
+        self._created = json['created_at']
 
-class TaskAssignment:
+class TaskAssignment(object):
     '''A Task assigned to a Project.'''
+
+    __slots__ = (
+        'billable', 'deactivated', 'hourly_rate', 'id', 'task_id',
+        'project_id', '_updated', '_created',
+    )
+
+    updated = LazyTime('_updated')
+    created = LazyTime('_created')
+
     def __init__(self, hv, json):
         self.billable = json['billable']
         self.deactivated = json['deactivated']
@@ -268,6 +486,6 @@ class TaskAssignment:
         self.id = json['id']
         self.task_id = json['task_id']
         self.project_id = json['project_id']
-        self.updated = parse_time(json['updated_at'])
-        self.created = parse_time(json['created_at'])
+        self._updated = json['updated_at']
+        self._created = json['created_at']
 
@@ -18,6 +18,10 @@ import string
 import datetime
 from reap.api.admin import *
 from reap.api.timesheet import Timesheet
+from reap.api.cache import Cache
+from reap.api.base_tests import FakeHarvestTest
+import shutil
+import tempfile
 
 def random_string(length = 5):
     return ''.join(random.choice(string.ascii_lowercase) for x in xrange(length))
@@ -317,6 +321,143 @@ class TestTasks(HarvestTest):
             self.assertIsNotNone(task.updated)
             self.assertIsNotNone(task.created)
 
+class TestIdentityMap(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.hv.limiter = None
+
+    def test_same_instance(self):
+        person = self.hv.people()[0]
+        self.hv.forget()
+        self.assertTrue(self.hv.people()[0] is person)
+        project = self.hv.projects()[0]
+        self.assertTrue(self.hv.get_project(project.id) is project)
+        self.assertTrue(
+            self.hv.get_client(project.client_id) is self.hv.clients()[0]
+        )
+
+    def test_updated(self):
+        client = self.hv.clients()[0]
+        self.fake.clients[0]['name'] = 'Initrode'
+        self.hv.forget()
+        self.assertTrue(self.hv.clients()[0] is client)
+        self.assertEqual(client.name, 'Initrode')
+
+    def test_indexes(self):
+        people = self.hv.people_index()
+        self.assertIs(self.hv.people_index(), people)
+        self.assertEqual(self.fake.count('GET /people'), 1)
+        self.assertEqual(len(people.named(self.fake.user['first_name'] + ' ' +
+        	self.fake.user['last_name'])), 1)
+        person = self.hv.create_person('Milton', 'Waddams', 'milton@example.com')
+        self.assertIs(self.hv.people_index().get(person.id), person)
+        self.hv.create_client('Initrode')
+        self.assertEqual(self.hv.get_client_by_name('Initrode').name, 'Initrode')
+        projects = self.hv.projects_index()
+        self.hv.invalidate('projects/')
+        self.assertIsNot(self.hv.projects_index(), projects)
+
+class TestShardRange(unittest.TestCase):
+    def assertContiguous(self, shards, start, end):
+        self.assertEqual(shards[0][0], start)
+        self.assertEqual(shards[-1][1], end)
+        for before, after in zip(shards, shards[1:]):
+            self.assertEqual(after[0] - before[1], datetime.timedelta(days = 1))
+
+    def test_short(self):
+        start = datetime.datetime(2013, 1, 1)
+        end = datetime.datetime(2013, 1, 31)
+        self.assertEqual(shard_range(start, end), [(start, end)])
+
+    def test_quarter(self):
+        start = datetime.datetime(2013, 1, 1)
+        # a quarter is still one request, however it falls.
+        for end in (datetime.datetime(2013, 2, 28), datetime.datetime(2013, 3, 31)):
+            self.assertEqual(shard_range(start, end), [(start, end)])
+        end = datetime.datetime(2013, 4, 30)
+        shards = shard_range(start, end)
+        self.assertContiguous(shards, start, end)
+        self.assertEqual(len(shards), 4)
+
+    def test_months(self):
+        start = datetime.datetime(2012, 11, 20)
+        end = datetime.datetime(2013, 6, 3)
+        shards = shard_range(start, end)
+        self.assertContiguous(shards, start, end)
+        self.assertEqual(len(shards), 8)
+        for shard in shards[1:]:
+            self.assertEqual(shard[0].day, 1)
+
+    def test_span(self):
+        start = datetime.datetime(2000, 1, 1)
+        end = datetime.datetime(2020, 1, 1)
+        # nothing outside the span, so it is left in the first and last shards.
+        span = (datetime.datetime(2013, 1, 1), datetime.datetime(2013, 12, 31))
+        shards = shard_range(start, end, span)
+        self.assertContiguous(shards, start, end)
+        self.assertEqual(len(shards), 12)
+        shards = shard_range(start, end)
+        self.assertContiguous(shards, start, end)
+        self.assertTrue(MAX_SHARDS / 2 < len(shards) <= MAX_SHARDS)
+
+class TestSharding(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        project = self.fake.projects[0]
+        task = self.fake.tasks[0]
+        for day in ('2013-01-15', '2013-03-01', '2013-02-10', '2013-05-31'):
+            self.fake.add_entry(self.fake.user, project, task, 1.0, spent_at = day)
+        self.path = tempfile.mkdtemp()
+        self.hv = Harvest(
+            self.fake.base_uri,
+            self.fake.username,
+            self.fake.password,
+            cache = Cache(self.path),
+        )
+        self.hv.limiter = None
+        self.project = self.hv.projects()[0]
+        self.fake.reset_counts()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        FakeHarvestTest.tearDown(self)
+
+    def test_merged_in_order(self):
+        entries = self.project.entries()
+        days = [e.spent for e in entries]
+        self.assertEqual(days, sorted(days))
+        self.assertEqual(len(entries), len(self.fake.entries))
+        self.assertEqual(
+            self.fake.count('GET /projects/.*/entries'),
+            len(shard_range(self.project.earliest_record, self.project.latest_record)),
+        )
+
+    def test_closed_cached(self):
+        self.project.entries()
+        shards = self.fake.count('GET /projects/.*/entries')
+        self.fake.reset_counts()
+        self.hv.forget()
+        self.assertEqual(len(self.project.entries()), len(self.fake.entries))
+        # only the shard running up to today is fetched again.
+        self.assertEqual(self.fake.count('GET /projects/.*/entries'), 1)
+        self.assertTrue(shards > 1)
+
+    def test_closed_expire(self):
+        import reap.api.admin
+        self.project.entries()
+        shards = self.fake.count('GET /projects/.*/entries')
+        self.fake.reset_counts()
+        self.hv.forget()
+        ttl = reap.api.admin.CLOSED_SHARD_TTL
+        reap.api.admin.CLOSED_SHARD_TTL = -1
+        try:
+            self.project.entries()
+        finally:
+            reap.api.admin.CLOSED_SHARD_TTL = ttl
+        # closed shards are fetched again once their TTL has passed.
+        self.assertEqual(self.fake.count('GET /projects/.*/entries'), shards)
+
 
 if __name__ == '__main__':
     unittest.main()
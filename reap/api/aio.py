@@ -0,0 +1,1213 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Non-blocking variants of Harvest and Timesheet, for serving many callers from one thread.
+
+Python 2 has no asyncio, so this module has a small event loop of its own,
+	driving non-blocking sockets with poll. AsyncHarvest and AsyncTimesheet
+	mirror Harvest and Timesheet, except that each call returns a Future
+	straight away and the loop has to run for it to finish:
+
+    loop = EventLoop()
+    hv = AsyncHarvest(base_uri, username, password, loop = loop)
+    loop.run_until_complete(hv.login())
+    people = loop.run_until_complete(hv.people())
+    entries = loop.run_until_complete(gather(hv.entries(p, start, end) for p in people))
+
+They build subclasses of the blocking API's models, whose methods that
+	make requests (Person.entries, Entry.start and the like) return
+	Futures too; iter_entries, which can not, raises TypeError. Everything
+	here belongs to the loop's thread; nothing is locked. Host names are still
+	looked up with the blocking getaddrinfo, once per host.'''
+
+import sys
+import ssl
+import json
+import time
+import zlib
+import errno
+import heapq
+import random
+import select
+import socket
+import datetime
+import urlparse
+import collections
+from reap.api.base import decompress, request_headers, retry_after, default_limiter, \
+	DEFAULT_RETRIES, DEFAULT_BACKOFF, MAX_BACKOFF, RESENDABLE_METHODS
+from reap.api.errors import ReapError, LoginError, TransportError, HTTPError, RateLimitError
+from reap.api.trace import Trace, tracing, emit_request
+from reap.api.admin import Person, Project, Client, Task, TaskAssignment, Entry, \
+	entries_path, shard_range, SHARD_CLOSED_AFTER, CLOSED_SHARD_TTL
+import reap.api.timesheet
+
+# How many connections are open to one host at once. Requests beyond that
+# 	wait for one to be free.
+DEFAULT_MAX_CONNECTIONS = 64
+
+# Bytes read from a socket at a time.
+READ_SIZE = 64 * 1024
+
+class Future(object):
+    '''The outcome of a call that may not have finished yet.
+
+    Callbacks run as soon as it finishes, on the loop's thread, and must not
+    	raise.'''
+    def __init__(self):
+        self.__done = False
+        self.__value = None
+        self.__error = None
+        self.__callbacks = []
+
+    def done(self):
+        return self.__done
+
+    def result(self):
+        '''Returns the value the call finished with, or raises its error.'''
+        if not self.__done:
+            raise ReapError('The call has not finished yet.')
+        if self.__error:
+            raise self.__error[0], self.__error[1], self.__error[2]
+        return self.__value
+
+    def exception(self):
+        '''Returns the error the call failed with, or None.'''
+        return self.__error[1] if self.__error else None
+
+    def exc_info(self):
+        '''Returns the sys.exc_info() of the call's error, or None.'''
+        return self.__error
+
+    def set_result(self, value):
+        self.__finish(value, None)
+
+    def set_exc_info(self, exc_info):
+        self.__finish(None, exc_info)
+
+    def set_exception(self, exception):
+        self.__finish(None, (type(exception), exception, None))
+
+    def __finish(self, value, error):
+        if self.__done:
+            return
+        self.__done = True
+        self.__value = value
+        self.__error = error
+        callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        if self.__done:
+            callback(self)
+        else:
+            self.__callbacks.append(callback)
+
+    def then(self, function):
+        '''Returns a Future of function(value), once this one succeeds.
+
+        function may return a Future itself, which is then waited on. Errors,
+        	from this call or raised by function, pass straight through.'''
+        chained = Future()
+        def done(future):
+            if future.exc_info():
+                chained.set_exc_info(future.exc_info())
+                return
+            try:
+                value = function(future.result())
+            except Exception:
+                chained.set_exc_info(sys.exc_info())
+                return
+            settle(chained, value)
+        self.add_done_callback(done)
+        return chained
+
+def settle(future, value):
+    '''Finishes future with value, or with value's outcome if it is a Future.'''
+    if not isinstance(value, Future):
+        future.set_result(value)
+        return
+    def done(inner):
+        if inner.exc_info():
+            future.set_exc_info(inner.exc_info())
+        else:
+            future.set_result(inner.result())
+    value.add_done_callback(done)
+
+def finished(value):
+    '''Returns a Future that has already finished with value.'''
+    future = Future()
+    future.set_result(value)
+    return future
+
+def gather(futures):
+    '''Returns a Future of a list of the given futures' values, in order.
+
+    Like fetch_all, it waits for all of them, then raises the error of the
+    	first that failed, if any did.'''
+    futures = list(futures)
+    gathered = Future()
+    remaining = [len(futures)]
+    def done(future):
+        remaining[0] -= 1
+        if remaining[0]:
+            return
+        for future in futures:
+            if future.exc_info():
+                gathered.set_exc_info(future.exc_info())
+                return
+        gathered.set_result([future.result() for future in futures])
+    if not futures:
+        gathered.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+    return gathered
+
+class _Timer(object):
+    __slots__ = ('when', 'callback', 'cancelled')
+
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        self.cancelled = True
+
+class EventLoop(object):
+    '''Runs callbacks when sockets are ready or timers are due, on one thread.'''
+    def __init__(self):
+        self.__poll = select.poll()
+        # fd -> [reader, writer] callbacks.
+        self.__handlers = {}
+        self.__timers = []
+        self.__ready = collections.deque()
+
+    def call_soon(self, callback):
+        self.__ready.append(callback)
+
+    def call_later(self, seconds, callback):
+        '''Calls callback after seconds, unless the returned timer is cancelled.'''
+        timer = _Timer(time.time() + seconds, callback)
+        heapq.heappush(self.__timers, timer)
+        return timer
+
+    def add_reader(self, fd, callback):
+        self.__watch(fd, 0, callback)
+
+    def remove_reader(self, fd):
+        self.__watch(fd, 0, None)
+
+    def add_writer(self, fd, callback):
+        self.__watch(fd, 1, callback)
+
+    def remove_writer(self, fd):
+        self.__watch(fd, 1, None)
+
+    def __watch(self, fd, which, callback):
+        handlers = self.__handlers.setdefault(fd, [None, None])
+        handlers[which] = callback
+        mask = (select.POLLIN if handlers[0] else 0) | (select.POLLOUT if handlers[1] else 0)
+        if mask:
+            self.__poll.register(fd, mask)
+            return
+        del self.__handlers[fd]
+        try:
+            self.__poll.unregister(fd)
+        except KeyError:
+            pass
+
+    def run_until_complete(self, future):
+        '''Runs the loop until future finishes, then returns its value.'''
+        while not future.done():
+            self.run_once()
+        return future.result()
+
+    def run_once(self):
+        '''Waits for the next socket or timer, then runs what is ready.'''
+        now = time.time()
+        while self.__timers and (self.__timers[0].cancelled or self.__timers[0].when <= now):
+            timer = heapq.heappop(self.__timers)
+            if not timer.cancelled:
+                self.__ready.append(timer.callback)
+        if self.__ready:
+            timeout = 0
+        elif self.__timers:
+            timeout = int((self.__timers[0].when - now) * 1000) + 1
+        elif self.__handlers:
+            timeout = None
+        else:
+            raise ReapError('Nothing is left for the event loop to wait on.')
+        try:
+            events = self.__poll.poll(timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            events = []
+        for fd, event in events:
+            handlers = self.__handlers.get(fd)
+            if not handlers:
+                continue
+            # errors wake both sides, which then find out what happened.
+            failed = event & (select.POLLERR | select.POLLHUP | select.POLLNVAL)
+            if handlers[0] and (event & select.POLLIN or failed):
+                self.__ready.append(handlers[0])
+            if handlers[1] and (event & select.POLLOUT or failed):
+                self.__ready.append(handlers[1])
+        for i in xrange(len(self.__ready)):
+            self.__ready.popleft()()
+
+class ProtocolError(Exception):
+    '''A response that is not valid HTTP.'''
+    pass
+
+class Response(object):
+    '''A parsed HTTP response, with its whole body.'''
+    def __init__(self, method):
+        self.method = method
+        self.status = None
+        self.reason = None
+        self.version = None
+        self.headers = {}
+        self.body = ''
+        self.keep_alive = False
+        # bytes of the response read, headers and all.
+        self.received = 0
+        self.__buffer = ''
+        self.__parts = []
+        # None while reading headers, then 'length', 'chunked', 'close' or 'done'.
+        self.__mode = None
+        self.__remaining = 0
+        self.__chunk = None
+
+    def getheader(self, name, default = None):
+        return self.headers.get(name.lower(), default)
+
+    def feed(self, data):
+        '''Parses more of the response, returning True once it is complete.'''
+        self.received += len(data)
+        self.__buffer += data
+        if self.__mode is None and not self.__head():
+            return False
+        if self.__mode == 'length':
+            take = self.__buffer[:self.__remaining]
+            self.__buffer = self.__buffer[len(take):]
+            self.__parts.append(take)
+            self.__remaining -= len(take)
+            if not self.__remaining:
+                self.__finish()
+        elif self.__mode == 'chunked':
+            self.__chunks()
+        elif self.__mode == 'close':
+            self.__parts.append(self.__buffer)
+            self.__buffer = ''
+        return self.__mode == 'done'
+
+    def feed_eof(self):
+        '''Handles the connection closing, returning True if that ends the response.'''
+        if self.__mode == 'close':
+            self.__finish()
+            return True
+        return self.__mode == 'done'
+
+    def __head(self):
+        end = self.__buffer.find('\r\n\r\n')
+        if end < 0:
+            return False
+        lines = self.__buffer[:end].split('\r\n')
+        self.__buffer = self.__buffer[end + 4:]
+        try:
+            self.version, status, self.reason = (lines[0].split(' ', 2) + [''])[:3]
+            self.status = int(status)
+        except ValueError:
+            raise ProtocolError('Bad status line: ' + repr(lines[0]))
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        connection = self.getheader('Connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            self.keep_alive = connection != 'close'
+        else:
+            self.keep_alive = connection == 'keep-alive'
+        if self.method == 'HEAD' or self.status in (204, 304) or self.status < 200:
+            self.__finish()
+        elif 'chunked' in self.getheader('Transfer-Encoding', '').lower():
+            self.__mode = 'chunked'
+        elif self.getheader('Content-Length') is not None:
+            try:
+                self.__remaining = int(self.getheader('Content-Length'))
+            except ValueError:
+                raise ProtocolError('Bad Content-Length')
+            self.__mode = 'length'
+            if not self.__remaining:
+                self.__finish()
+        else:
+            self.__mode = 'close'
+            self.keep_alive = False
+        return True
+
+    def __chunks(self):
+        while True:
+            if self.__chunk is None:
+                end = self.__buffer.find('\r\n')
+                if end < 0:
+                    return
+                try:
+                    self.__chunk = int(self.__buffer[:end].split(';')[0], 16)
+                except ValueError:
+                    raise ProtocolError('Bad chunk size')
+                self.__buffer = self.__buffer[end + 2:]
+            if self.__chunk == 0:
+                # skip the trailers, ended by an empty line.
+                end = self.__buffer.find('\r\n')
+                if end < 0:
+                    return
+                self.__buffer = self.__buffer[end + 2:]
+                if end == 0:
+                    self.__finish()
+                    return
+                continue
+            if len(self.__buffer) < self.__chunk + 2:
+                return
+            self.__parts.append(self.__buffer[:self.__chunk])
+            self.__buffer = self.__buffer[self.__chunk + 2:]
+            self.__chunk = None
+
+    def __finish(self):
+        self.__mode = 'done'
+        self.body = ''.join(self.__parts)
+        self.__parts = []
+        if self.__buffer:
+            # more than was asked for; the connection can not be trusted.
+            self.keep_alive = False
+
+class _Request(object):
+    __slots__ = ('method', 'host', 'path', 'body', 'headers', 'future', 'retried')
+
+    def __init__(self, method, host, path, body, headers):
+        self.method = method
+        self.host = host
+        self.path = path
+        self.body = body
+        self.headers = headers
+        self.future = Future()
+        self.retried = False
+
+    def serialize(self):
+        lines = [str.format('{} {} HTTP/1.1', self.method, self.path), 'Host: ' + self.host]
+        headers = dict(self.headers)
+        headers['Content-Length'] = str(len(self.body or ''))
+        for name, value in sorted(headers.items()):
+            lines.append(str.format('{}: {}', name, value))
+        return '\r\n'.join(lines) + '\r\n\r\n' + (self.body or '')
+
+class _Connection(object):
+    '''One keep-alive connection, carrying one request at a time.'''
+    def __init__(self, client, key):
+        self.client = client
+        self.loop = client.loop
+        self.key = key
+        self.sock = None
+        self.fd = None
+        # connected, and done with any TLS handshake.
+        self.ready = False
+        self.request = None
+        self.response = None
+        self.requests = 0
+        self.__out = ''
+        # whether any of the request has been written.
+        self.__sent = False
+        self.__timer = None
+
+    def send(self, request):
+        self.request = request
+        self.response = Response(request.method)
+        self.__out = request.serialize()
+        self.__sent = False
+        if self.client.timeout:
+            self.__timer = self.loop.call_later(self.client.timeout, self.__timed_out)
+        if self.ready:
+            self.__writing()
+        else:
+            self.__connect()
+
+    def __connect(self):
+        scheme, host = self.key
+        try:
+            family, socktype, proto, _, address = self.client.resolve(scheme, host)
+            self.sock = socket.socket(family, socktype, proto)
+            self.sock.setblocking(0)
+            self.fd = self.sock.fileno()
+            code = self.sock.connect_ex(address)
+            if code not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                raise socket.error(code, errno.errorcode.get(code, str(code)))
+        except socket.error:
+            self.__fail(sys.exc_info())
+            return
+        self.loop.add_writer(self.fd, self.__connected)
+
+    def __connected(self):
+        if self.request is None:
+            return
+        self.loop.remove_writer(self.fd)
+        code = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if code:
+            try:
+                raise socket.error(code, errno.errorcode.get(code, str(code)))
+            except socket.error:
+                self.__fail(sys.exc_info())
+            return
+        if self.key[0] == 'https':
+            try:
+                self.sock = self.client.ssl_context().wrap_socket(
+                    self.sock,
+                    server_hostname = urlparse.urlsplit('//' + self.key[1]).hostname,
+                    do_handshake_on_connect = False,
+                )
+            except (ssl.SSLError, socket.error):
+                self.__fail(sys.exc_info())
+                return
+            self.__handshake()
+        else:
+            self.ready = True
+            self.__writing()
+
+    def __handshake(self):
+        if self.request is None:
+            return
+        try:
+            self.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self.loop.remove_writer(self.fd)
+            self.loop.add_reader(self.fd, self.__handshake)
+            return
+        except ssl.SSLWantWriteError:
+            self.loop.remove_reader(self.fd)
+            self.loop.add_writer(self.fd, self.__handshake)
+            return
+        except (ssl.SSLError, socket.error):
+            self.__fail(sys.exc_info())
+            return
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.ready = True
+        self.__writing()
+
+    def __writing(self):
+        self.loop.remove_reader(self.fd)
+        self.loop.add_writer(self.fd, self.__writable)
+
+    def __writable(self):
+        if self.request is None:
+            return
+        try:
+            while self.__out:
+                sent = self.sock.send(self.__out[:READ_SIZE])
+                self.__out = self.__out[sent:]
+                self.__sent = self.__sent or sent > 0
+        except (ssl.SSLWantWriteError, ssl.SSLWantReadError):
+            return
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self.__fail(sys.exc_info())
+            return
+        self.loop.remove_writer(self.fd)
+        self.loop.add_reader(self.fd, self.__readable)
+
+    def __readable(self):
+        if self.request is None:
+            return
+        while True:
+            try:
+                data = self.sock.recv(READ_SIZE)
+            except ssl.SSLWantReadError:
+                return
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                self.__fail(sys.exc_info())
+                return
+            try:
+                if not data:
+                    if self.response.feed_eof():
+                        self.response.keep_alive = False
+                        self.__done()
+                    else:
+                        raise ProtocolError('Connection closed before the response ended')
+                    return
+                if self.response.feed(data):
+                    self.__done()
+                    return
+            except ProtocolError:
+                self.__fail(sys.exc_info())
+                return
+
+    def __done(self):
+        request, response = self.request, self.response
+        self.__stop()
+        self.requests += 1
+        if response.keep_alive:
+            # an idle connection is closed if the server closes its end.
+            self.loop.add_reader(self.fd, self.__idle_readable)
+        else:
+            self.close()
+        self.client._release(self, response.keep_alive)
+        request.future.set_result(response)
+
+    def __idle_readable(self):
+        if self.request is None:
+            self.client._discard(self)
+
+    def __timed_out(self):
+        self.__timer = None
+        try:
+            raise socket.timeout('timed out')
+        except socket.timeout:
+            self.__fail(sys.exc_info())
+
+    def __fail(self, exc_info):
+        request, response = self.request, self.response
+        self.__stop()
+        self.close()
+        # a kept-alive connection the server closed meanwhile gets one retry,
+        # 	when nothing of the response had arrived. A write is only retried
+        # 	if none of it was sent, as it may have been carried out otherwise.
+        retry = self.requests and not request.retried and not response.received \
+        	and (request.method in RESENDABLE_METHODS or not self.__sent)
+        self.client._failed(self, request, exc_info, retry)
+
+    def __stop(self):
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+        self.request = None
+        self.response = None
+
+    def close(self):
+        if self.sock is None:
+            return
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        self.sock = None
+        self.ready = False
+
+class HTTPClient(object):
+    '''Makes HTTP requests on an EventLoop, over keep-alive connections.
+
+    At most max_connections are open to a host at once. A request that
+    	takes longer than timeout seconds, if given, fails with socket.timeout.'''
+    def __init__(self, loop, max_connections = DEFAULT_MAX_CONNECTIONS, timeout = None):
+        self.loop = loop
+        self.max_connections = max_connections
+        self.timeout = timeout
+        # How many connections were opened, for telling whether they are reused.
+        self.opened = 0
+        self.__open = {}
+        self.__idle = {}
+        self.__waiting = {}
+        self.__addresses = {}
+        self.__ssl_context = None
+
+    def resolve(self, scheme, host):
+        '''Returns the first getaddrinfo result for a host, looked up once.'''
+        key = (scheme, host)
+        if key not in self.__addresses:
+            parts = urlparse.urlsplit(scheme + '://' + host)
+            port = parts.port or (443 if scheme == 'https' else 80)
+            self.__addresses[key] = socket.getaddrinfo(
+                parts.hostname, port, 0, socket.SOCK_STREAM,
+            )[0]
+        return self.__addresses[key]
+
+    def ssl_context(self):
+        if self.__ssl_context is None:
+            self.__ssl_context = ssl.create_default_context()
+        return self.__ssl_context
+
+    def request(self, method, uri, body = None, headers = None):
+        '''Returns a Future of the Response to a request.
+
+        Connection failures set the Future's error to a socket.error, or
+        	ProtocolError for a response that makes no sense.'''
+        parts = urlparse.urlsplit(uri)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        key = (parts.scheme, parts.netloc)
+        request = _Request(method, parts.netloc, path, body, headers or {})
+        self.__waiting.setdefault(key, collections.deque()).append(request)
+        self.__dispatch(key)
+        return request.future
+
+    def __dispatch(self, key):
+        waiting = self.__waiting.get(key)
+        while waiting:
+            idle = self.__idle.get(key)
+            if idle:
+                conn = idle.pop()
+                self.loop.remove_reader(conn.fd)
+            elif self.__open.get(key, 0) < max(1, self.max_connections):
+                conn = _Connection(self, key)
+                self.__open[key] = self.__open.get(key, 0) + 1
+                self.opened += 1
+            else:
+                return
+            conn.send(waiting.popleft())
+
+    def _release(self, conn, reusable):
+        if reusable:
+            self.__idle.setdefault(conn.key, []).append(conn)
+        else:
+            self.__open[conn.key] -= 1
+        self.__dispatch(conn.key)
+
+    def _discard(self, conn):
+        idle = self.__idle.get(conn.key, [])
+        if conn in idle:
+            idle.remove(conn)
+            conn.close()
+            self.__open[conn.key] -= 1
+            self.__dispatch(conn.key)
+
+    def _failed(self, conn, request, exc_info, retry):
+        self.__open[conn.key] -= 1
+        if retry:
+            request.retried = True
+            self.__waiting.setdefault(conn.key, collections.deque()).appendleft(request)
+        self.__dispatch(conn.key)
+        if not retry:
+            request.future.set_exc_info(exc_info)
+
+    def close(self):
+        '''Closes the idle connections.'''
+        for key, idle in self.__idle.items():
+            for conn in idle:
+                conn.close()
+                self.__open[key] -= 1
+        self.__idle = {}
+
+class AsyncBase(object):
+    '''What AsyncHarvest and AsyncTimesheet share, like ReapBase for the blocking API.
+
+    Requests are retried and limited as ReapBase does, sharing the process
+    	wide TokenBucket for the account, and identical GETs in progress
+    	share one response. There is no coalescing of finished GETs or
+    	revalidating of cached ones.'''
+    retries = DEFAULT_RETRIES
+    backoff = DEFAULT_BACKOFF
+    # Ask Harvest to compress responses.
+    compress = True
+
+    def __init__(self, base_uri, username, password, loop = None, cache = None,
+    	max_connections = DEFAULT_MAX_CONNECTIONS, timeout = None):
+        self.base_uri = base_uri
+        self.username = username
+        # Either the password, or a function returning it that is called
+        # 	before the first request.
+        self.password = password
+        self.loop = loop or EventLoop()
+        self.http = HTTPClient(self.loop, max_connections, timeout)
+        self.cache = cache
+        # Set to another TokenBucket, or None to not limit at all.
+        self.limiter = default_limiter(base_uri)
+        # How many GETs were answered by another identical one, and how many
+        # 	bytes of response bodies Harvest sent.
+        self.coalesced = 0
+        self.received = 0
+        self.__flights = {}
+
+    def close(self):
+        self.http.close()
+
+    def who_am_i(self):
+        '''Returns a Future of the user's identity, as ReapBase.who_am_i.'''
+        def identity(login_response):
+            if not login_response:
+                raise LoginError('Unable to login with given info.', self.base_uri, self.username)
+            return {
+                'id': login_response['user']['id'],
+                'admin': login_response['user']['admin'],
+            }
+        return self.get_request('account/who_am_i').then(identity)
+
+    def cached(self, key, fetch, ttl = None):
+        '''Returns a Future of the cached value for key, calling fetch for a Future to fill it.'''
+        if not self.cache:
+            return fetch()
+        account = self.base_uri + ' ' + self.username
+        value = self.cache.get(account, key, ttl)
+        if value is not None:
+            if tracing():
+                emit_request(Trace('GET', key, cache = 'hit'))
+            return finished(value)
+        def keep(value):
+            self.cache.set(account, key, value, ttl)
+            return value
+        return fetch().then(keep)
+
+    def invalidate(self, key):
+        if self.cache:
+            self.cache.invalidate(self.base_uri + ' ' + self.username, key)
+
+    def __delay(self, attempt):
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    def request(self, method, path, data = None):
+        '''Returns a Future of a request's Response, with its body decompressed.
+
+        Retries like ReapBase: throttling for every method, honoring
+        	Retry-After, and connection failures for GET and DELETE. Fails with
+        	LoginError, HTTPError, RateLimitError or TransportError.'''
+        future = Future()
+        uri = self.base_uri + path
+        if urlparse.urlsplit(uri).scheme not in ('http', 'https'):
+            future.set_exception(TransportError('Invalid base URI: ' + self.base_uri))
+            return future
+        body = json.dumps(data) if data is not None else None
+        self.__attempt(future, method, path, uri, body, 0)
+        return future
+
+    def __attempt(self, future, method, path, uri, body, attempt):
+        wait = self.limiter.reserve() if self.limiter else 0
+        if wait > 0:
+            self.loop.call_later(wait, lambda: self.__send(future, method, path, uri, body, attempt))
+        else:
+            self.__send(future, method, path, uri, body, attempt)
+
+    def __send(self, future, method, path, uri, body, attempt):
+        try:
+            if callable(self.password):
+                self.password = self.password()
+            headers = request_headers(self.username, self.password, self.compress)
+        except Exception:
+            future.set_exc_info(sys.exc_info())
+            return
+        started = time.time()
+        retry = lambda: self.__attempt(future, method, path, uri, body, attempt + 1)
+        def done(sent):
+            trace = Trace(method, path, started) if tracing() else None
+            if trace:
+                trace.total = time.time() - started
+                trace.attempt = attempt
+            if sent.exc_info():
+                error = sent.exception()
+                if trace:
+                    trace.error = str(error)
+                    emit_request(trace)
+                if attempt < self.retries and method in ('GET', 'DELETE'):
+                    self.loop.call_later(self.__delay(attempt), retry)
+                    return
+                future.set_exception(TransportError(str.format('{} {}: {}', method, path, error)))
+                return
+            response = sent.result()
+            self.received += len(response.body)
+            if trace:
+                trace.status = response.status
+                trace.bytes = len(response.body)
+                emit_request(trace)
+            if response.status in (429, 503):
+                delay = retry_after(response.getheader('Retry-After'))
+                if attempt < self.retries:
+                    delay = delay if delay is not None else self.__delay(attempt)
+                    if self.limiter:
+                        # everyone using the account waits, not just this request.
+                        self.limiter.defer(delay)
+                        retry()
+                    else:
+                        self.loop.call_later(delay, retry)
+                    return
+                future.set_exception(RateLimitError(response.status, method, path, delay))
+                return
+            if response.status == 401:
+                future.set_exception(LoginError('Unable to login with given info.',
+                	self.base_uri, self.username))
+                return
+            if response.status >= 400:
+                future.set_exception(HTTPError(response.status, method, path))
+                return
+            encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+            try:
+                response.body = decompress(encoding, response.body)
+            except zlib.error:
+                future.set_exception(ReapError('Invalid compressed response to ' + path))
+                return
+            future.set_result(response)
+        self.http.request(method, uri, body, headers).add_done_callback(done)
+
+    def __decode(self, path, content):
+        if not content.strip():
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            raise ReapError('Invalid JSON in response to ' + path)
+
+    def get_request(self, path, safe = True):
+        '''Returns a Future of a decoded resource.
+
+        A GET identical to one in progress shares its Future, so the value
+        	must not be changed. Pass safe = False for Harvest's GETs that
+        	change things, which are never shared.'''
+        if not safe:
+            return self.request('GET', path).then(lambda response: self.__decode(path, response.body))
+        flight = self.__flights.get(path)
+        if flight:
+            self.coalesced += 1
+            if tracing():
+                emit_request(Trace('GET', path, cache = 'shared'))
+            return flight
+        flight = self.request('GET', path).then(lambda response: self.__decode(path, response.body))
+        self.__flights[path] = flight
+        flight.add_done_callback(lambda done: self.__flights.pop(path, None))
+        return flight
+
+    def post_request(self, path, data, follow = False):
+        '''Returns a Future of the decoded response to a POST.
+
+        With follow, a 201 without a body is followed to the Location created.'''
+        def decode(response):
+            if response.status == 201 and follow and not response.body.strip():
+                location = urlparse.urlsplit(response.getheader('Location'))
+                created = location.path[1:]
+                if location.query:
+                    created += '?' + location.query
+                return self.get_request(created)
+            return self.__decode(path, response.body)
+        return self.request('POST', path, data).then(decode)
+
+    def delete_request(self, path):
+        return self.request('DELETE', path).then(lambda response: True)
+
+class AsyncPerson(Person):
+    '''A Person from AsyncHarvest, whose methods return Futures.'''
+    __slots__ = ()
+
+    def delete(self):
+        '''Returns a Future of deleting the person.'''
+        def deleted(response):
+            self.hv.invalidate('people/')
+            return response
+        return self.hv.delete_request('people/' + str(self.id)).then(deleted)
+
+    def entries(self, start = None, end = None, updated_since = None):
+        '''Returns a Future of the person's entries, as AsyncHarvest.entries.'''
+        return self.hv.entries(self, start, end, updated_since)
+
+    def iter_entries(self, *args, **kwargs):
+        raise TypeError('Entries can not be iterated without blocking; use entries()')
+
+class AsyncProject(Project):
+    '''A Project from AsyncHarvest, whose methods return Futures.'''
+    __slots__ = ()
+
+    def delete(self):
+        '''Returns a Future of deleting the project.'''
+        def deleted(response):
+            self.hv.invalidate('projects/')
+            self.hv.invalidate('daily/projects')
+            return response
+        return self.hv.delete_request('projects/' + str(self.id)).then(deleted)
+
+    def entries(self, start = None, end = None, updated_since = None):
+        '''Returns a Future of the project's entries, as AsyncHarvest.entries.'''
+        return self.hv.entries(self, start, end, updated_since)
+
+    def iter_entries(self, *args, **kwargs):
+        raise TypeError('Entries can not be iterated without blocking; use entries()')
+
+    def task_assignments(self):
+        '''Returns a Future of the tasks assigned to the project.'''
+        return self.hv.task_assignments(self)
+
+class AsyncEntry(reap.api.timesheet.Entry):
+    '''A timesheet Entry from AsyncTimesheet, whose methods return Futures.
+
+    Each leaves this entry as it was and gives the changed one instead.'''
+    __slots__ = ()
+
+    def delete(self):
+        return self.ts.delete(self)
+
+    def update(self, notes = None, hours = None, project_id = None, task_id = None):
+        return self.ts.update(self, notes, hours, project_id, task_id)
+
+    def start(self):
+        return self.ts.start(self)
+
+    def stop(self):
+        return self.ts.stop(self)
+
+class AsyncHarvest(AsyncBase):
+    '''Harvest's admin functions, without blocking.
+
+    Each method returns a Future of what the same Harvest method returns,
+    	with people and projects as AsyncPerson and AsyncProject. Logging in can not wait in the constructor, so either pass an
+    	identity saved from an earlier who_am_i(), or wait on login() first.'''
+    def __init__(self, base_uri, username, password, loop = None, cache = None,
+    	identity = None, max_connections = DEFAULT_MAX_CONNECTIONS, timeout = None):
+        AsyncBase.__init__(self, base_uri, username, password, loop, cache,
+        	max_connections, timeout)
+        self.__models = {}
+        self.identity = identity
+        self.id = identity['id'] if identity else None
+
+    def login(self):
+        '''Returns a Future of the user's identity, failing with ValueError for non-admins.'''
+        def check(identity):
+            if not identity['admin']:
+                raise ValueError('User is not an admin')
+            self.identity = identity
+            self.id = identity['id']
+            return identity
+        return self.who_am_i().then(check)
+
+    def model(self, cls, json):
+        '''Returns this session's one instance of cls for the given JSON, as Harvest.model.'''
+        key = (cls, json['id'])
+        instance = self.__models.get(key)
+        if instance is None:
+            instance = self.__models[key] = cls(self, json)
+        else:
+            instance.__init__(self, json)
+        return instance
+
+    def __list(self, path, cls, name):
+        return self.cached(path, lambda: self.get_request(path)).then(
+            lambda response: [self.model(cls, json[name]) for json in response]
+        )
+
+    def people(self):
+        return self.__list('people/', AsyncPerson, 'user')
+
+    def projects(self):
+        return self.__list('projects/', AsyncProject, 'project')
+
+    def tasks(self):
+        return self.__list('tasks/', Task, 'task')
+
+    def clients(self):
+        return self.__list('clients/', Client, 'client')
+
+    def get_client(self, client_id):
+        return self.get_request('clients/%s' % client_id).then(
+            lambda response: self.model(Client, response['client'])
+        )
+
+    def get_project(self, project_id):
+        return self.get_request('projects/%s' % project_id).then(
+            lambda response: self.model(AsyncProject, response['project'])
+        )
+
+    def __create(self, path, data, cls, name, invalidate):
+        def created(response):
+            for key in invalidate:
+                self.invalidate(key)
+            if response:
+                return self.model(cls, response[name])
+        return self.post_request(path, data, follow = True).then(created)
+
+    def create_person(self, first_name, last_name, email, department = None,
+    	default_rate = None, admin = False, contractor = False):
+        person = {'user':{
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': email,
+            'department': department,
+            'default_hourly_rate': default_rate,
+            'is_admin': admin,
+            'is_contractor': contractor,
+        }}
+        return self.__create('people/', person, AsyncPerson, 'user', ['people/'])
+
+    def create_project(self, name, client_id, budget = None, budget_by =
+    	'none', notes = None, billable = True, code = None):
+        project = {'project':{
+            'name': name,
+            'client_id': client_id,
+            'budget_by': budget_by,
+            'budget': budget,
+            'notes': notes,
+            'billable': billable,
+            'code':code
+        }}
+        return self.__create('projects/', project, AsyncProject, 'project',
+        	['projects/', 'daily/projects'])
+
+    def create_client(self, name):
+        client = {'client':{
+            'name': name,
+        }}
+        return self.__create('clients/', client, Client, 'client', ['clients/'])
+
+    def entries(self, owner, start = None, end = None, updated_since = None):
+        '''Returns a Future of a Person's or Project's entries from start to end.
+
+        The defaults are those of Person.entries and Project.entries. Every
+        	shard of a long range is fetched at once, and shards of closed
+        	periods are cached, as iter_entry_json does.'''
+        if isinstance(owner, Project):
+            kind = 'projects'
+            span = (owner.earliest_record, owner.latest_record)
+            start = start or owner.earliest_record
+            end = end or owner.latest_record
+        else:
+            kind = 'people'
+            span = None
+            start = start or datetime.datetime.today()
+            end = end or datetime.datetime.today()
+        shards = [(start, end)] if updated_since else shard_range(start, end, span)
+        closed = datetime.datetime.today() - SHARD_CLOSED_AFTER
+        def fetch(shard):
+            path = entries_path(kind, owner.id, shard[0], shard[1], updated_since)
+            if shard[1] < closed and not updated_since:
+                return self.cached(path, lambda: self.get_request(path), CLOSED_SHARD_TTL)
+            return self.get_request(path)
+        def build(responses):
+            entries = []
+            for response in responses:
+                day_entries = [ej['day_entry'] for ej in response or []]
+                if len(shards) > 1:
+                    day_entries.sort(key = lambda ej: ej['spent_at'])
+                entries.extend(Entry(self, ej) for ej in day_entries)
+            return entries
+        return gather(fetch(shard) for shard in shards).then(build)
+
+    def task_assignments(self, project):
+        '''Returns a Future of the tasks assigned to a Project.'''
+        path = str.format('projects/{}/task_assignments', project.id)
+        return self.get_request(path).then(
+            lambda response: [self.model(TaskAssignment, tj['task_assignment']) for tj in response]
+        )
+
+class AsyncTimesheet(AsyncBase):
+    '''A user's timesheet, without blocking.
+
+    Methods return Futures of what the same Timesheet methods return, with
+    	entries as AsyncEntry. The Entry methods that make requests are
+    	methods here too, taking the entry. Every write drops the daily snapshot, to be fetched again when next
+    	needed. There is no offline journal. As with AsyncHarvest, pass a
+    	saved identity or wait on login() first.'''
+    def __init__(self, base_uri, username, password, loop = None, cache = None,
+    	identity = None, max_connections = DEFAULT_MAX_CONNECTIONS, timeout = None):
+        AsyncBase.__init__(self, base_uri, username, password, loop, cache,
+        	max_connections, timeout)
+        self.identity = identity
+        self.id = identity['id'] if identity else None
+        self.__daily = None
+
+    def login(self):
+        def keep(identity):
+            self.identity = identity
+            self.id = identity['id']
+            return identity
+        return self.who_am_i().then(keep)
+
+    def daily(self):
+        if self.__daily is None:
+            self.__daily = self.get_request('daily')
+            def dropped(future):
+                # a failed fetch is tried again next time.
+                if future.exc_info() and self.__daily is future:
+                    self.__daily = None
+            self.__daily.add_done_callback(dropped)
+        return self.__daily
+
+    def refresh(self):
+        self.__daily = None
+
+    def projects(self):
+        return self.cached('daily/projects', lambda: self.daily().then(
+            lambda daily: daily['projects']
+        )).then(lambda response: [reap.api.timesheet.Project(pjson) for pjson in response])
+
+    def entries(self):
+        return self.daily().then(lambda daily: [
+            AsyncEntry(self, ejson) for ejson in daily['day_entries']
+        ])
+
+    def __wrote(self, future):
+        # neither the snapshot from before the write, nor one fetched while
+        # 	it was being made, can be trusted to show it.
+        self.refresh()
+        future.add_done_callback(lambda done: self.refresh())
+        return future
+
+    def __entry(self, response):
+        return AsyncEntry(self, response) if response else None
+
+    def create_entry(self, project_id, task_id, hours = 0, notes = '',
+    	spent_at = None):
+        '''Creates an entry, for today unless spent_at gives a YYYY-MM-DD day.'''
+        entry = {
+            'project_id': project_id,
+            'task_id': task_id,
+            'hours': hours,
+            'notes': notes,
+        }
+        if spent_at:
+            entry['spent_at'] = spent_at
+        return self.__wrote(self.post_request('daily/add', entry).then(self.__entry))
+
+    def show_entry(self, entry_id):
+        return self.get_request('daily/show/' + str(entry_id)).then(self.__entry)
+
+    def __toggle(self, entry, started):
+        if entry.started == started:
+            return finished(entry)
+        def toggled(response):
+            if response and response.has_key('hours'):
+                return self.__entry(entry.toggled(response))
+            return self.show_entry(entry.id)
+        path = 'daily/timer/' + str(entry.id)
+        return self.__wrote(self.get_request(path, safe = False).then(toggled))
+
+    def start(self, entry):
+        '''Returns a Future of the entry, with its timer started.'''
+        return self.__toggle(entry, True)
+
+    def stop(self, entry):
+        '''Returns a Future of the entry, with its timer stopped.'''
+        return self.__toggle(entry, False)
+
+    def update(self, entry, notes = None, hours = None, project_id = None, task_id = None):
+        '''Returns a Future of the entry with the given changes made.'''
+        changes = {}
+        if notes:
+            changes['notes'] = notes
+        if hours:
+            changes['hours'] = hours
+        if project_id:
+            changes['project_id'] = project_id
+        if task_id:
+            changes['task_id'] = task_id
+        if not changes:
+            return finished(entry)
+        def updated(response):
+            if response and response.has_key('id'):
+                return self.__entry(response)
+            return self.show_entry(entry.id)
+        path = 'daily/update/' + str(entry.id)
+        return self.__wrote(self.post_request(path, changes).then(updated))
+
+    def delete(self, entry):
+        path = 'daily/delete/' + str(entry.id)
+        return self.__wrote(self.get_request(path, safe = False).then(lambda response: None))
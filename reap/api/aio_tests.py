@@ -0,0 +1,247 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import time
+import socket
+import datetime
+from reap.api.aio import *
+from reap.api.admin import Harvest
+from reap.api.timesheet import Timesheet
+from reap.api.errors import ReapError, LoginError, HTTPError, TransportError
+from reap.api.base_tests import FakeHarvestTest
+
+class TestEventLoop(unittest.TestCase):
+    def test_timers(self):
+        loop = EventLoop()
+        fired = []
+        done = Future()
+        loop.call_later(0.02, lambda: fired.append(2))
+        loop.call_later(0.01, lambda: fired.append(1))
+        loop.call_later(0.015, lambda: fired.append('cancelled')).cancel()
+        loop.call_later(0.03, lambda: done.set_result(fired))
+        self.assertEqual(loop.run_until_complete(done), [1, 2])
+
+    def test_nothing_to_wait_on(self):
+        self.assertRaises(ReapError, EventLoop().run_until_complete, Future())
+
+    def test_then(self):
+        loop = EventLoop()
+        first = Future()
+        chained = first.then(lambda value: value + 1).then(lambda value: finished(value * 2))
+        loop.call_soon(lambda: first.set_result(1))
+        self.assertEqual(loop.run_until_complete(chained), 4)
+        failed = finished(0).then(lambda value: 1 / value).then(lambda value: value + 1)
+        self.assertRaises(ZeroDivisionError, failed.result)
+
+    def test_gather(self):
+        futures = [Future() for i in xrange(3)]
+        gathered = gather(futures)
+        futures[2].set_exception(ValueError('last'))
+        futures[1].set_exception(KeyError('first'))
+        self.assertFalse(gathered.done())
+        futures[0].set_result(0)
+        # like fetch_all, the earliest item's error wins.
+        self.assertIsInstance(gathered.exception(), KeyError)
+        self.assertEqual(gather([]).result(), [])
+
+class AsyncTest(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.loop = EventLoop()
+
+    def run_loop(self, future):
+        return self.loop.run_until_complete(future)
+
+    def harvest(self, **kwargs):
+        hv = AsyncHarvest(self.fake.base_uri, self.fake.username, self.fake.password,
+        	loop = self.loop, **kwargs)
+        self.run_loop(hv.login())
+        return hv
+
+class TestAsyncHarvest(AsyncTest):
+    def test_same_as_harvest(self):
+        self.fake.seed(people = 3, projects = 2, entries = 50)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        ahv = self.harvest()
+        self.assertEqual(ahv.identity, hv.identity)
+        for name in ('people', 'projects', 'tasks', 'clients'):
+            self.assertEqual(
+                [m.id for m in self.run_loop(getattr(ahv, name)())],
+                [m.id for m in getattr(hv, name)()],
+            )
+        project = hv.projects()[0]
+        self.assertEqual(
+            [ta.id for ta in self.run_loop(ahv.task_assignments(project))],
+            [ta.id for ta in project.task_assignments()],
+        )
+        self.assertEqual(self.run_loop(ahv.get_project(project.id)).name, project.name)
+
+    def test_entries(self):
+        self.fake.seed(people = 2, projects = 2, entries = 200, days = 400)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        ahv = self.harvest()
+        hv.limiter = ahv.limiter = None
+        start = datetime.datetime.today() - datetime.timedelta(days = 400)
+        end = datetime.datetime.today()
+        for person in hv.people():
+            self.assertEqual(
+                [e.id for e in self.run_loop(ahv.entries(person, start, end))],
+                [e.id for e in person.entries(start, end)],
+            )
+        for project in hv.projects():
+            self.assertEqual(
+                [e.id for e in self.run_loop(ahv.entries(project))],
+                [e.id for e in project.entries()],
+            )
+
+    def test_models(self):
+        self.fake.seed(people = 2, projects = 2, entries = 50)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        ahv = self.harvest()
+        # the models' own methods return Futures, rather than blocking.
+        person = self.run_loop(ahv.people())[0]
+        self.assertEqual(
+            [e.id for e in self.run_loop(person.entries())],
+            [e.id for e in hv.people()[0].entries()],
+        )
+        project = self.run_loop(ahv.projects())[0]
+        self.assertEqual(
+            [e.id for e in self.run_loop(project.entries())],
+            [e.id for e in hv.projects()[0].entries()],
+        )
+        self.assertEqual(
+            [ta.id for ta in self.run_loop(project.task_assignments())],
+            [ta.id for ta in hv.projects()[0].task_assignments()],
+        )
+        self.assertRaises(TypeError, person.iter_entries)
+        self.assertRaises(TypeError, project.iter_entries)
+
+    def test_create(self):
+        hv = self.harvest()
+        client = self.run_loop(hv.create_client('Initrode'))
+        self.assertEqual(client.name, 'Initrode')
+        self.assertIs(self.run_loop(hv.get_client(client.id)), client)
+        project = self.run_loop(hv.create_project('Swingline', client.id))
+        self.assertIn(project.id, [p.id for p in self.run_loop(hv.projects())])
+        person = self.run_loop(hv.create_person('Milton', 'Waddams', 'milton@example.com'))
+        self.assertIn(person, self.run_loop(hv.people()))
+
+    def test_concurrent(self):
+        self.fake.seed(people = 200, projects = 1, entries = 0)
+        self.fake.latency = 0.1
+        hv = self.harvest(max_connections = 50)
+        hv.limiter = None
+        people = self.run_loop(hv.people())
+        began = time.time()
+        fetched = self.run_loop(gather(
+            hv.get_request('people/' + str(person.id)) for person in people
+        ))
+        # four rounds of 50 at once, rather than 200 one after another.
+        self.assertLess(time.time() - began, 2.0)
+        self.assertEqual([f['user']['id'] for f in fetched], [p.id for p in people])
+        self.assertEqual(hv.http.opened, 50)
+
+    def test_shared(self):
+        hv = self.harvest()
+        self.fake.reset_counts()
+        people = self.run_loop(gather(hv.people() for i in xrange(10)))
+        self.assertEqual(self.fake.count('GET /people'), 1)
+        self.assertIs(people[0][0], people[9][0])
+
+    def test_errors(self):
+        hv = self.harvest()
+        self.assertRaises(HTTPError, self.run_loop, hv.get_project(12345))
+        self.fake.throttle(2)
+        self.assertEqual(len(self.run_loop(hv.clients())), 1)
+        bad = AsyncHarvest(self.fake.base_uri, self.fake.username, 'wrong', loop = self.loop)
+        self.assertRaises(LoginError, self.run_loop, bad.login())
+
+    def test_not_admin(self):
+        self.fake.user['is_admin'] = False
+        hv = AsyncHarvest(self.fake.base_uri, self.fake.username, self.fake.password, loop = self.loop)
+        self.assertRaises(ValueError, self.run_loop, hv.login())
+
+    def test_server_closed(self):
+        hv = self.harvest()
+        # the fake hangs up on the kept-alive connection, which is noticed
+        # 	while idle, so the next request opens a new one.
+        with self.fake.lock:
+            sockets = list(self.fake.sockets)
+        for sock in sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+        waited = Future()
+        self.loop.call_later(0.1, lambda: waited.set_result(None))
+        self.run_loop(waited)
+        self.assertEqual(len(self.run_loop(hv.people())), 1)
+        self.assertEqual(hv.http.opened, 2)
+
+    def test_no_resent_writes(self):
+        hv = self.harvest()
+        hv.limiter = None
+        self.fake.reset_counts()
+        self.fake.hang_up(1)
+        self.assertEqual(len(self.run_loop(hv.people())), 1)
+        self.assertEqual(self.fake.count('GET /people'), 2)
+        self.fake.hang_up(1)
+        # carried out, but unanswered, so it is not known to be safe to resend.
+        self.assertRaises(TransportError, self.run_loop, hv.create_client('Initrode'))
+        self.assertEqual(self.fake.count('POST /clients'), 1)
+
+class TestAsyncTimesheet(AsyncTest):
+    def timesheet(self):
+        ts = AsyncTimesheet(self.fake.base_uri, self.fake.username, self.fake.password, loop = self.loop)
+        self.run_loop(ts.login())
+        return ts
+
+    def test_same_as_timesheet(self):
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        ats = self.timesheet()
+        self.assertEqual([p.id for p in self.run_loop(ats.projects())], [p.id for p in ts.projects()])
+        self.assertEqual([e.id for e in self.run_loop(ats.entries())], [e.id for e in ts.entries()])
+
+    def test_writes(self):
+        ts = self.timesheet()
+        project = self.run_loop(ts.projects())[0]
+        task = project.tasks()[0]
+        entry = self.run_loop(ts.create_entry(project.id, task.id, notes = 'TPS'))
+        self.assertTrue(entry.started)
+        self.assertIn(entry.id, [e.id for e in self.run_loop(ts.entries())])
+        self.fake.reset_counts()
+        entry = self.run_loop(ts.stop(entry))
+        self.assertFalse(entry.started)
+        self.assertEqual(entry.notes, 'TPS')
+        entry = self.run_loop(ts.start(entry))
+        self.assertTrue(entry.started)
+        # the toggle's response is merged in, rather than the entry refetched.
+        self.assertEqual(self.fake.count('daily/show'), 0)
+        entry = self.run_loop(ts.update(entry, notes = 'Cover sheets'))
+        self.assertEqual(entry.notes, 'Cover sheets')
+        self.run_loop(ts.delete(entry))
+        self.assertNotIn(entry.id, [e.id for e in self.run_loop(ts.entries())])
+
+    def test_entry_methods(self):
+        ts = self.timesheet()
+        entry = self.run_loop(ts.entries())[0]
+        entry = self.run_loop(entry.start())
+        self.assertTrue(entry.started)
+        entry = self.run_loop(entry.stop())
+        self.assertFalse(entry.started)
+        entry = self.run_loop(entry.update(notes = 'TPS'))
+        self.assertEqual(entry.notes, 'TPS')
+        self.run_loop(entry.delete())
+        self.assertNotIn(entry.id, [e.id for e in self.run_loop(ts.entries())])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,57 +12,861 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import urllib2
+import re
+import sys
+import zlib
+import httplib
+import urlparse
+import socket
+import select
+import threading
+import random
+import time
+import email.utils
 import json
 import base64
 import datetime
+from reap.api.errors import ReapError, LoginError, TransportError, HTTPError, RateLimitError
+from reap.api.trace import Trace, tracing, timed, emit_request, emit_phase
+from reap.api.index import Index
+
+# How many idle keep-alive connections are kept per host by default.
+DEFAULT_POOL_SIZE = 4
+
+# Requests resent on a fresh connection whenever a reused one fails. Others
+# 	are only resent if sending them failed, so the server never got them.
+RESENDABLE_METHODS = ('GET', 'HEAD', 'DELETE')
+
+# Harvest allows 100 requests per 15 seconds for each account. Allowing a
+# 	burst of 20 and then 80 more over the next 15 seconds stays under that
+# 	however the server lines up its window.
+DEFAULT_RATE = 80 / 15.0
+DEFAULT_BURST = 20
+
+# How many times a throttled or failed request is retried, and the base and
+# 	maximum delays in seconds for the exponential backoff between tries.
+DEFAULT_RETRIES = 4
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+# How many bytes of a streamed response are read and decoded at a time.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Identical GETs made within this many seconds of each other share one
+# 	response; any write drops the responses kept so far. Bigger responses
+# 	are only shared with requests already waiting on them, so large entry
+# 	lists are not held in memory.
+COALESCE_WINDOW = 5.0
+COALESCE_MAX_BYTES = 1024 * 1024
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+SHORT_TIME_FORMAT = '%Y-%m-%d'
 
 def parse_time(timestr):
-    return datetime.datetime.strptime(timestr, '%Y-%m-%dT%H:%M:%SZ')
+    # Harvest always sends this exact layout, so slicing out the fields is
+    # 	much cheaper than strptime. Anything else gets strptime's checks.
+    if len(timestr) == 20 and timestr[4] == '-' and timestr[7] == '-' \
+    	and timestr[10] == 'T' and timestr[13] == ':' and timestr[16] == ':' \
+    	and timestr[19] == 'Z' and timestr[:4].isdigit():
+        return datetime.datetime(
+            int(timestr[0:4]),
+            int(timestr[5:7]),
+            int(timestr[8:10]),
+            int(timestr[11:13]),
+            int(timestr[14:16]),
+            int(timestr[17:19]),
+        )
+    return datetime.datetime.strptime(timestr, TIME_FORMAT)
 
 def parse_short_time(timestr):
-    return datetime.datetime.strptime(timestr, '%Y-%m-%d')
+    if len(timestr) == 10 and timestr[4] == '-' and timestr[7] == '-' \
+    	and timestr[:4].isdigit():
+        return datetime.datetime(
+            int(timestr[0:4]),
+            int(timestr[5:7]),
+            int(timestr[8:10]),
+        )
+    return datetime.datetime.strptime(timestr, SHORT_TIME_FORMAT)
+
+class LazyTime(object):
+    '''A model attribute holding a timestamp string until it is first read.
+
+    The raw value lives in the named slot and is replaced by the parsed
+    	datetime on first access. None stays None.'''
+    def __init__(self, slot, parse = parse_time):
+        self.slot = slot
+        self.parse = parse
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if value.__class__ is not datetime.datetime and value is not None:
+            value = self.parse(value)
+            setattr(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+_delimiters = ' \t\n\r,]'
+
+def iter_json_array(stream, chunk_size = STREAM_CHUNK_SIZE):
+    '''Yields the items of a JSON array as they are read from a file.
+
+    Only as much of the file as the item being decoded needs is held in
+    	memory. An empty file yields nothing; anything other than an array
+    	raises ValueError.'''
+    buf = ''
+    pos = 0
+    # what may come next: '[' to open, an item, or ',' / ']' after one.
+    expect = '['
+    eof = False
+    while True:
+        pos = _whitespace.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                if expect == '[':
+                    return
+                raise ValueError('Unterminated JSON array')
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        char = buf[pos]
+        if expect == '[':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            pos += 1
+            expect = 'first'
+        elif expect == 'next':
+            if char == ']':
+                return
+            if char != ',':
+                raise ValueError('Expected , or ] in JSON array')
+            pos += 1
+            expect = 'item'
+        elif expect == 'first' and char == ']':
+            return
+        else:
+            try:
+                item, end = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                end = None
+            # an item may go on in the next chunk (a number can even decode
+            # 	as a shorter one), so it is only trusted once a delimiter
+            # 	follows it.
+            if end is None or end == len(buf) or buf[end] not in _delimiters:
+                if eof:
+                    if end is None:
+                        raise ValueError('Invalid or truncated JSON array')
+                else:
+                    chunk = stream.read(chunk_size)
+                    eof = not chunk
+                    buf = buf[pos:] + chunk
+                    pos = 0
+                    continue
+            pos = end
+            expect = 'next'
+            yield item
+
+def decompress(encoding, content):
+    '''Undoes a response's Content-Encoding of gzip or deflate.'''
+    if encoding == 'gzip':
+        return zlib.decompress(content, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(content)
+        except zlib.error:
+            # some servers send raw deflate data, without the zlib wrapper.
+            return zlib.decompress(content, -zlib.MAX_WBITS)
+    return content
+
+class Decompressor(object):
+    '''Reads a compressed response stream as if it was not compressed.'''
+    def __init__(self, stream, encoding):
+        self.stream = stream
+        self.encoding = encoding
+        self.__inflater = None
+        self.__head = ''
+        self.__done = False
+
+    def read(self, size = STREAM_CHUNK_SIZE):
+        while not self.__done:
+            chunk = self.stream.read(size)
+            if self.__inflater is None:
+                # the first two bytes tell zlib data from raw deflate data.
+                self.__head += chunk
+                if len(self.__head) < 2 and chunk:
+                    continue
+                chunk = self.__head
+                self.__inflater = zlib.decompressobj(self.__wbits(chunk))
+            if not chunk:
+                self.__done = True
+                return self.__inflater.flush()
+            data = self.__inflater.decompress(chunk)
+            # an empty string means the end, so keep reading until there is data.
+            if data:
+                return data
+        return ''
+
+    def __wbits(self, head):
+        if self.encoding == 'gzip':
+            return 16 + zlib.MAX_WBITS
+        if len(head) >= 2 and ord(head[0]) & 0x0f == 8 \
+        	and (ord(head[0]) * 256 + ord(head[1])) % 31 == 0:
+            return zlib.MAX_WBITS
+        return -zlib.MAX_WBITS
+
+    @property
+    def received(self):
+        return self.stream.received
+
+    @property
+    def seconds(self):
+        return self.stream.seconds
+
+    def close(self):
+        self.stream.close()
+
+class ResponseStream(object):
+    '''The unread body of a response, returned by a streaming request.
+
+    Closing it hands the connection back to its pool if the body was read
+    	to the end, or drops the connection otherwise.'''
+    def __init__(self, response, release):
+        self.response = response
+        self.__release = release
+        self.closed = False
+        # Bytes of the body read so far, as sent, and seconds spent reading.
+        self.received = 0
+        self.seconds = 0.0
+
+    def read(self, size = None):
+        began = time.time()
+        data = self.response.read(size)
+        self.seconds += time.time() - began
+        self.received += len(data)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.__release()
+
+def _connect(conn):
+    '''Opens conn's socket as httplib would, timing the DNS lookup and connect.'''
+    began = time.time()
+    addresses = socket.getaddrinfo(conn.host, conn.port, 0, socket.SOCK_STREAM)
+    resolved = time.time()
+    error = socket.error('No addresses for ' + conn.host)
+    for family, socktype, proto, name, address in addresses:
+        try:
+            conn.sock = socket.create_connection(address[:2], conn.timeout, conn.source_address)
+            break
+        except socket.error as e:
+            error = e
+    else:
+        raise error
+    conn.timings = {'dns': resolved - began, 'connect': time.time() - resolved, 'tls': 0.0}
+    if conn._tunnel_host:
+        conn._tunnel()
+
+class _HTTPConnection(httplib.HTTPConnection):
+    def connect(self):
+        _connect(self)
+
+class _HTTPSConnection(httplib.HTTPSConnection):
+    def connect(self):
+        _connect(self)
+        began = time.time()
+        self.sock = self._context.wrap_socket(
+            self.sock,
+            server_hostname = self._tunnel_host or self.host,
+        )
+        self.timings['tls'] = time.time() - began
+
+def _dropped(conn):
+    '''Tells whether the server has closed, or written to, an idle connection.'''
+    if conn.sock is None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+class ConnectionPool:
+    '''A thread safe pool of keep-alive HTTP connections, kept per host.
+
+    Up to maxsize idle connections are kept for each scheme/host pair and
+    	reused by later requests. A maxsize of 0 disables reuse entirely, so
+    	every request opens (and closes) its own connection.'''
+    def __init__(self, maxsize = DEFAULT_POOL_SIZE, timeout = None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        # Total number of connections this pool has ever opened.
+        self.opened = 0
+        self.__idle = {}
+        self.__lock = threading.Lock()
+
+    def __connect(self, scheme, host):
+        if scheme == 'https':
+            conn_class = _HTTPSConnection
+        else:
+            conn_class = _HTTPConnection
+        if self.timeout is None:
+            conn = conn_class(host)
+        else:
+            conn = conn_class(host, timeout = self.timeout)
+        with self.__lock:
+            self.opened += 1
+        return conn
+
+    def __checkout(self, scheme, host):
+        while True:
+            with self.__lock:
+                idle = self.__idle.get((scheme, host))
+                if not idle:
+                    return None
+                conn = idle.pop()
+            if not _dropped(conn):
+                return conn
+            conn.close()
+
+    def __checkin(self, scheme, host, conn):
+        with self.__lock:
+            idle = self.__idle.setdefault((scheme, host), [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, uri, body = None, headers = None, stream = False):
+        '''Performs a request, returning the response and its read body.
+
+        Idle connections the server has closed are not reused. One dropped
+        	while the request is made is retried on a fresh connection, but
+        	a write only if sending it failed, as it may have been carried out
+        	otherwise. With
+        	stream set, the body is left unread and a ResponseStream returned
+        	in its place, which must be closed when done with. The response's
+        	timings are the seconds spent in each step of the request, as in
+        	reap.api.trace.Trace.'''
+        parts = urlparse.urlsplit(uri)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        conn = self.__checkout(parts.scheme, parts.netloc)
+        while True:
+            reused = conn is not None
+            if not reused:
+                conn = self.__connect(parts.scheme, parts.netloc)
+            try:
+                if not reused:
+                    conn.connect()
+                sent = time.time()
+                conn.request(method, path, body, headers or {})
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn = None
+                if reused:
+                    continue
+                raise
+            try:
+                response = conn.getresponse()
+                ready = time.time()
+                if not stream:
+                    data = response.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn = None
+                if reused and method in RESENDABLE_METHODS:
+                    continue
+                raise
+            break
+        if reused:
+            response.timings = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}
+        else:
+            response.timings = dict(conn.timings)
+        response.timings['wait'] = ready - sent
+        response.timings['body'] = 0.0 if stream else time.time() - ready
+        if stream:
+            def release():
+                if response.will_close or not response.isclosed():
+                    conn.close()
+                else:
+                    self.__checkin(parts.scheme, parts.netloc, conn)
+            return (response, ResponseStream(response, release))
+        if response.will_close:
+            conn.close()
+        else:
+            self.__checkin(parts.scheme, parts.netloc, conn)
+        return (response, data)
+
+    def close(self):
+        '''Closes all idle connections.'''
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+class TokenBucket:
+    '''A thread safe client side rate limiter.
+
+    Allows bursts of up to capacity requests, refilled at rate requests per
+    	second. acquire() blocks until a request may be made.'''
+    def __init__(self, rate = DEFAULT_RATE, capacity = DEFAULT_BURST):
+        self.rate = float(rate)
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def __refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    def reserve(self):
+        '''Takes a token like acquire, but returns the seconds to wait for it.'''
+        with self.lock:
+            self.__refill()
+            # take the token now, even if that means going into debt, so
+            # 	waiting callers are served in the order they arrived.
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def defer(self, seconds):
+        '''Holds back every request for the next given number of seconds.'''
+        with self.lock:
+            self.__refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def default_limiter(base_uri):
+    '''Returns the process wide TokenBucket for an account.'''
+    with _limiters_lock:
+        if base_uri not in _limiters:
+            _limiters[base_uri] = TokenBucket()
+        return _limiters[base_uri]
+
+def retry_after(header):
+    '''Parses a Retry-After header into seconds, or None.'''
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        parsed = email.utils.parsedate_tz(header)
+        if parsed:
+            return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+def request_headers(username, password, compress = True):
+    '''Returns the headers sent with every request to Harvest.'''
+    auth = base64.b64encode(username + ':' + password)
+    headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Authorization': 'Basic ' + auth,
+        'User-Agent': 'reap',
+    }
+    if compress:
+        headers['Accept-Encoding'] = 'gzip, deflate'
+    return headers
+
+class _Flight(object):
+    '''A GET in progress, which identical requests wait on.'''
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+_default_pool = None
+
+def default_pool():
+    '''Returns the process wide pool shared by all API instances.'''
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ConnectionPool()
+    return _default_pool
 
 class ReapBase:
-    def __init_request(self, path):
-        auth = base64.b64encode(self.username + ':' + self.password)
+    # When set, writes are always followed by a request for the changed
+    # 	resource, rather than trusting what the write itself returned.
+    strict = False
+    retries = DEFAULT_RETRIES
+    backoff = DEFAULT_BACKOFF
+    coalesce_window = COALESCE_WINDOW
+    coalesce_max_bytes = COALESCE_MAX_BYTES
+    # Ask Harvest to compress responses.
+    compress = True
+
+    def __init__(self, base_uri, username, password, pool = None,
+    	cache = None):
+        self.base_uri = base_uri
+        self.username = username
+        # Either the password, or a function returning it that is called
+        # 	before the first request.
+        self.password = password
+        self.pool = pool or default_pool()
+        self.cache = cache
+        # Set to another TokenBucket, or None to not limit at all.
+        self.limiter = default_limiter(base_uri)
+        # How many GETs were answered by another identical one.
+        self.coalesced = 0
+        # How many GETs Harvest answered with 304 Not Modified, and how many
+        # 	bytes of response bodies it sent, before decompressing them.
+        self.revalidated = 0
+        self.received = 0
+        self.__flights = {}
+        self.__recent = {}
+        self.__generation = 0
+        self.__flights_lock = threading.Lock()
+        self.__indexes = {}
+
+    def who_am_i(self):
+        '''Checks the credentials with Harvest, returning the user's identity.
+
+        The identity is a dict with the user's id and admin flag. It can be
+        	saved and passed back in to skip this check next time.'''
+        login_response = self.get_request('account/who_am_i')
+        if not login_response:
+            raise LoginError('Unable to login with given info.', self.base_uri, self.username)
+        return {
+            'id': login_response['user']['id'],
+            'admin': login_response['user']['admin'],
+        }
+
+    def cached(self, key, fetch, ttl = None, refresh = False):
+        '''Returns the cached value for key, calling fetch to fill it if needed.
+
+        ttl overrides how long the cache keeps key fresh, in seconds. If
+        	refresh is set, a cached value is ignored (but still overwritten).'''
+        if not self.cache:
+            return fetch()
+        account = self.base_uri + ' ' + self.username
+        value = None if refresh else self.cache.get(account, key, ttl)
+        if value is None:
+            value = fetch()
+            self.cache.set(account, key, value, ttl)
+        elif tracing():
+            emit_request(Trace('GET', key, cache = 'hit'))
+        return value
+
+    def invalidate(self, key):
+        '''Drops key from the cache, after the resource it holds has changed.'''
+        with self.__flights_lock:
+            self.__indexes.pop(key, None)
+            self.__recent.pop(key, None)
+            self.__generation += 1
+        if self.cache:
+            self.cache.invalidate(self.base_uri + ' ' + self.username, key)
+
+    def known(self, key):
+        '''Tells whether key can be had without a request.
+
+        It can if an Index of it has been built, or the cache holds it.'''
+        with self.__flights_lock:
+            if key in self.__indexes:
+                return True
+        if not self.cache:
+            return False
+        return self.cache.get(self.base_uri + ' ' + self.username, key) is not None
+
+    def indexed(self, key, fetch, name = None):
+        '''Returns an Index of the records fetch returns, for the resource key.
+
+        The Index is built on first use and shared by later lookups, until key
+        	is invalidated or the instance forgets its responses.'''
+        with self.__flights_lock:
+            index = self.__indexes.get(key)
+            generation = self.__generation
+        if index is None:
+            records = fetch()
+            index = Index(records, name) if name else Index(records)
+            with self.__flights_lock:
+                # one built from a response dropped meanwhile is not kept.
+                if generation == self.__generation:
+                    index = self.__indexes.setdefault(key, index)
+        return index
+
+    def __headers(self):
+        if callable(self.password):
+            self.password = self.password()
+        return request_headers(self.username, self.password, self.compress)
+
+    def __delay(self, attempt):
+        # exponential backoff with full jitter.
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+
+    def __wait(self, seconds):
+        if self.limiter:
+            self.limiter.defer(seconds)
+        else:
+            time.sleep(seconds)
+
+    def __open(self, method, path, data = None, stream = False, headers = None):
+        '''Makes a request, retrying when throttled or the connection fails.
+
+        Throttling (429 and 503 responses) is retried for every method,
+        	honoring Retry-After. Connection failures are only retried for
+        	GET and DELETE, which are safe to repeat. The body returned is
+        	always decompressed.'''
         uri = self.base_uri + path
-        request = urllib2.Request(uri)
-        request.add_header('Content-Type', 'application/json')
-        request.add_header('Accept', 'application/json')
-        request.add_header('Authorization', 'Basic ' + auth)
-        request.add_header('User-Agent', 'reap')
-        return request
-
-    def get_request(self, path):
-        request = self.__init_request(path)
+        if urlparse.urlsplit(uri).scheme not in ('http', 'https'):
+            raise TransportError('Invalid base URI: ' + self.base_uri)
+        body = json.dumps(data) if data is not None else None
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            request_headers = self.__headers()
+            if headers:
+                request_headers.update(headers)
+            started = time.time()
+            try:
+                response, content = self.pool.request(
+                    method,
+                    uri,
+                    body,
+                    request_headers,
+                    stream,
+                )
+            except (httplib.HTTPException, socket.error) as e:
+                if tracing():
+                    trace = Trace(method, path, started)
+                    trace.total = time.time() - started
+                    trace.attempt = attempt
+                    trace.error = str(e)
+                    emit_request(trace)
+                if attempt < self.retries and method in ('GET', 'DELETE'):
+                    time.sleep(self.__delay(attempt))
+                    attempt += 1
+                    continue
+                raise TransportError(str.format('{} {}: {}', method, path, e))
+            if stream and response.status >= 400:
+                content.close()
+            if tracing():
+                trace = self.__trace(method, path, started, response, attempt)
+                if not stream or response.status >= 400:
+                    trace.bytes = len(content) if not stream else content.received
+                    emit_request(trace)
+            if response.status in (429, 503):
+                delay = retry_after(response.getheader('Retry-After'))
+                if attempt < self.retries:
+                    self.__wait(delay if delay is not None else self.__delay(attempt))
+                    attempt += 1
+                    continue
+                raise RateLimitError(response.status, method, path, delay)
+            break
+        if response.status == 401:
+            raise LoginError('Unable to login with given info.', self.base_uri, self.username)
+        if response.status >= 400:
+            raise HTTPError(response.status, method, path)
+        encoding = (response.getheader('Content-Encoding') or '').strip().lower()
+        if stream:
+            if tracing():
+                # finished once the body has been read.
+                response.trace = trace
+            if encoding in ('gzip', 'deflate'):
+                content = Decompressor(content, encoding)
+            return (response, content)
+        with self.__flights_lock:
+            self.received += len(content)
         try:
-            result = urllib2.urlopen(request)
-            result_json = json.load(result)
-            return result_json
-        except:
+            return (response, decompress(encoding, content))
+        except zlib.error:
+            raise ReapError('Invalid compressed response to ' + path)
+
+    def __trace(self, method, path, started, response, attempt):
+        trace = Trace(
+            method,
+            path,
+            started,
+            'revalidated' if response.status == 304 else 'miss',
+        )
+        trace.total = time.time() - started
+        trace.status = response.status
+        trace.attempt = attempt
+        for step, seconds in response.timings.items():
+            setattr(trace, step, seconds)
+        return trace
+
+    def __decode(self, path, content):
+        if not content.strip():
             return None
+        try:
+            with timed('json'):
+                return json.loads(content)
+        except ValueError:
+            raise ReapError('Invalid JSON in response to ' + path)
 
-    def post_request(self, path, data, follow = False):
-        request = self.__init_request(path)
+    def forget(self):
+        '''Drops the GET responses kept for coalescing, so they are refetched.
+
+        Indexes built from them are dropped too.'''
+        with self.__flights_lock:
+            self.__recent = {}
+            self.__indexes = {}
+            self.__generation += 1
+
+    def get_request(self, path, safe = True):
+        '''Gets and decodes a resource.
+
+        A request identical to one in progress waits for and shares its
+        	response, as does one made within coalesce_window seconds of it.
+        	The response is shared, not copied, so it must not be changed.
+        	Harvest has a few GETs that change things (timer toggles and
+        	deletes); pass safe = False for those, which never coalesce.'''
+        if not safe:
+            response, content = self.__write('GET', path)
+            return self.__decode(path, content)
+        started = time.time()
+        with self.__flights_lock:
+            recent = self.__recent.get(path)
+            if recent and time.time() - recent[0] <= self.coalesce_window:
+                self.coalesced += 1
+                if tracing():
+                    emit_request(Trace('GET', path, started, 'shared'))
+                return recent[1]
+            flight = self.__flights.get(path)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[path] = _Flight()
+                generation = self.__generation
+        if not leader:
+            flight.done.wait()
+            with self.__flights_lock:
+                self.coalesced += 1
+            if tracing():
+                trace = Trace('GET', path, started, 'shared')
+                trace.total = time.time() - started
+                emit_request(trace)
+            if flight.error:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            return flight.value
+        content = ''
         try:
-            request.add_data(json.dumps(data))
-            result = urllib2.urlopen(request)
-            if result.code == 201 and follow:
-                return self.get_request(result.headers.getheader('Location')[1:])
-            result_json = json.load(result)
-            return result_json
-        except:
-            return None
+            content = self.__get(path)
+            flight.value = self.__decode(path, content)
+        except Exception:
+            flight.error = sys.exc_info()
+            raise
+        finally:
+            with self.__flights_lock:
+                del self.__flights[path]
+                # a write made meanwhile may not show in this response.
+                if not flight.error and generation == self.__generation \
+                	and len(content) <= self.coalesce_max_bytes:
+                    self.__keep(path, flight.value)
+            flight.done.set()
+        return flight.value
 
-    def delete_request(self, path):
-        request = self.__init_request(path)
-        request.get_method = lambda: 'DELETE'
+    def __get(self, path):
+        '''GETs a resource's body, revalidating the copy kept in the cache.
+
+        When the cache has a copy of the resource, Harvest is sent its ETag
+        	and Last-Modified date, and a 304 answer means the copy is used
+        	instead of downloading the resource again. Only resources without
+        	a query are kept; queries are mostly entry ranges, which reports
+        	keep in their own way.'''
+        account = self.base_uri + ' ' + self.username
+        keep = self.cache and '?' not in path
+        saved = self.cache.load_response(account, path) if keep else None
+        headers = {}
+        if saved:
+            etag, last_modified, body = saved
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response, content = self.__open('GET', path, headers = headers)
+        if response.status == 304 and saved:
+            with self.__flights_lock:
+                self.revalidated += 1
+            return body
+        etag = response.getheader('ETag')
+        last_modified = response.getheader('Last-Modified')
+        if keep and (etag or last_modified):
+            self.cache.save_response(account, path, etag, last_modified, content)
+        return content
+
+    def __keep(self, path, value):
+        now = time.time()
+        for kept in self.__recent.keys():
+            if now - self.__recent[kept][0] > self.coalesce_window:
+                del self.__recent[kept]
+        if self.coalesce_window > 0:
+            self.__recent[path] = (now, value)
+
+    def stream_request(self, path):
+        '''Yields the items of a JSON array response as they are decoded.
+
+        Unlike get_request, the body is read a chunk at a time, so memory use
+        	does not grow with the size of the response.'''
+        response, content = self.__open('GET', path, stream = True)
+        trace = getattr(response, 'trace', None)
+        parsing = 0.0
         try:
-            result = urllib2.urlopen(request)
-            if result:
-                return True
+            items = iter_json_array(content)
+            if trace is None:
+                for item in items:
+                    yield item
             else:
-                return False
-        except:
-            return None
+                while True:
+                    began = time.time()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        break
+                    parsing += time.time() - began
+                    yield item
+        except (ValueError, zlib.error):
+            raise ReapError('Invalid JSON in response to ' + path)
+        finally:
+            content.close()
+            with self.__flights_lock:
+                self.received += content.received
+            if trace is not None:
+                # not counting the time the caller spent between items.
+                trace.body = content.seconds
+                trace.bytes = content.received
+                trace.total += content.seconds
+                emit_request(trace)
+                # the time decoding, less the time waiting on the body.
+                emit_phase('json', max(0.0, parsing - content.seconds))
+
+    def __write(self, method, path, data = None):
+        try:
+            return self.__open(method, path, data)
+        finally:
+            # once the write is done, anything fetched before it may be stale.
+            self.forget()
+
+    def post_request(self, path, data, follow = False):
+        response, content = self.__write('POST', path, data)
+        if response.status == 201 and follow:
+            if content.strip() and not self.strict:
+                return self.__decode(path, content)
+            location = urlparse.urlsplit(response.getheader('Location'))
+            path = location.path[1:]
+            if location.query:
+                path += '?' + location.query
+            return self.get_request(path)
+        return self.__decode(path, content)
+
+    def delete_request(self, path):
+        self.__write('DELETE', path)
+        return True
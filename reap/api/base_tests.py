@@ -0,0 +1,311 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import time
+import zlib
+import datetime
+import StringIO
+from reap.api.base import *
+from reap.api.admin import Harvest
+from reap.api.timesheet import Timesheet
+from reap.api.fake import FakeHarvest
+from reap.api.fetch import fetch_all
+
+class FakeHarvestTest(unittest.TestCase):
+    def setUp(self):
+        # These run against a local fake server, no account needed.
+        self.fake = FakeHarvest().start()
+        client = self.fake.add_client('Initech')
+        project = self.fake.add_project('TPS Reports', client['id'])
+        task = self.fake.add_task('Admin')
+        self.fake.assign_task(project, task)
+        self.fake.add_entry(self.fake.user, project, task, 2.5)
+
+    def tearDown(self):
+        self.fake.stop()
+
+class TestConnectionPool(FakeHarvestTest):
+    def test_reuse(self):
+        pool = ConnectionPool()
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        for person in hv.people():
+            person.entries()
+        for project in hv.projects():
+            project.task_assignments()
+        self.assertTrue(len(self.fake.requests) > 1)
+        self.assertEqual(pool.opened, 1)
+        self.assertEqual(self.fake.connections, 1)
+
+    def test_no_reuse(self):
+        pool = ConnectionPool(maxsize = 0)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        hv.people()
+        hv.projects()
+        self.assertEqual(pool.opened, len(self.fake.requests))
+
+    def test_shared(self):
+        pool = ConnectionPool()
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        hv.people()
+        ts.entries()
+        self.assertEqual(pool.opened, 1)
+
+    def test_close(self):
+        pool = ConnectionPool()
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        # closing the pool drops the idle connection, so a new one is opened.
+        pool.close()
+        self.assertIsNotNone(hv.people())
+        self.assertEqual(pool.opened, 2)
+
+    def test_dropped_idle(self):
+        pool = ConnectionPool()
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        with self.fake.lock:
+            sockets = list(self.fake.sockets)
+        for sock in sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+        time.sleep(0.1)
+        # the closed connection is noticed before anything is sent on it.
+        self.assertEqual(hv.create_client('Initrode').name, 'Initrode')
+        self.assertEqual(self.fake.count('POST /clients'), 1)
+        self.assertEqual(pool.opened, 2)
+
+    def test_no_resent_writes(self):
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = ConnectionPool())
+        hv.limiter = None
+        self.fake.hang_up(1)
+        self.assertEqual(len(hv.people()), 1)
+        self.assertEqual(self.fake.count('GET /people'), 2)
+        self.fake.hang_up(1)
+        # carried out, but unanswered, so it is not known to be safe to resend.
+        self.assertRaises(TransportError, hv.create_client, 'Initrode')
+        self.assertEqual(self.fake.count('POST /clients'), 1)
+
+class TestIdentity(FakeHarvestTest):
+    def test_saved(self):
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.assertEqual(ts.identity['id'], self.fake.user['id'])
+        self.fake.reset_counts()
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password, identity = ts.identity)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, identity = ts.identity)
+        self.assertEqual(hv.id, self.fake.user['id'])
+        self.assertEqual(len(self.fake.requests), 0)
+
+    def test_rejected(self):
+        self.assertRaises(LoginError, Timesheet, self.fake.base_uri, self.fake.username, 'wrong')
+        identity = {'id': self.fake.user['id'], 'admin': True}
+        ts = Timesheet(self.fake.base_uri, self.fake.username, 'wrong', identity = identity)
+        self.assertRaises(LoginError, ts.entries)
+
+    def test_password_function(self):
+        looked_up = []
+        def password():
+            looked_up.append(True)
+            return self.fake.password
+        identity = {'id': self.fake.user['id'], 'admin': True}
+        ts = Timesheet(self.fake.base_uri, self.fake.username, password, identity = identity)
+        self.assertEqual(looked_up, [])
+        ts.entries()
+        ts.projects()
+        self.assertEqual(looked_up, [True])
+
+    def test_not_admin(self):
+        identity = {'id': self.fake.user['id'], 'admin': False}
+        self.assertRaises(ValueError, Harvest, self.fake.base_uri, self.fake.username, self.fake.password, identity = identity)
+
+class TestRetry(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.hv.backoff = 0.01
+        self.fake.reset_counts()
+
+    def test_throttled(self):
+        self.fake.throttle(2)
+        self.assertEqual(len(self.hv.people()), len(self.fake.people))
+        self.assertEqual(len(self.fake.requests), 3)
+
+    def test_unavailable(self):
+        self.fake.throttle(1, status = 503, retry_after = None)
+        self.assertIsNotNone(self.hv.projects())
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def test_gives_up(self):
+        self.fake.throttle(10)
+        self.assertRaises(RateLimitError, self.hv.people)
+        self.assertEqual(len(self.fake.requests), self.hv.retries + 1)
+
+    def test_errors(self):
+        self.assertRaises(HTTPError, self.hv.get_project, 1)
+        self.assertRaises(TransportError, Harvest, 'nowhere', 'user', 'pass')
+        self.hv.base_uri = 'http://127.0.0.1:1/'
+        self.hv.backoff = 0
+        self.assertRaises(TransportError, self.hv.people)
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst(self):
+        bucket = TokenBucket(rate = 100, capacity = 5)
+        began = time.time()
+        for i in xrange(5):
+            bucket.acquire()
+        self.assertTrue(time.time() - began < 0.05)
+        for i in xrange(5):
+            bucket.acquire()
+        self.assertTrue(time.time() - began >= 0.04)
+
+    def test_defer(self):
+        bucket = TokenBucket(rate = 100, capacity = 5)
+        bucket.defer(0.1)
+        began = time.time()
+        bucket.acquire()
+        self.assertTrue(time.time() - began >= 0.09)
+
+class TestStreaming(FakeHarvestTest):
+    def test_iter_json_array(self):
+        text = '[{"a": [1, 2]}, "x,]", 3.5, {"b": {"c": null}}]'
+        for size in (1, 2, 7, len(text)):
+            self.assertEqual(
+                list(iter_json_array(StringIO.StringIO(text), size)),
+                [{'a': [1, 2]}, 'x,]', 3.5, {'b': {'c': None}}],
+            )
+        self.assertEqual(list(iter_json_array(StringIO.StringIO(' [ ] '))), [])
+        self.assertEqual(list(iter_json_array(StringIO.StringIO(''))), [])
+        for bad in ('{}', '[1, 2', '[1 2]', '[1,]', '[{"a": ]'):
+            self.assertRaises(
+                ValueError,
+                list,
+                iter_json_array(StringIO.StringIO(bad), 2),
+            )
+
+    def test_stream_request(self):
+        pool = ConnectionPool()
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password, pool = pool)
+        project = hv.projects()[0]
+        streamed = list(project.iter_entries())
+        self.assertEqual(
+            [e.id for e in streamed],
+            [e.id for e in project.entries()],
+        )
+        # a body read to the end leaves its connection for the next request.
+        self.assertEqual(pool.opened, 1)
+
+class TestCompression(FakeHarvestTest):
+    def test_decompress(self):
+        text = '[' + ', '.join(['{"id": %d}' % i for i in range(500)]) + ']'
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        bodies = [
+            ('gzip', gzip.compress(text) + gzip.flush()),
+            ('deflate', zlib.compress(text)),
+            # raw deflate data, as some servers send for deflate.
+            ('deflate', zlib.compress(text)[2:-4]),
+        ]
+        for encoding, body in bodies:
+            self.assertEqual(decompress(encoding, body), text)
+            for size in (1, 7, len(body)):
+                stream = Decompressor(StringIO.StringIO(body), encoding)
+                self.assertEqual(len(list(iter_json_array(stream, size))), 500)
+        self.assertEqual(decompress('', text), text)
+
+    def test_compressed(self):
+        self.fake.seed(people = 20, projects = 2, entries = 200)
+        hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        hv.limiter = None
+        plain = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        plain.limiter = None
+        plain.compress = False
+        self.assertEqual(hv.get_request('people/'), plain.get_request('people/'))
+        self.assertTrue(hv.received * 4 < plain.received)
+        project = hv.projects()[0]
+        self.assertEqual(
+            [e.id for e in project.iter_entries()],
+            [e.id for e in plain.projects()[0].iter_entries()],
+        )
+
+class TestCoalescing(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.hv.limiter = None
+        self.fake.reset_counts()
+
+    def test_concurrent(self):
+        self.fake.latency = 0.2
+        results = fetch_all(
+            lambda i: self.hv.get_request('people/'),
+            range(4),
+            concurrency = 4,
+        )
+        self.assertEqual(self.fake.count('GET /people/'), 1)
+        self.assertEqual(len(set(map(str, results))), 1)
+        self.assertEqual(self.hv.coalesced, 3)
+
+    def test_recent(self):
+        self.hv.get_request('people/')
+        self.hv.get_request('people/')
+        self.assertEqual(self.fake.count('GET /people/'), 1)
+        self.hv.coalesce_window = 0
+        self.hv.get_request('people/')
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+    def test_write_forgets(self):
+        self.hv.get_request('people/')
+        self.hv.create_client('Initrode')
+        self.hv.get_request('people/')
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+    def test_unsafe(self):
+        self.hv.get_request('people/', safe = False)
+        self.hv.get_request('people/', safe = False)
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+    def test_too_large(self):
+        self.hv.coalesce_max_bytes = 0
+        self.hv.get_request('people/')
+        self.hv.get_request('people/')
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+class TestParseTime(unittest.TestCase):
+    def test_matches_strptime(self):
+        self.assertEqual(
+            parse_time('2013-02-28T17:04:59Z'),
+            datetime.datetime.strptime('2013-02-28T17:04:59Z', TIME_FORMAT),
+        )
+        self.assertEqual(
+            parse_short_time('2013-02-28'),
+            datetime.datetime.strptime('2013-02-28', SHORT_TIME_FORMAT),
+        )
+
+    def test_rejects_bad_input(self):
+        self.assertRaises(ValueError, parse_time, '2013-02-30T17:04:59Z')
+        self.assertRaises(ValueError, parse_time, '2013-02-28 17:04:59')
+        self.assertRaises(ValueError, parse_short_time, '2013-02-2x')
+        self.assertRaises(ValueError, parse_short_time, '20130228')
+
+    def test_lazy(self):
+        class Model(object):
+            __slots__ = ('_at',)
+            at = LazyTime('_at')
+        model = Model()
+        model._at = '2013-02-28T17:04:59Z'
+        self.assertEqual(model.at, datetime.datetime(2013, 2, 28, 17, 4, 59))
+        self.assertTrue(model._at is model.at)
+        model.at = None
+        self.assertEqual(model.at, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
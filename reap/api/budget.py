@@ -0,0 +1,20 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''The ways Harvest can budget a project.
+
+These live apart from reap.api.admin, which imports them, so reap-admin can
+	offer them as choices without loading the HTTP machinery.'''
+
+BUDGET_BY_TYPE = ['project', 'project_cost', 'task', 'person', 'none']
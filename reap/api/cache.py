@@ -0,0 +1,122 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''An on-disk cache for rarely changing Harvest reference data.'''
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+from reap.api.trace import timed
+
+DEFAULT_CACHE_DIR = os.path.expanduser('~/.reap/cache')
+
+# How many seconds each cached resource stays fresh.
+DEFAULT_TTLS = {
+    'people/': 60 * 60,
+    'projects/': 60 * 60,
+    'tasks/': 24 * 60 * 60,
+    'clients/': 24 * 60 * 60,
+    'daily/projects': 60 * 60,
+}
+
+# TTL for resources that can no longer change once fetched.
+FOREVER = float('inf')
+
+# Larger responses are not kept for revalidation.
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+
+class Cache:
+    '''Stores JSON responses on disk, one file per account and resource.
+
+    Only resources with a TTL, set here or passed in with the call, are
+    	cached. If refresh is set, existing entries are ignored (but still
+    	overwritten), forcing a fresh fetch.'''
+    def __init__(self, path = DEFAULT_CACHE_DIR, ttls = None, refresh = False):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+
+    def __file(self, account, key, suffix = '.json'):
+        name = hashlib.sha1(account + '\n' + key).hexdigest()
+        return os.path.join(self.path, name + suffix)
+
+    def __write(self, path, text):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # Write then rename, so concurrent readers never see half a file.
+        fd, temp = tempfile.mkstemp(dir = self.path)
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+        os.rename(temp, path)
+
+    def cacheable(self, key, ttl = None):
+        return ttl is not None or key in self.ttls
+
+    def get(self, account, key, ttl = None):
+        '''Returns the cached value, or None if missing or stale.'''
+        if self.refresh or not self.cacheable(key, ttl):
+            return None
+        try:
+            with open(self.__file(account, key)) as file:
+                with timed('json'):
+                    stored = json.load(file)
+        except (IOError, ValueError):
+            self.misses += 1
+            return None
+        if ttl is None:
+            ttl = self.ttls[key]
+        if time.time() - stored['stored'] > ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return stored['value']
+
+    def set(self, account, key, value, ttl = None):
+        if not self.cacheable(key, ttl) or value is None:
+            return
+        self.__write(
+            self.__file(account, key),
+            json.dumps({'stored': time.time(), 'value': value}),
+        )
+
+    def invalidate(self, account, key):
+        try:
+            os.remove(self.__file(account, key))
+        except OSError:
+            pass
+
+    def load_response(self, account, path):
+        '''Returns the (etag, last_modified, body) saved for a GET, or None.
+
+        Unlike get, this ignores refresh: Harvest is asked whether the body
+        	is still current before it is used.'''
+        try:
+            with open(self.__file(account, path, '.response')) as file:
+                meta = json.loads(file.readline())
+                return (meta['etag'], meta['last_modified'], file.read())
+        except (IOError, ValueError, KeyError):
+            return None
+
+    def save_response(self, account, path, etag, last_modified, body):
+        '''Keeps a GET's body along with the validators Harvest sent for it.'''
+        if len(body) > MAX_RESPONSE_BYTES:
+            return
+        meta = json.dumps({'etag': etag, 'last_modified': last_modified})
+        self.__write(self.__file(account, path, '.response'), meta + '\n' + body)
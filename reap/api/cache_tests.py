@@ -0,0 +1,123 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import tempfile
+import shutil
+from reap.api.cache import Cache, FOREVER
+from reap.api.admin import Harvest
+from reap.api.timesheet import Timesheet
+from reap.api.base_tests import FakeHarvestTest
+
+class CacheTest(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        FakeHarvestTest.tearDown(self)
+        shutil.rmtree(self.path)
+
+    def harvest(self, **kwargs):
+        cache = Cache(self.path, **kwargs)
+        return Harvest(self.fake.base_uri, self.fake.username, self.fake.password, cache = cache)
+
+class TestCache(CacheTest):
+    def test_warm(self):
+        self.harvest().people()
+        self.fake.reset_counts()
+        hv = self.harvest()
+        people = hv.people()
+        hv.projects()
+        hv.tasks()
+        hv.clients()
+        self.assertEqual(len(people), len(self.fake.people))
+        self.assertEqual(self.fake.count('GET /people/'), 0)
+        # the rest were cold.
+        self.assertEqual(hv.cache.hits, 1)
+        self.assertEqual(hv.cache.misses, 3)
+
+    def test_expired(self):
+        self.harvest(ttls = {'people/': -1}).people()
+        self.harvest(ttls = {'people/': -1}).people()
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+    def test_refresh(self):
+        self.harvest().people()
+        self.harvest(refresh = True).people()
+        self.harvest().people()
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+    def test_ttl_per_call(self):
+        cache = Cache(self.path)
+        self.assertFalse(cache.cacheable('people/1'))
+        cache.set('account', 'people/1', {'id': 1}, FOREVER)
+        self.assertEqual(cache.get('account', 'people/1'), None)
+        self.assertEqual(cache.get('account', 'people/1', FOREVER), {'id': 1})
+        self.assertEqual(cache.get('account', 'people/1', -1), None)
+
+    def test_invalidate(self):
+        hv = self.harvest()
+        count = len(hv.people())
+        person = hv.create_person('Bill', 'Lumbergh', 'bill@example.com')
+        self.assertEqual(len(hv.people()), count + 1)
+        person.delete()
+        self.assertEqual(len(hv.people()), count)
+
+    def test_timesheet_projects(self):
+        cache = Cache(self.path)
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password, cache = cache)
+        ts.projects()
+        ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password, cache = cache)
+        ts.projects()
+        self.assertEqual(self.fake.count('GET /daily'), 1)
+        # entries are never cached.
+        ts.entries()
+        self.assertEqual(self.fake.count('GET /daily'), 2)
+
+
+class TestRevalidation(CacheTest):
+    def test_not_modified(self):
+        self.harvest(ttls = {'people/': -1}).people()
+        hv = self.harvest(ttls = {'people/': -1})
+        before = hv.revalidated
+        people = hv.people()
+        self.assertEqual(len(people), len(self.fake.people))
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+        self.assertEqual(hv.revalidated - before, 1)
+        # changed since, so sent again in full.
+        self.fake.add_person('Milton', 'Waddams', 'milton@example.com')
+        hv = self.harvest(ttls = {'people/': -1})
+        before = hv.revalidated
+        self.assertEqual(len(hv.people()), len(self.fake.people))
+        self.assertEqual(hv.revalidated, before)
+
+    def test_refresh(self):
+        self.harvest().people()
+        hv = self.harvest(refresh = True)
+        before = hv.revalidated
+        hv.people()
+        self.assertEqual(hv.revalidated - before, 1)
+
+    def test_no_validators(self):
+        self.fake.etags = False
+        self.harvest(ttls = {'people/': -1}).people()
+        hv = self.harvest(ttls = {'people/': -1})
+        hv.people()
+        self.assertEqual(hv.revalidated, 0)
+        self.assertEqual(self.fake.count('GET /people/'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Errors raised by the API.
+
+These live apart from reap.api.base, which imports them, so the command
+	line scripts can catch them without loading the HTTP machinery.'''
+
+class ReapError(ValueError):
+    '''Base class for errors talking to Harvest.
+
+    This is a ValueError so code written for the old API, which raised
+    	ValueError when logging in failed, still catches it.'''
+    pass
+
+class LoginError(ReapError):
+    '''Raised when Harvest rejects the username and password.
+
+    base_uri and username tell which account it was, where known.'''
+    def __init__(self, message, base_uri = None, username = None):
+        ReapError.__init__(self, message)
+        self.base_uri = base_uri
+        self.username = username
+
+class TransportError(ReapError):
+    '''Raised when Harvest could not be reached or the connection failed.'''
+    pass
+
+class HTTPError(ReapError):
+    '''Raised when Harvest answers a request with an error status.'''
+    def __init__(self, status, method, path):
+        ReapError.__init__(self, str.format('HTTP {} for {} {}', status, method, path))
+        self.status = status
+        self.method = method
+        self.path = path
+
+class RateLimitError(HTTPError):
+    '''Raised when Harvest is still throttling a request after all retries.'''
+    def __init__(self, status, method, path, retry_after):
+        HTTPError.__init__(self, status, method, path)
+        self.retry_after = retry_after
@@ -0,0 +1,613 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''A local, in-process fake of the Harvest API for tests and benchmarks.
+
+Only the endpoints Reap uses are implemented, and only as faithfully as Reap
+	needs them to be. Every connection and request is counted so callers can
+	assert on how chatty the client is.'''
+
+import BaseHTTPServer
+import SocketServer
+import threading
+import socket
+import urlparse
+import base64
+import json
+import datetime
+import time
+import random
+import hashlib
+import zlib
+import re
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+SHORT_TIME_FORMAT = '%Y-%m-%d'
+
+def _now():
+    return datetime.datetime.utcnow().strftime(TIME_FORMAT)
+
+def _today():
+    return datetime.date.today().strftime(SHORT_TIME_FORMAT)
+
+class FakeHarvest:
+    '''An HTTP server that answers like Harvest does.
+
+    Use start() and stop() (or a with block) to run it on a free local port,
+    	then point Harvest or Timesheet at base_uri.'''
+    def __init__(self, username = 'user@example.com', password = 'pa55w0rd'):
+        self.username = username
+        self.password = password
+        self.people = []
+        self.clients = []
+        self.projects = []
+        self.tasks = []
+        self.task_assignments = []
+        self.entries = []
+        self.connections = 0
+        self.requests = []
+        self.sockets = set()
+        self.failures = []
+        # How many of the next requests are carried out, but then hung up on
+        # 	without an answer.
+        self.hang_ups = 0
+        # Seconds to wait before answering each request.
+        self.latency = 0
+        # Whether to compress responses for clients that accept it, and to
+        # 	send ETags and answer If-None-Match with 304 Not Modified.
+        self.compression = True
+        self.etags = True
+        # Bytes of response bodies sent, as sent.
+        self.sent = 0
+        self.lock = threading.RLock()
+        self.__next_id = 1000
+        self.__server = None
+        self.__thread = None
+        self.user = self.add_person('Reap', 'User', username, admin = True)
+
+    @property
+    def base_uri(self):
+        return str.format('http://127.0.0.1:{}/', self.__server.server_address[1])
+
+    def start(self):
+        self.__server = _Server(('127.0.0.1', 0), _Handler)
+        self.__server.fake = self
+        self.__thread = threading.Thread(
+            target = self.__server.serve_forever,
+            args = (0.05,),
+        )
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+        # Hang up on idle keep-alive clients so their handlers finish.
+        with self.lock:
+            sockets = list(self.sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for i in xrange(100):
+            with self.lock:
+                if not self.sockets:
+                    break
+            time.sleep(0.01)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_counts(self):
+        '''Forgets all connections and requests seen so far.'''
+        with self.lock:
+            self.connections = 0
+            self.requests = []
+            self.sent = 0
+
+    def throttle(self, count, status = 429, retry_after = '0'):
+        '''Makes the next count requests fail with status and Retry-After.'''
+        headers = {'Retry-After': retry_after} if retry_after is not None else {}
+        with self.lock:
+            self.failures += [(status, None, headers)] * count
+
+    def hang_up(self, count):
+        '''Makes the next count requests close the connection unanswered.'''
+        with self.lock:
+            self.hang_ups += count
+
+    def count(self, pattern = ''):
+        '''Counts requests whose "METHOD path" matches the given regex.'''
+        regex = re.compile(pattern)
+        with self.lock:
+            return len([r for r in self.requests if regex.search(r)])
+
+    def next_id(self):
+        with self.lock:
+            self.__next_id += 1
+            return self.__next_id
+
+    # Data setup.
+
+    def add_person(self, first_name, last_name, email, admin = False,
+    	contractor = False, department = None, default_rate = None):
+        person = {
+            'id': self.next_id(),
+            'email': email,
+            'first_name': first_name,
+            'last_name': last_name,
+            'has_access_to_all_future_projects': False,
+            'default_hourly_rate': default_rate,
+            'is_active': True,
+            'is_admin': admin,
+            'is_contractor': contractor,
+            'telephone': '',
+            'department': department,
+            'timezone': 'Central Time (US & Canada)',
+        }
+        self.people.append(person)
+        return person
+
+    def add_client(self, name):
+        client = {
+            'id': self.next_id(),
+            'name': name,
+            'created_at': _now(),
+            'updated_at': _now(),
+            'highrise_id': None,
+            'cache_version': 1,
+            'currency': 'United States Dollar - USD',
+            'currency_symbol': '$',
+            'active': True,
+            'details': '',
+            'default_invoice_timeframe': None,
+            'last_invoice_kind': None,
+        }
+        self.clients.append(client)
+        return client
+
+    def add_project(self, name, client_id, billable = True, budget = None,
+    	budget_by = 'none', notes = None, code = None):
+        project = {
+            'id': self.next_id(),
+            'name': name,
+            'active': True,
+            'billable': billable,
+            'bill_by': 'Tasks',
+            'hourly_rate': None,
+            'client_id': client_id,
+            'code': code or '',
+            'notes': notes or '',
+            'budget_by': budget_by,
+            'budget': budget,
+            'cost_budget': None,
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        self.projects.append(project)
+        return project
+
+    def add_task(self, name, billable = True):
+        task = {
+            'id': self.next_id(),
+            'name': name,
+            'billable_by_default': billable,
+            'deactivated': False,
+            'default_hourly_rate': 0,
+            'is_default': False,
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        self.tasks.append(task)
+        return task
+
+    def assign_task(self, project, task, billable = None):
+        assignment = {
+            'id': self.next_id(),
+            'project_id': project['id'],
+            'task_id': task['id'],
+            'billable': task['billable_by_default'] if billable is None else billable,
+            'deactivated': False,
+            'hourly_rate': None,
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        self.task_assignments.append(assignment)
+        return assignment
+
+    def add_entry(self, person, project, task, hours, spent_at = None,
+    	notes = ''):
+        entry = {
+            'id': self.next_id(),
+            'user_id': person['id'],
+            'project_id': project['id'],
+            'task_id': task['id'],
+            'hours': hours,
+            'notes': notes,
+            'spent_at': spent_at or _today(),
+            'is_billed': False,
+            'is_closed': False,
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        self.entries.append(entry)
+        return entry
+
+    def seed(self, people = 10, projects = 5, tasks = 5, entries = 500,
+    	days = 30, random_seed = 0):
+        '''Fills in a reproducible dataset of the given size.
+
+        Adds people (besides the logged in user), projects with a few tasks
+        	assigned each, and entries spread over everyone, their projects
+        	and the last few days. The same arguments always give the same
+        	data, apart from ids and timestamps.'''
+        rng = random.Random(random_seed)
+        clients = [
+            self.add_client('Client %d' % i)
+            for i in xrange(max(1, projects // 5))
+        ]
+        all_tasks = [
+            self.add_task('Task %d' % i, billable = rng.random() < 0.7)
+            for i in xrange(tasks)
+        ]
+        assigned = []
+        for i in xrange(projects):
+            project = self.add_project('Project %d' % i, rng.choice(clients)['id'])
+            for task in rng.sample(all_tasks, min(3, len(all_tasks))):
+                self.assign_task(project, task)
+                assigned.append((project, task))
+        everyone = [self.user] + [
+            self.add_person('Person', str(i), 'person%d@example.com' % i)
+            for i in xrange(people)
+        ]
+        today = datetime.date.today()
+        for i in xrange(entries):
+            project, task = rng.choice(assigned)
+            spent = today - datetime.timedelta(days = rng.randrange(days))
+            self.add_entry(
+                rng.choice(everyone),
+                project,
+                task,
+                round(rng.uniform(0.25, 8), 2),
+                spent_at = spent.strftime(SHORT_TIME_FORMAT),
+            )
+
+    # Lookups and JSON views.
+
+    def find(self, records, id):
+        for record in records:
+            if record['id'] == int(id):
+                return record
+
+    def record_hints(self):
+        '''Maps each project id to its earliest and latest entry days.'''
+        hints = {}
+        for e in self.entries:
+            earliest, latest = hints.get(e['project_id'], (e['spent_at'], e['spent_at']))
+            hints[e['project_id']] = (min(earliest, e['spent_at']), max(latest, e['spent_at']))
+        return hints
+
+    def project_json(self, project, hints = None):
+        if hints is None:
+            hints = self.record_hints()
+        earliest, latest = hints.get(project['id'], (_today(), _today()))
+        json = dict(project)
+        json['hint_earliest_record_at'] = earliest
+        json['hint_latest_record_at'] = latest
+        return json
+
+    def day_entry_json(self, entry):
+        return dict((k, v) for k, v in entry.items() if k != 'timer_started_at')
+
+    def daily_entry_json(self, entry):
+        project = self.find(self.projects, entry['project_id'])
+        task = self.find(self.tasks, entry['task_id'])
+        client = self.find(self.clients, project['client_id'])
+        json = {
+            'id': entry['id'],
+            'spent_at': entry['spent_at'],
+            'user_id': entry['user_id'],
+            'client': client['name'] if client else '',
+            'project_id': str(project['id']),
+            'project': project['name'],
+            'task_id': str(task['id']),
+            'task': task['name'],
+            'hours': entry['hours'],
+            'notes': entry['notes'],
+            'created_at': entry['created_at'],
+            'updated_at': entry['updated_at'],
+        }
+        if entry.get('timer_started_at'):
+            json['timer_started_at'] = entry['timer_started_at']
+        return json
+
+    def daily_json(self):
+        projects = []
+        for project in self.projects:
+            client = self.find(self.clients, project['client_id'])
+            projects.append({
+                'id': project['id'],
+                'name': project['name'],
+                'client': client['name'] if client else '',
+                'tasks': [
+                    {
+                        'id': ta['task_id'],
+                        'name': self.find(self.tasks, ta['task_id'])['name'],
+                        'billable': ta['billable'],
+                    }
+                    for ta in self.task_assignments
+                    if ta['project_id'] == project['id']
+                ],
+            })
+        return {
+            'for_day': _today(),
+            'projects': projects,
+            'day_entries': [
+                self.daily_entry_json(e) for e in self.entries
+                if e['user_id'] == self.user['id']
+                and e['spent_at'] == _today()
+            ],
+        }
+
+    def filter_entries(self, key, id, query):
+        fr = query.get('from', ['00000000'])[0]
+        to = query.get('to', ['99999999'])[0]
+        # compare "YYYY-MM-DD HH:MM" against updated_at as strings.
+        since = query.get('updated_since', [''])[0].replace(' ', 'T')
+        return [
+            {'day_entry': self.day_entry_json(e)} for e in self.entries
+            if e[key] == int(id)
+            and fr <= e['spent_at'].replace('-', '') <= to
+            and e['updated_at'][:len(since)] >= since
+        ]
+
+    # Request dispatch.
+
+    def authorized(self, header):
+        expected = base64.b64encode(self.username + ':' + self.password)
+        return header == 'Basic ' + expected
+
+    def handle(self, method, path, body):
+        '''Answers a request, returning (status, json, headers).'''
+        with self.lock:
+            self.requests.append(method + ' ' + path)
+            if self.failures:
+                return self.failures.pop(0)
+        parts = urlparse.urlsplit(path)
+        query = urlparse.parse_qs(parts.query)
+        route = parts.path.strip('/').split('/')
+        data = json.loads(body) if body else None
+        with self.lock:
+            return self.route(method, route, query, data)
+
+    def route(self, method, route, query, data):
+        if route == ['account', 'who_am_i']:
+            return (200, {'user': {
+                'id': self.user['id'],
+                'email': self.user['email'],
+                'admin': self.user['is_admin'],
+            }}, {})
+        if method == 'POST':
+            return self.create(route, data)
+        if method == 'DELETE':
+            return self.delete(route)
+        if route == ['daily']:
+            return (200, self.daily_json(), {})
+        if route[:1] == ['daily'] and len(route) == 3:
+            return self.daily_action(route[1], route[2])
+        if route == ['people']:
+            return (200, [{'user': p} for p in self.people], {})
+        if route == ['projects']:
+            hints = self.record_hints()
+            return (200, [{'project': self.project_json(p, hints)} for p in self.projects], {})
+        if route == ['tasks']:
+            return (200, [{'task': t} for t in self.tasks], {})
+        if route == ['clients']:
+            return (200, [{'client': c} for c in self.clients], {})
+        if len(route) == 2 and route[0] == 'clients':
+            client = self.find(self.clients, route[1])
+            if client:
+                return (200, {'client': client}, {})
+        if len(route) == 2 and route[0] == 'projects':
+            project = self.find(self.projects, route[1])
+            if project:
+                return (200, {'project': self.project_json(project)}, {})
+        if len(route) == 2 and route[0] == 'people':
+            person = self.find(self.people, route[1])
+            if person:
+                return (200, {'user': person}, {})
+        if len(route) == 3 and route[0] == 'people' and route[2] == 'entries':
+            return (200, self.filter_entries('user_id', route[1], query), {})
+        if len(route) == 3 and route[0] == 'projects' and route[2] == 'entries':
+            return (200, self.filter_entries('project_id', route[1], query), {})
+        if len(route) == 3 and route[0] == 'projects' and route[2] == 'task_assignments':
+            return (200, [
+                {'task_assignment': ta} for ta in self.task_assignments
+                if ta['project_id'] == int(route[1])
+            ], {})
+        return (404, None, {})
+
+    def daily_action(self, action, id):
+        entry = self.find(self.entries, id)
+        if not entry:
+            return (404, None, {})
+        if action == 'show':
+            return (200, self.daily_entry_json(entry), {})
+        if action == 'delete':
+            self.entries.remove(entry)
+            return (200, None, {})
+        if action == 'timer':
+            if entry.get('timer_started_at'):
+                del entry['timer_started_at']
+            else:
+                # like Harvest, starting one timer stops any other.
+                for other in self.entries:
+                    if other['user_id'] == entry['user_id']:
+                        other.pop('timer_started_at', None)
+                entry['timer_started_at'] = _now()
+            entry['updated_at'] = _now()
+            toggled = {'hours': entry['hours']}
+            if entry.get('timer_started_at'):
+                toggled['timer_started_at'] = entry['timer_started_at']
+            return (200, toggled, {})
+        return (404, None, {})
+
+    def create(self, route, data):
+        if route == ['daily', 'add']:
+            project = self.find(self.projects, data['project_id'])
+            task = self.find(self.tasks, data['task_id'])
+            if not project or not task:
+                return (404, None, {})
+            hours = float(data.get('hours') or 0)
+            entry = self.add_entry(
+                self.user,
+                project,
+                task,
+                hours,
+                spent_at = data.get('spent_at'),
+                notes = data.get('notes') or '',
+            )
+            if not hours and entry['spent_at'] == _today():
+                self.daily_action('timer', entry['id'])
+            return (201, self.daily_entry_json(entry), {})
+        if route[:2] == ['daily', 'update'] and len(route) == 3:
+            entry = self.find(self.entries, route[2])
+            if not entry:
+                return (404, None, {})
+            for key in ('notes', 'hours', 'project_id', 'task_id'):
+                if key in data:
+                    entry[key] = data[key]
+            entry['project_id'] = int(entry['project_id'])
+            entry['task_id'] = int(entry['task_id'])
+            entry['updated_at'] = _now()
+            return (200, self.daily_entry_json(entry), {})
+        if route == ['people']:
+            user = data['user']
+            record = self.add_person(
+                user['first_name'],
+                user['last_name'],
+                user['email'],
+                admin = user.get('is_admin', False),
+                contractor = user.get('is_contractor', False),
+                department = user.get('department'),
+                default_rate = user.get('default_hourly_rate'),
+            )
+        elif route == ['projects']:
+            project = data['project']
+            record = self.add_project(
+                project['name'],
+                project['client_id'],
+                billable = project.get('billable', True),
+                budget = project.get('budget'),
+                budget_by = project.get('budget_by', 'none'),
+                notes = project.get('notes'),
+                code = project.get('code'),
+            )
+        elif route == ['clients']:
+            record = self.add_client(data['client']['name'])
+        else:
+            return (404, None, {})
+        location = str.format('/{}/{}', route[0], record['id'])
+        return (201, None, {'Location': location})
+
+    def delete(self, route):
+        if route[:2] == ['daily', 'delete'] and len(route) == 3:
+            return self.daily_action('delete', route[2])
+        collections = {'people': self.people, 'projects': self.projects}
+        if len(route) == 2 and route[0] in collections:
+            records = collections[route[0]]
+            record = self.find(records, route[1])
+            if record:
+                records.remove(record)
+                return (200, None, {})
+        return (404, None, {})
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    # Room for many clients connecting at once, like the async API's.
+    request_queue_size = 128
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer each response into a single write, small unbuffered writes stall
+    # 	keep-alive connections on delayed ACKs.
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+            self.server.fake.sockets.add(self.connection)
+
+    def finish(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        with self.server.fake.lock:
+            self.server.fake.sockets.discard(self.connection)
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self):
+        fake = self.server.fake
+        if fake.latency:
+            time.sleep(fake.latency)
+        length = int(self.headers.getheader('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        if not fake.authorized(self.headers.getheader('Authorization')):
+            status, payload, headers = (401, None, {})
+        else:
+            status, payload, headers = fake.handle(self.command, self.path, body)
+        with fake.lock:
+            hang_up = fake.hang_ups > 0
+            if hang_up:
+                fake.hang_ups -= 1
+        if hang_up:
+            self.close_connection = 1
+            return
+        content = json.dumps(payload) if payload is not None else ''
+        headers = dict(headers)
+        if fake.etags and self.command == 'GET' and status == 200:
+            etag = '"' + hashlib.md5(content).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.getheader('If-None-Match') == etag:
+                status = 304
+                content = ''
+        accepted = self.headers.getheader('Accept-Encoding') or ''
+        if fake.compression and content:
+            if 'gzip' in accepted:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+                content = compressor.compress(content) + compressor.flush()
+                headers['Content-Encoding'] = 'gzip'
+            elif 'deflate' in accepted:
+                content = zlib.compress(content)
+                headers['Content-Encoding'] = 'deflate'
+        with fake.lock:
+            fake.sent += len(content)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = respond
+    do_POST = respond
+    do_DELETE = respond
@@ -0,0 +1,61 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Bounded concurrency helpers for fanning out many API calls at once.'''
+
+import sys
+import threading
+import Queue
+
+# Matches the default connection pool size so every worker can keep its
+# 	connection alive.
+DEFAULT_CONCURRENCY = 4
+
+def fetch_all(func, items, concurrency = DEFAULT_CONCURRENCY):
+    '''Calls func on every item, using up to concurrency threads at once.
+
+    Results are returned in the same order as items, regardless of the order
+    	the calls finish in. If any call raises, the exception of the earliest
+    	failing item is re-raised once all calls are done.'''
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    queue = Queue.Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+    def worker():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results[index] = func(item)
+            except Exception:
+                errors[index] = sys.exc_info()
+    threads = [
+        threading.Thread(target = worker)
+        for i in xrange(min(concurrency, len(items)))
+    ]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for error in errors:
+        if error:
+            raise error[0], error[1], error[2]
+    return results
@@ -0,0 +1,56 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import random
+import time
+import threading
+from reap.api.fetch import fetch_all
+
+class TestFetchAll(unittest.TestCase):
+    def test_order(self):
+        def slow_square(x):
+            time.sleep(random.random() / 100)
+            return x * x
+        items = range(50)
+        self.assertEqual(fetch_all(slow_square, items, 8), [x * x for x in items])
+
+    def test_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+        def track(x):
+            with lock:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+        fetch_all(track, range(20), 3)
+        self.assertTrue(state['peak'] <= 3)
+
+    def test_error(self):
+        def fail_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+        try:
+            fetch_all(fail_odd, range(10), 4)
+        except ValueError as e:
+            self.assertEqual(e.args[0], 1)
+        else:
+            self.fail()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''In-memory lookups over lists of people, projects, tasks or entries.
+
+Build an Index once from the list a command fetched, then look records up by
+	id, by name, by name prefix or by any part of the name without scanning
+	the list again. Names are compared without regard to case.'''
+
+import bisect
+
+def _trigrams(text):
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+def person_name(person):
+    return person.first_name + ' ' + person.last_name
+
+class Index(object):
+    '''Records looked up by id and by name.
+
+    name is a function giving a record's name; it defaults to the name
+    	attribute. Lookups return records in the order they were given.'''
+    def __init__(self, records, name = lambda record: record.name):
+        self.records = list(records)
+        self.by_id = {}
+        self.by_name = {}
+        for record in self.records:
+            self.by_id.setdefault(record.id, record)
+            self.by_name.setdefault((name(record) or '').lower(), []).append(record)
+        self.__names = sorted(self.by_name)
+        self.__trigrams = {}
+        for key in self.__names:
+            for trigram in _trigrams(key):
+                self.__trigrams.setdefault(trigram, set()).add(key)
+        self.__order = dict((id(record), i) for i, record in enumerate(self.records))
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, id):
+        '''Returns the record with the given id, or None.'''
+        return self.by_id.get(int(id))
+
+    def get_all(self, ids):
+        '''Returns the records with the given ids, once each, skipping unknown ids.'''
+        found = []
+        seen = set()
+        for id in ids:
+            record = self.get(id)
+            if record is not None and record.id not in seen:
+                seen.add(record.id)
+                found.append(record)
+        return found
+
+    def named(self, name):
+        '''Returns the records with exactly the given name.'''
+        return list(self.by_name.get(name.lower(), ()))
+
+    def prefixed(self, prefix):
+        '''Returns the records whose name starts with prefix.'''
+        prefix = prefix.lower()
+        keys = []
+        for key in self.__names[bisect.bisect_left(self.__names, prefix):]:
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+        return self.__records(keys)
+
+    def search(self, text):
+        '''Returns the records whose name contains text.'''
+        text = text.lower()
+        trigrams = _trigrams(text)
+        if trigrams:
+            # only names sharing every trigram of text can contain it.
+            keys = set.intersection(*[
+                self.__trigrams.get(trigram, set()) for trigram in trigrams
+            ])
+        else:
+            keys = self.__names
+        return self.__records(key for key in keys if text in key)
+
+    def __records(self, keys):
+        records = []
+        for key in keys:
+            records.extend(self.by_name[key])
+        records.sort(key = lambda record: self.__order[id(record)])
+        return records
@@ -0,0 +1,74 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+from reap.api.index import Index, person_name
+
+class Record(object):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+class Person(object):
+    def __init__(self, id, first_name, last_name):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            Record(3, 'Website Redesign'),
+            Record(1, 'Web Hosting'),
+            Record(2, 'Payroll'),
+            Record(4, 'website redesign'),
+            Record(5, 'TPS Reports'),
+        ]
+        self.index = Index(self.records)
+
+    def ids(self, records):
+        return [record.id for record in records]
+
+    def test_get(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertTrue(self.index.get(2) is self.records[2])
+        self.assertTrue(self.index.get('2') is self.records[2])
+        self.assertEqual(self.index.get(6), None)
+        self.assertEqual(self.ids(self.index.get_all([5, 6, 1, 5])), [5, 1])
+
+    def test_named(self):
+        self.assertEqual(self.ids(self.index.named('WEBSITE redesign')), [3, 4])
+        self.assertEqual(self.index.named('Website'), [])
+
+    def test_prefixed(self):
+        self.assertEqual(self.ids(self.index.prefixed('web')), [3, 1, 4])
+        self.assertEqual(self.ids(self.index.prefixed('website ')), [3, 4])
+        self.assertEqual(self.index.prefixed('x'), [])
+        self.assertEqual(len(self.index.prefixed('')), 5)
+
+    def test_search(self):
+        self.assertEqual(self.ids(self.index.search('SIGN')), [3, 4])
+        self.assertEqual(self.ids(self.index.search('ro')), [2])
+        self.assertEqual(self.ids(self.index.search('s r')), [5])
+        self.assertEqual(self.ids(self.index.search('e')), [3, 1, 4, 5])
+        self.assertEqual(self.index.search('hosted'), [])
+
+    def test_name_function(self):
+        index = Index([Person(7, 'Jane', 'Doe')], name = person_name)
+        self.assertEqual(self.ids(index.named('jane doe')), [7])
+        self.assertEqual(self.ids(index.search('e D')), [7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,371 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''A durable local journal of timesheet changes waiting to be sent to Harvest.
+
+A Timesheet given a Journal records its changes here and applies them to its
+	own snapshot, without waiting on Harvest. replay later sends them, in
+	the order they were made. Each change has a unique key and is marked as
+	being sent before it goes out, so if reap stops partway through, no new
+	entry is sent twice without the user being asked first.
+
+Back to back changes to one entry are combined as they are recorded: a start
+	then stop of the same timer becomes one change, later updates are
+	folded into earlier ones, and deleting an entry that was never sent
+	drops every change to it.'''
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import sqlite3
+import threading
+from reap.api.errors import HTTPError, RateLimitError
+
+DEFAULT_JOURNAL_PATH = os.path.expanduser('~/.reap/journal.db')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_entry ON changes (account, entry_id, seq);
+CREATE TABLE IF NOT EXISTS ids (
+    account TEXT NOT NULL,
+    local INTEGER NOT NULL,
+    remote INTEGER NOT NULL,
+    PRIMARY KEY (account, local)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    account TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    saved REAL NOT NULL
+);
+'''
+
+# Kinds of change. Timer changes hold the state the timer should end up in,
+# 	so sending one again does no harm.
+CREATE = 'create'
+UPDATE = 'update'
+TIMER = 'timer'
+DELETE = 'delete'
+
+# States of a change.
+PENDING = 'pending'
+SENDING = 'sending'
+CONFLICT = 'conflict'
+
+class Change(object):
+    '''One recorded change to a time entry.
+
+    Entries created while offline have a negative, local entry_id until
+    	Harvest assigns them a real one.'''
+    __slots__ = ('seq', 'key', 'kind', 'entry_id', 'data', 'state', 'error', 'created')
+
+    def __init__(self, row):
+        self.seq, self.key, self.kind, self.entry_id, data, \
+            self.state, self.error, self.created = row
+        self.data = json.loads(data)
+
+class Journal(object):
+    '''Changes to one account's timesheet, kept in SQLite until sent.
+
+    Safe to share between threads, and between processes: only one replay
+    	runs at a time.'''
+    def __init__(self, account, path = DEFAULT_JOURNAL_PATH):
+        self.account = account
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def __select(self, where = '', args = (), limit = ''):
+        rows = self.db.execute(
+            'SELECT seq, key, kind, entry_id, data, state, error, created '
+            'FROM changes WHERE account = ? ' + where + ' ORDER BY seq ' + limit,
+            (self.account,) + tuple(args),
+        ).fetchall()
+        return [Change(row) for row in rows]
+
+    def changes(self):
+        '''Returns every change not yet sent, including conflicts, in order.'''
+        with self.lock:
+            return self.__select()
+
+    def pending(self):
+        '''Returns the changes still to be sent, in order.'''
+        with self.lock:
+            return self.__select('AND state != ?', (CONFLICT,))
+
+    def conflicts(self):
+        '''Returns the changes Harvest refused, which wait on retry or drop.'''
+        with self.lock:
+            return self.__select('AND state = ?', (CONFLICT,))
+
+    def __new_id(self):
+        # a local id, below zero, for an entry created offline.
+        lowest = self.db.execute(
+            'SELECT MIN(entry_id) FROM changes WHERE account = ?',
+            (self.account,),
+        ).fetchone()[0]
+        mapped = self.db.execute(
+            'SELECT MIN(local) FROM ids WHERE account = ?',
+            (self.account,),
+        ).fetchone()[0]
+        return min(lowest or 0, mapped or 0, 0) - 1
+
+    def remote_id(self, entry_id):
+        '''Returns Harvest's id for an entry, or None if it is not created yet.'''
+        if entry_id >= 0:
+            return entry_id
+        with self.lock:
+            row = self.db.execute(
+                'SELECT remote FROM ids WHERE account = ? AND local = ?',
+                (self.account, entry_id),
+            ).fetchone()
+        return row[0] if row else None
+
+    def save_daily(self, daily):
+        '''Keeps the last daily response Harvest sent, for use while offline.'''
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO snapshots (account, data, saved) VALUES (?, ?, ?)',
+                    (self.account, json.dumps(daily), time.time()),
+                )
+
+    def last_daily(self):
+        '''Returns the daily response save_daily kept, or None.'''
+        with self.lock:
+            row = self.db.execute(
+                'SELECT data FROM snapshots WHERE account = ?',
+                (self.account,),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def create(self, data):
+        '''Records a new entry, returning the local id it is given.
+
+        The id is picked in the same transaction the change is written in,
+        	so entries created at once, even by other processes, never share
+        	one.'''
+        with self.lock:
+            with self.db:
+                # take the write lock before reading, not at the insert.
+                self.db.execute('BEGIN IMMEDIATE')
+                entry_id = self.__new_id()
+                self.__insert(CREATE, entry_id, data)
+                return entry_id
+
+    def append(self, kind, entry_id, data = None):
+        '''Records a change, combining it with earlier ones where possible.
+
+        Returns the key of the change that now holds it, or None if it
+        	cancelled out changes that were never sent.'''
+        data = data or {}
+        with self.lock:
+            with self.db:
+                waiting = self.__select(
+                    'AND entry_id = ? AND state = ?',
+                    (entry_id, PENDING),
+                )
+                last = waiting[-1] if waiting else None
+                newest = self.db.execute(
+                    'SELECT MAX(seq) FROM changes WHERE account = ?',
+                    (self.account,),
+                ).fetchone()[0]
+                if kind == TIMER and last and last.kind == TIMER and last.seq == newest:
+                    # only where the timer ends up matters.
+                    return self.__replace(last, data)
+                if kind == UPDATE and last and last.kind in (CREATE, UPDATE):
+                    merged = dict(last.data)
+                    merged.update(data)
+                    return self.__replace(last, merged)
+                if kind == DELETE:
+                    if any(change.kind == CREATE for change in waiting):
+                        # Harvest never saw the entry, so it need not hear of it.
+                        self.__remove(waiting)
+                        return None
+                    self.__remove(waiting)
+                return self.__insert(kind, entry_id, data)
+
+    def __insert(self, kind, entry_id, data):
+        key = uuid.uuid4().hex
+        self.db.execute(
+            'INSERT INTO changes (account, key, kind, entry_id, data, state, created) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (self.account, key, kind, entry_id, json.dumps(data), PENDING, time.time()),
+        )
+        return key
+
+    def __replace(self, change, data):
+        self.db.execute(
+            'UPDATE changes SET data = ? WHERE seq = ?',
+            (json.dumps(data), change.seq),
+        )
+        return change.key
+
+    def __remove(self, changes):
+        self.db.executemany(
+            'DELETE FROM changes WHERE seq = ?',
+            [(change.seq,) for change in changes],
+        )
+
+    def __set_state(self, seq, state, error = None):
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    'UPDATE changes SET state = ?, error = ? WHERE seq = ?',
+                    (state, error, seq),
+                )
+
+    def __claim(self, after):
+        '''Marks the next pending change after seq as being sent, and returns it.'''
+        with self.lock:
+            with self.db:
+                changes = self.__select(
+                    'AND seq > ? AND state = ?',
+                    (after, PENDING),
+                    'LIMIT 1',
+                )
+                if not changes:
+                    return None
+                self.db.execute(
+                    'UPDATE changes SET state = ? WHERE seq = ?',
+                    (SENDING, changes[0].seq),
+                )
+                return changes[0]
+
+    def __done(self, change, remote_id = None):
+        with self.lock:
+            with self.db:
+                if change.kind == CREATE and remote_id is not None:
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO ids (account, local, remote) VALUES (?, ?, ?)',
+                        (self.account, change.entry_id, remote_id),
+                    )
+                self.db.execute('DELETE FROM changes WHERE seq = ?', (change.seq,))
+
+    def __lock_file(self):
+        lock_file = open(self.path + '.lock', 'a')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def replay(self, send):
+        '''Sends the pending changes, oldest first, and returns how many were sent.
+
+        send(change, entry_id) makes the change in Harvest, with the entry's
+        	real id, returning the new entry's id for a CREATE. A change Harvest
+        	refuses is marked as a conflict, as are later changes to the same
+        	entry. If Harvest can not be reached, the change stays pending and
+        	the error is raised, leaving the rest for the next replay.'''
+        lock_file = self.__lock_file()
+        try:
+            self.__recover()
+            failed = set(change.entry_id for change in self.conflicts())
+            sent = 0
+            seq = 0
+            while True:
+                change = self.__claim(seq)
+                if change is None:
+                    return sent
+                seq = change.seq
+                entry_id = self.remote_id(change.entry_id)
+                if change.entry_id in failed:
+                    self.__set_state(seq, CONFLICT, 'An earlier change to this entry failed.')
+                    continue
+                if entry_id is None and change.kind != CREATE:
+                    failed.add(change.entry_id)
+                    self.__set_state(seq, CONFLICT, 'The entry was never created.')
+                    continue
+                try:
+                    remote_id = send(change, entry_id)
+                except HTTPError as e:
+                    if e.status >= 500 or isinstance(e, RateLimitError):
+                        self.__set_state(seq, PENDING)
+                        raise
+                    failed.add(change.entry_id)
+                    self.__set_state(seq, CONFLICT, str(e))
+                    continue
+                except:
+                    # Harvest could not be reached; try again next time.
+                    self.__set_state(seq, PENDING)
+                    raise
+                self.__done(change, remote_id)
+                sent += 1
+        finally:
+            lock_file.close()
+
+    def __recover(self):
+        '''Deals with changes left being sent by a replay that never finished.
+
+        Sending an update, timer or delete again is harmless. A create may or
+        	may not have reached Harvest, so it is left for the user.'''
+        with self.lock:
+            with self.db:
+                self.db.execute(
+                    'UPDATE changes SET state = ?, error = ? '
+                    'WHERE account = ? AND state = ? AND kind = ?',
+                    (
+                        CONFLICT,
+                        'Sending this entry was interrupted; check Harvest for it, then retry or drop this change.',
+                        self.account,
+                        SENDING,
+                        CREATE,
+                    ),
+                )
+                self.db.execute(
+                    'UPDATE changes SET state = ? WHERE account = ? AND state = ?',
+                    (PENDING, self.account, SENDING),
+                )
+
+    def retry(self, key):
+        '''Makes a conflicting change, and any after it, pending again.'''
+        with self.lock:
+            with self.db:
+                row = self.db.execute(
+                    'SELECT entry_id, seq FROM changes WHERE account = ? AND key = ? AND state = ?',
+                    (self.account, key, CONFLICT),
+                ).fetchone()
+                if not row:
+                    return False
+                self.db.execute(
+                    'UPDATE changes SET state = ?, error = NULL '
+                    'WHERE account = ? AND entry_id = ? AND seq >= ? AND state = ?',
+                    (PENDING, self.account, row[0], row[1], CONFLICT),
+                )
+                return True
+
+    def drop(self, key):
+        '''Forgets a change that has not been sent.'''
+        with self.lock:
+            with self.db:
+                return self.db.execute(
+                    'DELETE FROM changes WHERE account = ? AND key = ? AND state != ?',
+                    (self.account, key, SENDING),
+                ).rowcount > 0
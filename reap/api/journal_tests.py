@@ -0,0 +1,183 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+from reap.api.base import HTTPError
+from reap.api.fetch import fetch_all
+from reap.api.journal import *
+from reap.api.timesheet import Timesheet
+from reap.api.base_tests import FakeHarvestTest
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal('account', os.path.join(self.dir, 'journal.db'))
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.dir)
+
+    def kinds(self):
+        return [(c.kind, c.entry_id, c.data) for c in self.journal.changes()]
+
+    def test_timers_collapse(self):
+        self.journal.append(TIMER, 1, {'started': True})
+        self.journal.append(TIMER, 1, {'started': False})
+        self.journal.append(TIMER, 1, {'started': True})
+        self.assertEqual(self.kinds(), [(TIMER, 1, {'started': True})])
+        # not when something else happened in between.
+        self.journal.append(TIMER, 2, {'started': True})
+        self.journal.append(TIMER, 1, {'started': False})
+        self.assertEqual(len(self.journal.changes()), 3)
+
+    def test_updates_merge(self):
+        local = self.journal.create({'project_id': 1, 'task_id': 2, 'hours': 1})
+        self.assertTrue(local < 0)
+        self.journal.append(UPDATE, local, {'notes': 'TPS'})
+        self.journal.append(UPDATE, 5, {'hours': 2})
+        self.journal.append(UPDATE, 5, {'notes': 'Memo'})
+        self.assertEqual(self.kinds(), [
+            (CREATE, local, {'project_id': 1, 'task_id': 2, 'hours': 1, 'notes': 'TPS'}),
+            (UPDATE, 5, {'hours': 2, 'notes': 'Memo'}),
+        ])
+        self.assertEqual(self.journal.create({}), local - 1)
+
+    def test_delete(self):
+        local = self.journal.create({'project_id': 1, 'task_id': 2})
+        self.journal.append(TIMER, local, {'started': False})
+        self.assertEqual(self.journal.append(DELETE, local), None)
+        self.journal.append(UPDATE, 5, {'hours': 2})
+        self.journal.append(DELETE, 5)
+        self.assertEqual(self.kinds(), [(DELETE, 5, {})])
+
+    def test_replay(self):
+        local = self.journal.create({})
+        self.journal.append(UPDATE, 7, {'hours': 1})
+        self.journal.append(TIMER, local, {'started': True})
+        sent = []
+        def send(change, entry_id):
+            sent.append((change.kind, entry_id))
+            if change.kind == UPDATE:
+                raise HTTPError(404, 'POST', 'daily/update/7')
+            if change.kind == CREATE:
+                return 100
+        self.assertEqual(self.journal.replay(send), 2)
+        self.assertEqual(sent, [(CREATE, None), (UPDATE, 7), (TIMER, 100)])
+        self.assertEqual(self.journal.remote_id(local), 100)
+        conflict, = self.journal.conflicts()
+        self.assertEqual(conflict.error, 'HTTP 404 for POST daily/update/7')
+        # later changes to a conflicting entry wait behind it.
+        self.journal.append(DELETE, 7)
+        self.assertEqual(self.journal.replay(send), 0)
+        self.assertEqual(len(self.journal.conflicts()), 2)
+        self.assertTrue(self.journal.drop(conflict.key))
+        self.assertTrue(self.journal.retry(self.journal.conflicts()[0].key))
+        self.assertEqual(self.journal.replay(send), 1)
+        self.assertEqual(self.journal.changes(), [])
+
+    def test_unreachable(self):
+        self.journal.append(UPDATE, 7, {'hours': 1})
+        def send(change, entry_id):
+            raise HTTPError(503, 'POST', 'daily/update/7')
+        self.assertRaises(HTTPError, self.journal.replay, send)
+        self.assertEqual(self.journal.pending()[0].state, PENDING)
+
+    def test_concurrent_creates(self):
+        ids = fetch_all(lambda i: self.journal.create({'notes': str(i)}), xrange(40), 8)
+        self.assertEqual(len(set(ids)), 40)
+        self.assertEqual(sorted(c.entry_id for c in self.journal.changes()), sorted(ids))
+
+    def test_interrupted_create(self):
+        self.journal.create({})
+        self.journal.append(UPDATE, 7, {'hours': 1})
+        self.journal.db.execute('UPDATE changes SET state = ?', (SENDING,))
+        sent = []
+        self.journal.replay(lambda change, entry_id: sent.append(change.kind))
+        # the update is safe to send again, the create is not.
+        self.assertEqual(sent, [UPDATE])
+        self.assertEqual([c.kind for c in self.journal.conflicts()], [CREATE])
+
+class TestOffline(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal('account', os.path.join(self.dir, 'journal.db'))
+        self.ts = Timesheet(
+            self.fake.base_uri,
+            self.fake.username,
+            self.fake.password,
+            journal = self.journal,
+        )
+        self.ts.limiter = None
+        self.project = self.ts.projects()[0]
+        self.task = self.project.tasks()[0]
+        self.fake.reset_counts()
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.dir)
+        FakeHarvestTest.tearDown(self)
+
+    def test_changes_wait(self):
+        entry = self.ts.create_entry(self.project.id, self.task.id, hours = 1, notes = 'TPS')
+        self.assertTrue(entry.id < 0)
+        self.assertEqual(entry.task_name, self.task.name)
+        entry.update(notes = 'TPS Reports')
+        entry.start()
+        entry.stop()
+        entry.start()
+        self.assertTrue(entry.started)
+        self.assertEqual(len(self.fake.requests), 0)
+        self.assertEqual(len(self.journal.changes()), 2)
+        # a fresh snapshot still shows what has not been sent.
+        self.ts.refresh()
+        shown = [e for e in self.ts.entries() if e.id == entry.id][0]
+        self.assertEqual(shown.notes, 'TPS Reports')
+        self.assertTrue(shown.started)
+        self.assertEqual(self.ts.sync(), 2)
+        created = self.fake.entries[-1]
+        self.assertEqual(created['notes'], 'TPS Reports')
+        self.assertTrue(created.get('timer_started_at'))
+        self.assertEqual(self.journal.remote_id(entry.id), created['id'])
+        # the local id keeps working after the entry is sent.
+        entry.delete()
+        self.ts.sync()
+        self.assertFalse(created in self.fake.entries)
+
+    def test_unreachable(self):
+        entry = self.ts.entries()[0]
+        entry.update(notes = 'Memo')
+        self.ts.retries = 0
+        self.fake.throttle(1, status = 503)
+        self.assertRaises(HTTPError, self.ts.sync)
+        self.assertEqual(self.ts.sync(), 1)
+        self.assertEqual(self.fake.entries[0]['notes'], 'Memo')
+
+    def test_last_daily(self):
+        self.ts.daily()
+        entry = self.ts.entries()[0]
+        entry.update(notes = 'Memo')
+        self.ts.refresh()
+        self.ts.retries = 0
+        self.fake.throttle(1, status = 503)
+        # the saved snapshot, with the unsent change, stands in for Harvest.
+        found = [e for e in self.ts.entries() if e.id == entry.id][0]
+        self.assertEqual(found.notes, 'Memo')
+
+
+if __name__ == '__main__':
+    unittest.main()
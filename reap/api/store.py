@@ -0,0 +1,241 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''A local SQLite mirror of Harvest time entries, kept up to date incrementally.
+
+The first sync of a person or project downloads every entry in the requested
+	range. After that, only entries changed since the last sync are fetched,
+	using Harvest's updated_since filter. Harvest does not report deleted
+	entries that way, nor ones moved to another person or project, so pass
+	full = True now and then to fetch the whole synced range again.'''
+
+import os
+import sqlite3
+import datetime
+import threading
+import itertools
+from reap.api.base import TIME_FORMAT, SHORT_TIME_FORMAT, parse_time, parse_short_time
+from reap.api.admin import Person, Project, Entry
+
+DEFAULT_STORE_PATH = os.path.expanduser('~/.reap/entries.db')
+
+# Entries saved within this long of a sync may not be visible to it yet, so
+# 	each incremental sync starts a little before the previous one began.
+SYNC_OVERLAP = datetime.timedelta(minutes = 5)
+
+# Incremental syncs look at all time, so entries moved into a synced range
+# 	from outside of it are caught too.
+ALL_TIME = (datetime.datetime(1900, 1, 1), datetime.datetime(9999, 12, 31))
+
+# Streamed entries are written this many at a time, so the lock is not held
+# 	while waiting on the network.
+SAVE_BATCH_SIZE = 1000
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    account TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    project_id INTEGER NOT NULL,
+    task_id INTEGER NOT NULL,
+    spent_at TEXT NOT NULL,
+    hours REAL NOT NULL,
+    notes TEXT,
+    is_billed INTEGER NOT NULL,
+    is_closed INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (account, id)
+);
+CREATE INDEX IF NOT EXISTS entries_user ON entries (account, user_id, spent_at);
+CREATE INDEX IF NOT EXISTS entries_project ON entries (account, project_id, spent_at);
+CREATE TABLE IF NOT EXISTS syncs (
+    account TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    synced_at TEXT NOT NULL,
+    PRIMARY KEY (account, scope)
+);
+'''
+
+def _scope(owner):
+    '''Returns the sync scope name and entry column for a Person or Project.'''
+    if isinstance(owner, Person):
+        return ('people/' + str(owner.id), 'user_id')
+    elif isinstance(owner, Project):
+        return ('projects/' + str(owner.id), 'project_id')
+    raise TypeError('Can only sync entries for a Person or Project.')
+
+def _day(dt):
+    return dt.strftime(SHORT_TIME_FORMAT)
+
+def _shift(day, days):
+    dt = parse_short_time(day)
+    return _day(dt + datetime.timedelta(days = days))
+
+class EntryStore:
+    '''Mirrors entries for people and projects of one account into SQLite.
+
+    Safe to share between threads; API calls are made outside the database
+    	lock, so several owners can sync at once.'''
+    def __init__(self, hv, path = DEFAULT_STORE_PATH):
+        self.hv = hv
+        self.account = hv.base_uri + ' ' + hv.username
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def __last_sync(self, scope):
+        with self.lock:
+            return self.db.execute(
+                'SELECT start, end, synced_at FROM syncs WHERE account = ? AND scope = ?',
+                (self.account, scope),
+            ).fetchone()
+
+    def sync(self, owner, start, end, full = False):
+        '''Brings the stored entries of a Person or Project up to date.
+
+        Makes sure every entry between start and end is stored, fetching only
+        	what is missing or changed since the last sync. A full sync instead
+        	replaces everything stored from start to end, and from the range
+        	synced before, dropping entries deleted or moved away in Harvest.
+        	Returns the number of entries fetched.'''
+        scope, column = _scope(owner)
+        start = _day(start)
+        end = _day(end)
+        began = datetime.datetime.utcnow()
+        last = self.__last_sync(scope)
+        fetched = 0
+        if full:
+            if last:
+                start = min(start, last[0])
+                end = max(end, last[1])
+            # a full sync is meant to see everything as Harvest has it now,
+            # 	so neither shared nor cached responses are used.
+            self.hv.forget()
+            fetched += self.__fetch_range(owner, column, start, end, refresh = True)
+        elif not last:
+            fetched += self.__fetch_range(owner, column, start, end)
+        else:
+            synced_start, synced_end, synced_at = last
+            # fetch any new days at either end of what has been synced.
+            if start < synced_start:
+                fetched += self.__fetch_range(owner, column, start, _shift(synced_start, -1))
+            if end > synced_end:
+                fetched += self.__fetch_range(owner, column, _shift(synced_end, 1), end)
+            since = parse_time(synced_at) - SYNC_OVERLAP
+            fetched += self.__save(owner.iter_entries(
+                start = ALL_TIME[0],
+                end = ALL_TIME[1],
+                updated_since = since,
+            ))
+            start = min(start, synced_start)
+            end = max(end, synced_end)
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO syncs VALUES (?, ?, ?, ?, ?)',
+                (self.account, scope, start, end, began.strftime(TIME_FORMAT)),
+            )
+            self.db.commit()
+        return fetched
+
+    def __fetch_range(self, owner, column, start, end, refresh = False):
+        '''Replaces stored entries between start and end with fresh ones.'''
+        # Read in full before anything is deleted, so a failed fetch leaves
+        # 	the stored range as it was.
+        entries = owner.entries(
+            start = parse_short_time(start),
+            end = parse_short_time(end),
+            refresh = refresh,
+        )
+        with self.lock:
+            self.db.execute(
+                str.format(
+                    'DELETE FROM entries WHERE account = ? AND {} = ? AND spent_at >= ? AND spent_at <= ?',
+                    column,
+                ),
+                (self.account, owner.id, start, end),
+            )
+        return self.__save(entries)
+
+    def __save(self, entries):
+        '''Stores entries as they are read, returning how many there were.'''
+        rows = (
+            (
+                self.account,
+                e.id,
+                e.user_id,
+                e.project_id,
+                e.task_id,
+                _day(e.spent),
+                e.hours,
+                e.notes,
+                int(e.billed),
+                int(e.closed),
+                e.created.strftime(TIME_FORMAT),
+                e.updated.strftime(TIME_FORMAT),
+            )
+            for e in entries
+        )
+        saved = 0
+        while True:
+            batch = list(itertools.islice(rows, SAVE_BATCH_SIZE))
+            if not batch:
+                break
+            with self.lock:
+                self.db.executemany(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    batch,
+                )
+            saved += len(batch)
+        with self.lock:
+            self.db.commit()
+        return saved
+
+    def entries(self, owner, start, end):
+        '''Returns stored entries for a Person or Project between start and end.
+
+        This reads only the local database, call sync first to update it.'''
+        scope, column = _scope(owner)
+        with self.lock:
+            rows = self.db.execute(
+                str.format(
+                    'SELECT id, user_id, project_id, task_id, spent_at, hours, notes, is_billed, is_closed, created_at, updated_at FROM entries WHERE account = ? AND {} = ? AND spent_at >= ? AND spent_at <= ? ORDER BY spent_at, id',
+                    column,
+                ),
+                (self.account, owner.id, _day(start), _day(end)),
+            ).fetchall()
+        return [
+            Entry(self.hv, {
+                'id': row[0],
+                'user_id': row[1],
+                'project_id': row[2],
+                'task_id': row[3],
+                'spent_at': row[4],
+                'hours': row[5],
+                'notes': row[6],
+                'is_billed': bool(row[7]),
+                'is_closed': bool(row[8]),
+                'created_at': row[9],
+                'updated_at': row[10],
+            })
+            for row in rows
+        ]
@@ -0,0 +1,106 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import os
+import tempfile
+import datetime
+import shutil
+from reap.api.admin import Harvest
+from reap.api.cache import Cache
+from reap.api.store import EntryStore
+from reap.api.base_tests import FakeHarvestTest
+
+class StoreTest(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        # years of monthly shards would otherwise wait on the rate limit.
+        self.hv.limiter = None
+        self.store = EntryStore(self.hv, self.path)
+        self.person = [p for p in self.hv.people() if p.id == self.fake.user['id']][0]
+        self.start = datetime.datetime(2013, 1, 1)
+        self.end = datetime.datetime.today()
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.path)
+        FakeHarvestTest.tearDown(self)
+
+class TestSync(StoreTest):
+    def test_first(self):
+        self.assertEqual(self.store.sync(self.person, self.start, self.end), 1)
+        local = self.store.entries(self.person, self.start, self.end)
+        remote = self.person.entries(self.start, self.end)
+        self.assertEqual([e.id for e in local], [e.id for e in remote])
+        self.assertEqual(local[0].hours, remote[0].hours)
+        self.assertEqual(local[0].spent, remote[0].spent)
+
+    def test_incremental(self):
+        self.store.sync(self.person, self.start, self.end)
+        project = self.fake.projects[0]
+        task = self.fake.tasks[0]
+        self.fake.add_entry(self.fake.user, project, task, 1.0, spent_at = '2013-02-01')
+        self.fake.reset_counts()
+        self.store.sync(self.person, self.start, self.end)
+        self.assertEqual(self.fake.count('updated_since='), 1)
+        self.assertEqual(len(self.fake.requests), 1)
+        self.assertEqual(len(self.store.entries(self.person, self.start, self.end)), 2)
+
+    def test_changed(self):
+        self.store.sync(self.person, self.start, self.end)
+        self.fake.entries[0]['hours'] = 7.0
+        self.store.sync(self.person, self.start, self.end)
+        local = self.store.entries(self.person, self.start, self.end)
+        self.assertEqual(local[0].hours, 7.0)
+
+    def test_widen(self):
+        later = datetime.datetime(2013, 6, 1)
+        self.store.sync(self.person, later, self.end)
+        project = self.fake.projects[0]
+        task = self.fake.tasks[0]
+        self.fake.add_entry(self.fake.user, project, task, 1.0, spent_at = '2013-02-01')
+        self.fake.entries[-1]['updated_at'] = '2013-02-01T00:00:00Z'
+        self.store.sync(self.person, self.start, self.end)
+        self.assertEqual(len(self.store.entries(self.person, self.start, self.end)), 2)
+
+    def test_full(self):
+        self.store.sync(self.person, self.start, self.end)
+        del self.fake.entries[0]
+        self.store.sync(self.person, self.start, self.end, full = True)
+        self.assertEqual(self.store.entries(self.person, self.start, self.end), [])
+
+    def test_full_cached(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.hv.cache = Cache(directory)
+        project = self.fake.projects[0]
+        task = self.fake.tasks[0]
+        self.fake.add_entry(self.fake.user, project, task, 1.0, spent_at = '2013-02-01')
+        self.store.sync(self.person, self.start, self.end)
+        deleted = self.fake.entries.pop()['id']
+        # the closed shard holding the entry is cached.
+        later = datetime.datetime(2013, 6, 1)
+        self.store.sync(self.person, later, self.end, full = True)
+        local = self.store.entries(self.person, self.start, self.end)
+        self.assertNotIn(deleted, [e.id for e in local])
+        self.assertEqual(len(local), 1)
+        # and the cached shard is replaced with what Harvest has now.
+        self.assertNotIn(deleted, [e.id for e in self.person.entries(self.start, self.end)])
+
+
+if __name__ == '__main__':
+    unittest.main()
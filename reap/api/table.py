@@ -0,0 +1,179 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''A columnar table of time entries for fast report aggregation.
+
+Entries are stored one typed array per field rather than one object per
+	entry. Grouped sums use NumPy when it is installed, and plain Python
+	over the same arrays when it is not.'''
+
+import array
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Column name and array type code. Days are stored as proleptic ordinals.
+COLUMNS = (
+    ('id', 'l'),
+    ('user_id', 'l'),
+    ('project_id', 'l'),
+    ('task_id', 'l'),
+    ('spent', 'l'),
+    ('hours', 'd'),
+)
+
+# Grouping packs key values into one signed 64 bit integer.
+MAX_CODE = 1 << 62
+
+class EntryTable(object):
+    '''Time entries stored as typed columns.
+
+    Build one from Entry objects, then aggregate with group_sum. Tables are
+    	append only; where returns a new, filtered table.'''
+    def __init__(self, entries = ()):
+        self.columns = dict(
+            (name, array.array(code)) for name, code in COLUMNS
+        )
+        self.extend(entries)
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def extend(self, entries):
+        '''Appends Entry objects to the table.'''
+        ids = self.columns['id']
+        user_ids = self.columns['user_id']
+        project_ids = self.columns['project_id']
+        task_ids = self.columns['task_id']
+        spent = self.columns['spent']
+        hours = self.columns['hours']
+        for e in entries:
+            ids.append(e.id)
+            user_ids.append(e.user_id)
+            project_ids.append(e.project_id)
+            task_ids.append(e.task_id)
+            spent.append(e.spent.toordinal())
+            hours.append(e.hours)
+
+    def merge(self, other):
+        '''Appends the rows of another EntryTable.'''
+        for name, code in COLUMNS:
+            self.columns[name].extend(other.columns[name])
+
+    def column(self, name):
+        '''Returns a column, as a NumPy array if available (without copying).'''
+        values = self.columns[name]
+        if numpy:
+            return numpy.frombuffer(values, dtype = values.typecode) \
+                if len(values) else numpy.array([], dtype = values.typecode)
+        return values
+
+    def unique(self, name):
+        '''Returns the distinct values of a column as a set.'''
+        return set(self.columns[name])
+
+    def sum(self, name = 'hours'):
+        if numpy:
+            return float(self.column(name).sum())
+        return float(sum(self.columns[name]))
+
+    def where(self, name, values):
+        '''Returns a new table of the rows whose column value is in values.'''
+        values = set(values)
+        table = EntryTable()
+        if numpy:
+            keep = numpy.in1d(self.column(name), list(values))
+            for column, code in COLUMNS:
+                table.columns[column].fromstring(
+                    self.column(column)[keep].tostring()
+                )
+        else:
+            keep = [
+                i for i, value in enumerate(self.columns[name])
+                if value in values
+            ]
+            for column, code in COLUMNS:
+                source = self.columns[column]
+                table.columns[column].extend(source[i] for i in keep)
+        return table
+
+    def group_sum(self, keys, value = 'hours'):
+        '''Sums a column over each distinct combination of key columns.
+
+        keys is a column name or a tuple of them. Returns a dict from key
+        	value (or tuple of values) to the sum.'''
+        single = isinstance(keys, basestring)
+        if single:
+            keys = (keys,)
+        if not len(self):
+            return {}
+        if numpy:
+            sums = self.__group_sum_numpy(keys, value)
+        else:
+            sums = self.__group_sum_python(keys, value)
+        if single:
+            return dict((key[0], total) for key, total in sums.iteritems())
+        return sums
+
+    def __group_sum_numpy(self, keys, value):
+        # Pack each row's key values into one integer code, so bincount can
+        # 	do the summing in one pass. Keys spanning a small range of values
+        # 	are packed as offsets from their minimum, which avoids sorting;
+        # 	others are first numbered densely with unique.
+        limit = max(4 * len(self), 1 << 16)
+        codes = 0
+        total_span = 1
+        decoders = []
+        for key in keys:
+            column = self.column(key)
+            low = int(column.min())
+            span = int(column.max()) - low + 1
+            if span <= limit and total_span * span <= MAX_CODE:
+                code = column - low
+                decoders.append((span, low, None))
+            else:
+                distinct, code = numpy.unique(column, return_inverse = True)
+                span = len(distinct)
+                decoders.append((span, 0, distinct))
+            total_span *= span
+            if total_span > MAX_CODE:
+                # too many combinations to number in 64 bits.
+                return self.__group_sum_python(keys, value)
+            codes = codes * span + code
+        weights = self.column(value)
+        if int(codes.max()) < limit:
+            groups = numpy.flatnonzero(numpy.bincount(codes))
+            totals = numpy.bincount(codes, weights = weights)[groups]
+        else:
+            groups, inverse = numpy.unique(codes, return_inverse = True)
+            totals = numpy.bincount(inverse, weights = weights)
+        key_values = []
+        for span, low, distinct in reversed(decoders):
+            code = groups % span
+            groups = groups // span
+            key_values.append(
+                (distinct[code] if distinct is not None else code + low).tolist()
+            )
+        key_values.reverse()
+        return dict(itertools.izip(zip(*key_values), totals.tolist()))
+
+    def __group_sum_python(self, keys, value):
+        sums = {}
+        rows = itertools.izip(*[self.columns[key] for key in keys])
+        for key, amount in itertools.izip(rows, self.columns[value]):
+            sums[key] = sums.get(key, 0.0) + amount
+        return sums
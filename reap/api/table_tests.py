@@ -0,0 +1,93 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import datetime
+import reap.api.table
+from reap.api.table import EntryTable
+from reap.api.admin import Entry
+
+def entry(id, user_id, project_id, task_id, hours, spent_at = '2013-02-01'):
+    return Entry(None, {
+        'id': id,
+        'hours': hours,
+        'project_id': project_id,
+        'notes': '',
+        'task_id': task_id,
+        'user_id': user_id,
+        'is_billed': False,
+        'is_closed': False,
+        'updated_at': '2013-02-01T17:00:00Z',
+        'created_at': '2013-02-01T17:00:00Z',
+        'spent_at': spent_at,
+    })
+
+class TestEntryTable(unittest.TestCase):
+    def setUp(self):
+        self.table = EntryTable([
+            entry(1, 10, 100, 1000, 1.5),
+            entry(2, 10, 100, 1001, 2.0),
+            entry(3, 11, 100, 1000, 0.25, '2013-02-02'),
+            entry(4, 10, 101, 1000, 4.0, '2013-02-03'),
+        ])
+
+    def test_columns(self):
+        self.assertEqual(len(self.table), 4)
+        self.assertEqual(list(self.table.column('id')), [1, 2, 3, 4])
+        self.assertEqual(
+            self.table.columns['spent'][2],
+            datetime.date(2013, 2, 2).toordinal(),
+        )
+        self.assertEqual(self.table.unique('user_id'), set([10, 11]))
+        self.assertEqual(self.table.sum(), 7.75)
+
+    def test_group_sum(self):
+        self.assertEqual(
+            self.table.group_sum('user_id'),
+            {10: 7.5, 11: 0.25},
+        )
+        self.assertEqual(
+            self.table.group_sum(('project_id', 'task_id')),
+            {(100, 1000): 1.75, (100, 1001): 2.0, (101, 1000): 4.0},
+        )
+        self.assertEqual(EntryTable().group_sum('user_id'), {})
+
+    def test_group_sum_sparse_ids(self):
+        table = EntryTable([
+            entry(1, 10, 100, 1000, 1.0),
+            entry(2, 10 ** 9, 100, 1000, 2.0),
+            entry(3, 10 ** 9, 100, 10 ** 12, 3.0),
+        ])
+        self.assertEqual(
+            table.group_sum(('user_id', 'task_id')),
+            {(10, 1000): 1.0, (10 ** 9, 1000): 2.0, (10 ** 9, 10 ** 12): 3.0},
+        )
+
+    def test_where(self):
+        table = self.table.where('project_id', [100])
+        self.assertEqual(list(table.column('id')), [1, 2, 3])
+        self.assertEqual(len(self.table.where('user_id', [12])), 0)
+
+class TestEntryTableWithoutNumpy(TestEntryTable):
+    def setUp(self):
+        TestEntryTable.setUp(self)
+        self.numpy = reap.api.table.numpy
+        reap.api.table.numpy = None
+
+    def tearDown(self):
+        reap.api.table.numpy = self.numpy
+
+
+if __name__ == '__main__':
+    unittest.main()
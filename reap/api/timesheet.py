@@ -12,63 +12,333 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from reap.api.base import ReapBase, parse_time
+import copy
+import time
+import datetime
+import threading
+from reap.api.base import ReapBase, LazyTime, TIME_FORMAT, SHORT_TIME_FORMAT, parse_time
+from reap.api.errors import ReapError, TransportError, HTTPError
+from reap.api.journal import CREATE, UPDATE, TIMER, DELETE
+from reap.api.fetch import fetch_all, DEFAULT_CONCURRENCY
+from reap.api.index import Index
+from reap.api.trace import timed
+
+def _stop_timer(json):
+    '''Stops an entry's running timer, adding the time it ran to its hours.'''
+    started = json.pop('timer_started_at', None)
+    if started:
+        elapsed = datetime.datetime.utcnow() - parse_time(started)
+        json['hours'] = round(json['hours'] + elapsed.total_seconds() / 3600.0, 2)
 
 class Timesheet(ReapBase):
-    def __init__(self, base_uri, username, password):
-        self.base_uri = base_uri
-        self.username = username
-        self.password = password
-        login_response = self.get_request('account/who_am_i')
-        if not login_response:
-            raise ValueError('Unable to login with given info.')
-        self.id = login_response['user']['id']
+    def __init__(self, base_uri, username, password, pool = None,
+    	cache = None, identity = None, journal = None):
+        ReapBase.__init__(self, base_uri, username, password, pool, cache)
+        # A saved identity skips logging in; bad credentials then surface as a
+        # 	LoginError on the first request instead.
+        self.identity = identity or self.who_am_i()
+        self.id = self.identity['id']
+        # With a Journal, changes are recorded there and sent by sync.
+        self.journal = journal
+        self.__daily = None
+        self.__entries = None
+
+    def daily(self):
+        # Fetched once, then kept current by this instance's own writes.
+        if self.__daily is None:
+            try:
+                # the response is shared with other GETs, so it is copied
+                # 	before being changed by this instance's writes.
+                self.__daily = copy.deepcopy(self.get_request('daily'))
+            except (TransportError, HTTPError) as e:
+                # with a journal, work from the last snapshot while offline.
+                if not self.journal or getattr(e, 'status', 500) < 500:
+                    raise
+                self.__daily = self.journal.last_daily()
+                if self.__daily is None:
+                    raise
+            else:
+                if self.journal:
+                    self.journal.save_daily(self.__daily)
+            if self.journal:
+                # show the changes Harvest has not been sent yet.
+                for change in self.journal.pending():
+                    entry_id = self.journal.remote_id(change.entry_id)
+                    if entry_id is None:
+                        entry_id = change.entry_id
+                    json = self.__find_daily(entry_id)
+                    if json or change.kind == CREATE:
+                        self.apply(change.kind, entry_id, change.data, json)
+        return self.__daily
+
+    def refresh(self):
+        self.__daily = None
+        self.__entries = None
+        self.forget()
+
+    def patch_daily(self, json):
+        if self.__daily is None:
+            return
+        if json.get('spent_at', self.__daily.get('for_day')) != self.__daily.get('for_day'):
+            # entries for other days are not part of the snapshot.
+            return
+        self.__entries = None
+        day_entries = self.__daily['day_entries']
+        if json.has_key('timer_started_at'):
+            # Harvest stops any other running timer when one is started.
+            for ejson in day_entries:
+                if ejson['id'] != json['id']:
+                    _stop_timer(ejson)
+        for i, ejson in enumerate(day_entries):
+            if ejson['id'] == json['id']:
+                day_entries[i] = json
+                return
+        day_entries.append(json)
+
+    def __find_daily(self, entry_id):
+        for ejson in self.__daily['day_entries']:
+            if ejson['id'] == entry_id:
+                return ejson
+
+    def record(self, kind, entry_id, data, json = None):
+        '''Journals a change to an entry, and applies it to the daily snapshot.
+
+        json is the entry as it is now. Returns it as it will be once the
+        	change reaches Harvest, or None if the entry is deleted.'''
+        self.journal.append(kind, entry_id, data)
+        return self.apply(kind, entry_id, data, json)
+
+    def apply(self, kind, entry_id, data, json = None):
+        '''Applies a change to an entry's JSON, as Harvest would, without sending it.'''
+        now = time.strftime(TIME_FORMAT, time.gmtime())
+        if kind == DELETE:
+            self.remove_daily(entry_id)
+            return None
+        if kind == CREATE:
+            json = {
+                'id': entry_id,
+                'user_id': self.id,
+                'spent_at': data.get('spent_at') or datetime.date.today().strftime(SHORT_TIME_FORMAT),
+                'hours': 0,
+                'notes': '',
+                'created_at': now,
+            }
+            if not data.get('hours') and not data.get('spent_at'):
+                # Harvest starts the timer of an entry made without hours.
+                json['timer_started_at'] = now
+        json = dict(json)
+        if kind == TIMER:
+            if data['started']:
+                json['timer_started_at'] = now
+            else:
+                _stop_timer(json)
+        else:
+            json.update(data)
+            self.__describe(json)
+        json['updated_at'] = now
+        self.patch_daily(json)
+        return json
+
+    def __describe(self, json):
+        # fill in the names Harvest would send with a project and task id.
+        project = self.projects_index().get(json['project_id'])
+        if project:
+            json['project'] = project.name
+            json['client'] = project.client
+            task = project.tasks_index().get(json['task_id'])
+            if task:
+                json['task'] = task.name
+
+    def sync(self):
+        '''Sends journaled changes to Harvest, returning how many were sent.
+
+        Raises a ReapError, leaving the rest journaled, if Harvest can not be
+        	reached. Changes Harvest refuses are kept as the journal's
+        	conflicts.'''
+        return self.journal.replay(self.__send)
+
+    def __send(self, change, entry_id):
+        if change.kind == CREATE:
+            response = self.post_request('daily/add', change.data)
+            return response['id']
+        path = str(entry_id)
+        if change.kind == UPDATE:
+            self.post_request('daily/update/' + path, change.data)
+        elif change.kind == TIMER:
+            shown = self.get_request('daily/show/' + path, safe = False)
+            if shown.has_key('timer_started_at') != change.data['started']:
+                self.get_request('daily/timer/' + path, safe = False)
+        elif change.kind == DELETE:
+            try:
+                self.get_request('daily/delete/' + path, safe = False)
+            except HTTPError as e:
+                # already gone is as good as deleted.
+                if e.status != 404:
+                    raise
+
+    def remove_daily(self, entry_id):
+        if self.__daily is None:
+            return
+        self.__entries = None
+        self.__daily['day_entries'] = [
+            ejson for ejson in self.__daily['day_entries']
+            if ejson['id'] != entry_id
+        ]
 
     def projects(self):
-        projects_response = self.get_request('daily')
-        projects = [Project(pjson) for pjson in projects_response['projects']]
-        return projects
+        projects_response = self.cached(
+            'daily/projects',
+            lambda: self.daily()['projects'],
+        )
+        with timed('models'):
+            return [Project(pjson) for pjson in projects_response]
+
+    def projects_index(self):
+        '''Returns an Index of the timesheet's projects, by id and name.'''
+        return self.indexed('daily/projects', self.projects)
 
     def entries(self):
-        entries_response = self.get_request('daily')
-        entries = [Entry(self, ejson) for ejson in entries_response['day_entries']]
-        return entries
+        entries_response = self.daily()
+        with timed('models'):
+            return [Entry(self, ejson) for ejson in entries_response['day_entries']]
+
+    def entries_index(self):
+        '''Returns an Index of today's entries, by id and task name.
+
+        It is kept until this instance changes an entry or is refreshed.'''
+        index = self.__entries
+        if index is None:
+            index = self.__entries = Index(self.entries(), lambda entry: entry.task_name)
+        return index
 
-    def create_entry(self, project_id, task_id, hours = 0, notes = ''):
+    def create_entry(self, project_id, task_id, hours = 0, notes = '',
+    	spent_at = None):
+        '''Creates an entry, for today unless spent_at gives a YYYY-MM-DD day.'''
         entry = {
             'project_id': project_id,
             'task_id': task_id,
             'hours': hours,
             'notes': notes,
         }
+        if spent_at:
+            entry['spent_at'] = spent_at
+        if self.journal:
+            entry_id = self.journal.create(entry)
+            return Entry(self, self.apply(CREATE, entry_id, entry))
         response = self.post_request('daily/add', entry)
         if response:
+            self.patch_daily(response)
             return Entry(self, response)
 
-class Project:
+    def create_entries(self, rows, concurrency = DEFAULT_CONCURRENCY,
+    	done = None):
+        '''Creates many entries, returning a CreateResult for each row, in order.
+
+        Each row is a dict with project_id and task_id, and optionally hours,
+        	notes and spent_at, as for create_entry. Rows are first checked
+        	against this timesheet's projects and tasks, then the valid ones are
+        	sent concurrently, through the rate limiter. A failed row does not
+        	stop the others; its result holds the error instead of the entry.
+
+        done, if given, is called with each result as soon as its row is
+        	finished, one call at a time. Recording those lets an interrupted
+        	import skip the rows already created when it is run again.'''
+        projects = self.projects_index()
+        lock = threading.Lock()
+        def create(item):
+            index, row = item
+            result = CreateResult(index, row)
+            try:
+                project = projects.get(row['project_id'])
+                if project is None or project.tasks_index().get(row['task_id']) is None:
+                    raise ReapError(str.format(
+                        'No task {} on project {} in this timesheet',
+                        row['task_id'],
+                        row['project_id'],
+                    ))
+                result.entry = self.create_entry(
+                    int(row['project_id']),
+                    int(row['task_id']),
+                    hours = row.get('hours') or 0,
+                    notes = row.get('notes') or '',
+                    spent_at = row.get('spent_at'),
+                )
+                if result.entry is None:
+                    raise ReapError('Harvest did not return the new entry')
+            except ReapError as e:
+                result.error = e
+            except KeyError as e:
+                result.error = ReapError('Row is missing ' + str(e))
+            except (ValueError, TypeError) as e:
+                result.error = ReapError('Invalid row: ' + str(e))
+            except Exception as e:
+                # any other failure is still this row's alone.
+                result.error = ReapError(str.format('{}: {}', type(e).__name__, e))
+            if done:
+                with lock:
+                    done(result)
+            return result
+        return fetch_all(create, enumerate(rows), concurrency)
+
+class CreateResult(object):
+    '''What became of one row passed to Timesheet.create_entries.
+
+    index is the row's position among the rows given. Exactly one of entry,
+    	the created Entry, and error, a ReapError, is set.'''
+    __slots__ = ('index', 'row', 'entry', 'error')
+
+    def __init__(self, index, row):
+        self.index = index
+        self.row = row
+        self.entry = None
+        self.error = None
+
+class Project(object):
+    __slots__ = ('name', 'id', 'client', 'task_json', '_tasks_index')
+
     def __init__(self, json):
         self.name = json['name']
         self.id = json['id']
         self.client = json['client']
         self.task_json = json['tasks']
+        self._tasks_index = None
 
     def tasks(self):
         tasks = [Task(self, tjson) for tjson in self.task_json]
         return tasks
 
-class Task:
+    def tasks_index(self):
+        '''Returns an Index of the project's tasks, built on first use.'''
+        if self._tasks_index is None:
+            self._tasks_index = Index(self.tasks())
+        return self._tasks_index
+
+class Task(object):
+    __slots__ = ('name', 'id', 'billable', 'project')
+
     def __init__(self, project, json):
         self.name = json['name']
         self.id = json['id']
         self.billable = json['billable']
         self.project = project
 
-class Entry:
+class Entry(object):
+    __slots__ = (
+        'ts', '__json', 'id', 'spent_at', 'user_id', 'client_name',
+        'project_id', 'project_name', 'task_id', 'task_name', 'hours', 'notes',
+        'started', '_timer_started', '_timer_created', '_timer_updated',
+    )
+
+    timer_started = LazyTime('_timer_started')
+    timer_created = LazyTime('_timer_created')
+    timer_updated = LazyTime('_timer_updated')
+
     def __init__(self, ts, json):
         self.ts = ts
         self.__parse_json(json)
 
     def __parse_json(self, json):
+        self.__json = json
         self.id = json['id']
         self.spent_at = json['spent_at']
         self.user_id = json['user_id']
@@ -84,16 +354,20 @@ class Entry:
         self.notes = json['notes'] or ''
         self.started = json.has_key('timer_started_at')
         if self.started:
-            self.timer_started = parse_time(json['timer_started_at'])
-            self.timer_created = parse_time(json['created_at'])
-            self.timer_updated = parse_time(json['updated_at'])
+            self._timer_started = json['timer_started_at']
+            self._timer_created = json['created_at']
+            self._timer_updated = json['updated_at']
         else:
             self.timer_started = None
             self.timer_created = None
             self.timer_updated = None
 
     def delete(self):
-        response = self.ts.get_request('daily/delete/' + str(self.id))
+        if self.ts.journal:
+            self.ts.record(DELETE, self.id, {})
+            return
+        self.ts.get_request('daily/delete/' + str(self.id), safe = False)
+        self.ts.remove_daily(self.id)
 
     def update(self, notes = None, hours = None, project_id = None, task_id = None):
         changes = {}
@@ -105,22 +379,47 @@ class Entry:
             changes['project_id'] = project_id
         if task_id:
             changes['task_id'] = task_id
-        if(len(changes) > 0):
+        if len(changes) > 0 and self.ts.journal:
+            self.__parse_json(self.ts.record(UPDATE, self.id, changes, self.__json))
+        elif(len(changes) > 0):
             response = self.ts.post_request('daily/update/' + str(self.id), changes)
             if response:
-                new_info = self.ts.get_request('daily/show/' + str(self.id))
-                self.__parse_json(new_info)
+                self.__refresh(response)
 
     def start(self):
-        if not self.started:
-            response = self.ts.get_request('daily/timer/' + str(self.id))
+        if not self.started and self.ts.journal:
+            self.__parse_json(self.ts.record(TIMER, self.id, {'started': True}, self.__json))
+        elif not self.started:
+            response = self.ts.get_request('daily/timer/' + str(self.id), safe = False)
             if response:
-                new_info = self.ts.get_request('daily/show/' + str(self.id))
-                self.__parse_json(new_info)
+                self.__refresh(response)
 
     def stop(self):
-        if self.started:
-            response = self.ts.get_request('daily/timer/' + str(self.id))
+        if self.started and self.ts.journal:
+            self.__parse_json(self.ts.record(TIMER, self.id, {'started': False}, self.__json))
+        elif self.started:
+            response = self.ts.get_request('daily/timer/' + str(self.id), safe = False)
             if response:
-                new_info = self.ts.get_request('daily/show/' + str(self.id))
-                self.__parse_json(new_info)
+                self.__refresh(response)
+
+    def toggled(self, response):
+        '''Returns the entry's JSON as a write's response leaves it.
+
+        Timer toggles only send back the hours and timer state, which are
+        	merged into a copy of the JSON; a full entry is returned as is.'''
+        if response.has_key('id'):
+            return response
+        new_info = dict(self.__json)
+        new_info['hours'] = response['hours']
+        new_info.pop('timer_started_at', None)
+        if response.has_key('timer_started_at'):
+            new_info['timer_started_at'] = response['timer_started_at']
+        return new_info
+
+    def __refresh(self, response):
+        if self.ts.strict or not response.has_key('hours'):
+            new_info = self.ts.get_request('daily/show/' + str(self.id))
+        else:
+            new_info = self.toggled(response)
+        self.__parse_json(new_info)
+        self.ts.patch_daily(new_info)
@@ -17,6 +17,7 @@ import random
 import string
 import datetime
 from reap.api.timesheet import *
+from reap.api.base_tests import FakeHarvestTest
 
 def random_string(length = 5):
     return ''.join(random.choice(string.ascii_lowercase) for x in xrange(length))
@@ -182,6 +183,149 @@ class TestEntry(TimesheetTest):
         self.assertTrue(new_entry.started)
         entry.delete()
 
+class TestDailySnapshot(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.fake.reset_counts()
+
+    def find(self, entry_id):
+        for entry in self.ts.entries():
+            if entry.id == entry_id:
+                return entry
+
+    def test_single_fetch(self):
+        self.ts.projects()
+        self.ts.entries()
+        self.ts.entries()
+        self.assertEqual(self.fake.count('GET /daily$'), 1)
+
+    def test_writes(self):
+        project = self.ts.projects()[0]
+        task = project.tasks()[0]
+        count = len(self.ts.entries())
+        entry = self.ts.create_entry(project.id, task.id)
+        self.assertEqual(len(self.ts.entries()), count + 1)
+        self.assertTrue(self.find(entry.id).started)
+        entry.update(notes = 'TPS Reports')
+        self.assertEqual(self.find(entry.id).notes, 'TPS Reports')
+        entry.stop()
+        self.assertFalse(self.find(entry.id).started)
+        entry.start()
+        self.assertTrue(self.find(entry.id).started)
+        entry.delete()
+        self.assertIsNone(self.find(entry.id))
+        self.assertEqual(self.fake.count('GET /daily$'), 1)
+
+    def test_other_timer_stopped(self):
+        project = self.ts.projects()[0]
+        task = project.tasks()[0]
+        first = self.ts.create_entry(project.id, task.id)
+        second = self.ts.create_entry(project.id, task.id)
+        self.assertFalse(self.find(first.id).started)
+        self.assertTrue(self.find(second.id).started)
+
+    def test_shared_response(self):
+        project = self.ts.projects()[0]
+        self.ts.create_entry(project.id, project.tasks()[0].id, notes = 'TPS')
+        # the snapshot is changed by writes, not the response it was read from.
+        self.ts.refresh()
+        self.ts.entries()
+        shared = self.ts.get_request('daily')
+        count = len(shared['day_entries'])
+        self.ts.create_entry(project.id, project.tasks()[0].id)
+        self.assertEqual(len(shared['day_entries']), count)
+        self.assertEqual(len(self.ts.entries()), count + 1)
+
+    def test_other_timer_hours(self):
+        project = self.ts.projects()[0]
+        task = project.tasks()[0]
+        first = self.ts.create_entry(project.id, task.id)
+        hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours = 1)
+        self.fake.entries[-1]['timer_started_at'] = hour_ago.strftime(TIME_FORMAT)
+        self.ts.refresh()
+        self.ts.entries()
+        self.ts.create_entry(project.id, task.id)
+        # the stopped timer's time is counted without asking Harvest again.
+        self.assertEqual(self.find(first.id).hours, 1.0)
+
+    def test_indexes(self):
+        projects = self.ts.projects_index()
+        self.assertIs(self.ts.projects_index(), projects)
+        project = projects.records[0]
+        self.assertIs(project.tasks_index(), project.tasks_index())
+        entries = self.ts.entries_index()
+        self.assertIs(self.ts.entries_index(), entries)
+        entry = self.ts.create_entry(project.id, project.tasks()[0].id)
+        # a write drops the indexes, which are built again from the snapshot.
+        self.assertIsNot(self.ts.entries_index(), entries)
+        self.assertEqual(self.ts.entries_index().get(entry.id).id, entry.id)
+        self.assertIsNot(self.ts.projects_index(), projects)
+        self.assertEqual(self.fake.count('GET /daily$'), 1)
+
+class TestWriteRequests(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        project = self.ts.projects()[0]
+        self.entry = self.ts.create_entry(project.id, project.tasks()[0].id)
+        self.fake.reset_counts()
+
+    def toggle(self):
+        self.entry.update(notes = 'TPS Reports', hours = 2)
+        self.entry.stop()
+        self.entry.start()
+
+    def test_requests(self):
+        self.toggle()
+        self.assertEqual(len(self.fake.requests), 3)
+        self.assertEqual(self.fake.count('daily/show'), 0)
+        self.assertEqual(self.entry.notes, 'TPS Reports')
+        self.assertEqual(self.entry.hours, 2)
+        self.assertTrue(self.entry.started)
+        shown = Entry(self.ts, self.ts.get_request('daily/show/' + str(self.entry.id)))
+        self.assertEqual(shown.notes, self.entry.notes)
+        self.assertEqual(shown.hours, self.entry.hours)
+        self.assertEqual(shown.started, self.entry.started)
+
+    def test_strict(self):
+        self.ts.strict = True
+        self.toggle()
+        self.assertEqual(len(self.fake.requests), 6)
+        self.assertEqual(self.fake.count('daily/show'), 3)
+
+
+class TestCreateEntries(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.ts.limiter = None
+        project = self.ts.projects()[0]
+        self.project_id = project.id
+        self.task_id = project.tasks()[0].id
+
+    def test_rows(self):
+        today = len(self.ts.entries())
+        rows = [
+            {'project_id': self.project_id, 'task_id': self.task_id, 'hours': 1.5, 'notes': 'One'},
+            {'project_id': self.project_id, 'task_id': 999, 'hours': 1},
+            {'project_id': str(self.project_id), 'task_id': str(self.task_id), 'hours': 2, 'spent_at': '2013-02-01'},
+            {'task_id': self.task_id},
+            {'project_id': None, 'task_id': self.task_id},
+        ]
+        finished = []
+        results = self.ts.create_entries(rows, concurrency = 4, done = finished.append)
+        self.assertEqual([r.index for r in results], [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(r.index for r in finished), [0, 1, 2, 3, 4])
+        self.assertEqual(results[0].entry.notes, 'One')
+        self.assertEqual(results[2].entry.spent_at, '2013-02-01')
+        self.assertTrue(results[1].error and results[3].error and results[4].error)
+        self.assertEqual(results[1].entry, None)
+        # invalid rows are never sent.
+        self.assertEqual(self.fake.count('POST /daily/add'), 2)
+        # only today's new entry joins the daily snapshot.
+        self.assertEqual(len(self.ts.entries()), today + 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,170 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''Hooks for seeing where the time goes in talking to Harvest.
+
+Register a Tracer with add_tracer and it is told about every request made,
+	and how long was spent in phases of the work around them: decoding JSON,
+	building models from it and formatting output. With no tracers
+	registered, nothing is timed. Stats is a Tracer that keeps everything
+	for a summary; subclass Tracer to send traces somewhere else.'''
+
+import re
+import time
+import threading
+
+_tracers = []
+_tracers_lock = threading.Lock()
+
+# Path segments that are ids, replaced to group requests by endpoint.
+_ids = re.compile(r'/\d+(?=/|$)')
+
+class Trace(object):
+    '''One request to Harvest, or one answered without making it.
+
+    Times are in seconds. dns, connect and tls are 0 on a reused connection,
+    	wait runs from sending the request to the first byte of the response,
+    	and body is the time reading the rest. bytes counts the body as sent,
+    	before decompressing it. cache is 'miss' for a request that went to
+    	Harvest, 'revalidated' for one Harvest answered with 304, 'hit' for
+    	one answered from the on-disk cache and 'shared' for a GET answered
+    	by an identical one. A request that failed to connect has an error
+    	and no status.'''
+    __slots__ = (
+        'method', 'path', 'status', 'bytes', 'started', 'total', 'dns',
+        'connect', 'tls', 'wait', 'body', 'cache', 'attempt', 'error',
+    )
+
+    def __init__(self, method, path, started = None, cache = 'miss'):
+        self.method = method
+        self.path = path
+        self.started = started or time.time()
+        self.cache = cache
+        self.status = None
+        self.bytes = 0
+        self.total = 0.0
+        self.dns = 0.0
+        self.connect = 0.0
+        self.tls = 0.0
+        self.wait = 0.0
+        self.body = 0.0
+        self.attempt = 0
+        self.error = None
+
+    @property
+    def endpoint(self):
+        '''The method and path, without its query and with ids as :id.'''
+        return self.method + ' ' + _ids.sub('/:id', '/' + self.path.split('?')[0])[1:]
+
+class Tracer(object):
+    '''Receives traces; override the hooks you need.
+
+    Hooks are called from whichever thread made the request, so must be
+    	thread safe.'''
+    def request(self, trace):
+        '''Called with the Trace of each request once it is done.'''
+        pass
+
+    def phase(self, name, seconds):
+        '''Called with time spent in a phase: json, models or format.'''
+        pass
+
+def add_tracer(tracer):
+    with _tracers_lock:
+        _tracers.append(tracer)
+
+def remove_tracer(tracer):
+    with _tracers_lock:
+        if tracer in _tracers:
+            _tracers.remove(tracer)
+
+def tracing():
+    '''Returns whether any tracer is registered.'''
+    return bool(_tracers)
+
+def emit_request(trace):
+    for tracer in list(_tracers):
+        tracer.request(trace)
+
+def emit_phase(name, seconds):
+    for tracer in list(_tracers):
+        tracer.phase(name, seconds)
+
+class timed(object):
+    '''A with block whose time is added to a phase, while tracing.'''
+    def __init__(self, name):
+        self.name = name
+        self.began = None
+
+    def __enter__(self):
+        if _tracers:
+            self.began = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.began is not None:
+            emit_phase(self.name, time.time() - self.began)
+
+def timed_map(name, function, items):
+    '''Yields function(item) for each item, timing function as a phase.
+
+    Only the calls to function are timed, not producing the items or what
+    	the caller does with the results.'''
+    if not _tracers:
+        for item in items:
+            yield function(item)
+        return
+    spent = 0.0
+    try:
+        for item in items:
+            began = time.time()
+            value = function(item)
+            spent += time.time() - began
+            yield value
+    finally:
+        emit_phase(name, spent)
+
+class Stats(Tracer):
+    '''Keeps every trace and phase time, for a summary at the end of a run.'''
+    def __init__(self):
+        self.began = time.time()
+        self.traces = []
+        self.phases = {}
+        self.lock = threading.Lock()
+
+    def request(self, trace):
+        with self.lock:
+            self.traces.append(trace)
+
+    def phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def requests(self):
+        '''Returns the traces of requests that went to Harvest.'''
+        return [t for t in self.traces if t.cache in ('miss', 'revalidated')]
+
+    def endpoints(self):
+        '''Returns (endpoint, requests, seconds) for each endpoint, slowest first.'''
+        totals = {}
+        for trace in self.requests():
+            count, seconds = totals.get(trace.endpoint, (0, 0.0))
+            totals[trace.endpoint] = (count + 1, seconds + trace.total)
+        return sorted(
+            ((endpoint, count, seconds) for endpoint, (count, seconds) in totals.items()),
+            key = lambda total: -total[2],
+        )
+
+    def slowest(self, count = 5):
+        return sorted(self.requests(), key = lambda trace: -trace.total)[:count]
@@ -0,0 +1,100 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import shutil
+import tempfile
+import unittest
+from reap.api.trace import *
+from reap.api.base import ConnectionPool
+from reap.api.cache import Cache
+from reap.api.admin import Harvest
+from reap.api.base_tests import FakeHarvestTest
+
+class TestTrace(unittest.TestCase):
+    def test_endpoint(self):
+        self.assertEqual(
+            Trace('GET', 'people/1001/entries?from=20130101&to=20130131').endpoint,
+            'GET people/:id/entries',
+        )
+        self.assertEqual(Trace('POST', 'daily/update/12').endpoint, 'POST daily/update/:id')
+        self.assertEqual(Trace('GET', 'people/').endpoint, 'GET people/')
+
+    def test_phases(self):
+        stats = Stats()
+        with timed('format'):
+            pass
+        self.assertEqual(list(timed_map('models', str, [1, 2])), ['1', '2'])
+        # nothing is timed without a tracer.
+        self.assertEqual(stats.phases, {})
+        add_tracer(stats)
+        try:
+            with timed('format'):
+                pass
+            self.assertEqual(list(timed_map('models', str, [1, 2])), ['1', '2'])
+        finally:
+            remove_tracer(stats)
+        self.assertEqual(sorted(stats.phases), ['format', 'models'])
+
+class TestStats(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.fake.seed(people = 5, projects = 2, entries = 100)
+        self.path = tempfile.mkdtemp()
+        self.stats = Stats()
+        add_tracer(self.stats)
+
+    def tearDown(self):
+        remove_tracer(self.stats)
+        shutil.rmtree(self.path)
+        FakeHarvestTest.tearDown(self)
+
+    def test_requests(self):
+        hv = Harvest(
+            self.fake.base_uri,
+            self.fake.username,
+            self.fake.password,
+            pool = ConnectionPool(),
+            cache = Cache(self.path),
+        )
+        hv.limiter = None
+        hv.people()
+        hv.people()
+        hv.get_request('tasks/')
+        hv.get_request('tasks/')
+        list(hv.projects()[0].iter_entries())
+        self.fake.throttle(1)
+        hv.get_request('clients/')
+        traces = self.stats.requests()
+        self.assertEqual(len(traces), self.fake.count())
+        first = traces[0]
+        self.assertEqual(first.endpoint, 'GET account/who_am_i')
+        self.assertEqual(first.status, 200)
+        self.assertTrue(first.connect > 0 and first.wait > 0)
+        # later requests reuse the connection.
+        self.assertEqual(traces[1].connect, 0)
+        streamed = [t for t in traces if 'entries' in t.path][0]
+        self.assertTrue(streamed.bytes > 0)
+        throttled = [t for t in traces if t.status == 429][0]
+        self.assertEqual(throttled.attempt, 0)
+        caches = [t.cache for t in self.stats.traces]
+        self.assertEqual(caches.count('hit'), 1)
+        self.assertEqual(caches.count('shared'), 1)
+        self.assertTrue(self.stats.phases['json'] > 0)
+        self.assertTrue(self.stats.phases['models'] > 0)
+        endpoints = dict((e, count) for e, count, seconds in self.stats.endpoints())
+        self.assertEqual(endpoints['GET clients/'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,11 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import keyring
-import getpass
-import urllib2
-import reap.api.admin
-import datetime
+from reap.api.trace import timed
 from reap.commands.support import *
 
 PERSON_FORMAT = '''    {ind}   Name:           {person.first_name} {person.last_name}
@@ -42,16 +38,26 @@ PROJECT_FORMAT = '''    {ind}   Name:       {project.name}
         Notes:      {project.notes}
 '''
 
-def get_harvest():
+def get_harvest(args):
     info = load_info()
     if info:
         base_uri = info[0]
         username = info[1]
-        passwd = keyring.get_password(base_uri, username)
-        return reap.api.admin.Harvest(base_uri, username, passwd)
+        identity = load_identity(base_uri, username)
+        from reap.api.admin import Harvest
+        hv = Harvest(
+            base_uri,
+            username,
+            saved_password(base_uri, username),
+            cache = get_cache(args),
+            identity = identity,
+        )
+        if not identity:
+            save_identity(base_uri, username, hv.identity)
+        return hv
 
 def list_people(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
         contractors = []
         employees = []
@@ -60,17 +66,18 @@ def list_people(args):
                 contractors += [person]
             else:
                 employees += [person]
-        if len(employees) > 0:
-            print 'Employees:'
-            for emp in employees:
-                print str.format(PERSON_FORMAT, person = emp, ind = '-')
-        if len(contractors) > 0:
-            print 'Contractors:'
-            for contractor in contractors:
-                print str.format(PERSON_FORMAT, person = contractor, ind = '-')
+        with timed('format'):
+            if len(employees) > 0:
+                print 'Employees:'
+                for emp in employees:
+                    print str.format(PERSON_FORMAT, person = emp, ind = '-')
+            if len(contractors) > 0:
+                print 'Contractors:'
+                for contractor in contractors:
+                    print str.format(PERSON_FORMAT, person = contractor, ind = '-')
 
 def create_person(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
         person = hv.create_person(
             args.firstname,
@@ -92,17 +99,15 @@ def create_person(args):
             print 'Could not create person.'
 
 def delete_person(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
-        id = int(args.personid)
-        for person in hv.people():
-            if person.id == int(id):
-                person.delete()
-                print 'Person deleted.'
-                break
+        person = hv.people_index().get(args.personid)
+        if person:
+            person.delete()
+            print 'Person deleted.'
 
 def list_clients(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
         active = []
         inactive = []
@@ -111,17 +116,18 @@ def list_clients(args):
                 active += [client]
             else:
                 inactive += [client]
-        if len(active) > 0:
-            print 'Active Clients:'
-            for act in active:
-                print str.format(CLIENT_FORMAT, client = act, ind = '-')
-        if len(inactive) > 0:
-            print 'Inactive Clients:'
-            for inact in inactive:
-                print str.format(CLIENT_FORMAT, client = inact, ind = '-')
+        with timed('format'):
+            if len(active) > 0:
+                print 'Active Clients:'
+                for act in active:
+                    print str.format(CLIENT_FORMAT, client = act, ind = '-')
+            if len(inactive) > 0:
+                print 'Inactive Clients:'
+                for inact in inactive:
+                    print str.format(CLIENT_FORMAT, client = inact, ind = '-')
 
 def list_projects(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
         active = []
         inactive = []
@@ -130,17 +136,18 @@ def list_projects(args):
                 active += [proj]
             else:
                 inactive += [proj]
-        if len(active) > 0:
-            print 'Active Projects:'
-            for act in active:
-                print str.format(PROJECT_FORMAT, project = act, ind = '-')
-        if len(inactive) > 0:
-            print 'Inactive Projects:'
-            for inact in inactive:
-                print str.format(PROJECT_FORMAT, project = inact, ind = '-')
+        with timed('format'):
+            if len(active) > 0:
+                print 'Active Projects:'
+                for act in active:
+                    print str.format(PROJECT_FORMAT, project = act, ind = '-')
+            if len(inactive) > 0:
+                print 'Inactive Projects:'
+                for inact in inactive:
+                    print str.format(PROJECT_FORMAT, project = inact, ind = '-')
 
 def create_project(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
         project = hv.create_project(
             args.name,
@@ -154,10 +161,9 @@ def create_project(args):
             print str.format(PROJECT_FORMAT, project = project, ind = ' ')
 
 def delete_project(args):
-    hv = get_harvest()
+    hv = get_harvest(args)
     if hv:
-        for project in hv.projects():
-            if project.id == args.projectid:
-                project.delete()
-                print 'Project Deleted.'
-                break
+        project = hv.projects_index().get(args.projectid)
+        if project:
+            project.delete()
+            print 'Project Deleted.'
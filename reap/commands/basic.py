@@ -12,11 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import keyring
-import getpass
-import urllib2
 import re
-import reap.api.timesheet
+import os
+import csv
+import json
+import hashlib
+from reap.api.errors import ReapError, TransportError
+from reap.api.trace import timed
 from reap.commands.support import *
 
 STATUS_TASK_FORMAT = '''{indicator}   Project:    {entry.project_name}
@@ -26,25 +28,58 @@ STATUS_TASK_FORMAT = '''{indicator}   Project:    {entry.project_name}
     Time:       {hours}:{minutes:02d}
 '''
 
-def get_timesheet():
+# A search without any of these is plain text, and can use the index.
+REGEX_CHARACTERS = set('.^$*+?{}[]\\|()')
+
+# Columns read from each row of an import file.
+IMPORT_FIELDS = ('project_id', 'task_id', 'hours', 'notes', 'spent_at')
+
+IMPORT_SUMMARY_FORMAT = '''Created {created} entries, {failed} failed, {skipped} already imported.'''
+
+SYNC_CHANGE_FORMAT = '''{indicator}   Change:     {change.kind} entry {change.entry_id}
+    Key:        {change.key}
+    Details:    {details}
+'''
+
+# Commands that change the timesheet, and so leave changes to sync.
+SYNCED_COMMANDS = ('start', 'stop', 'create', 'delete', 'update')
+
+def get_timesheet(args):
+    # The daemon runs commands with its own, already logged in, timesheet.
+    if getattr(args, 'timesheet', None):
+        return args.timesheet
     info = load_info()
     if info:
         base_uri = info[0]
         username = info[1]
-        passwd = keyring.get_password(base_uri, username)
-        return reap.api.timesheet.Timesheet(base_uri, username, passwd)
+        identity = load_identity(base_uri, username)
+        from reap.api.timesheet import Timesheet
+        ts = Timesheet(
+            base_uri,
+            username,
+            saved_password(base_uri, username),
+            cache = get_cache(args),
+            identity = identity,
+            journal = get_journal(args, base_uri, username),
+        )
+        if not identity:
+            save_identity(base_uri, username, ts.identity)
+        return ts
 
 def get_entry(ts, entryid):
-    entries = ts.entries()
+    entries = ts.entries_index()
     try:
         id = int(entryid)
     except ValueError:
         # the entry is not an ID.
-        regex = re.compile(entryid, flags = re.IGNORECASE)
-        matches = []
-        for entry in entries:
-            if regex.search(entry.task_name):
-                matches += [entry]
+        if REGEX_CHARACTERS.isdisjoint(entryid):
+            matches = entries.search(entryid)
+        else:
+            regex = re.compile(entryid, flags = re.IGNORECASE)
+            matches = [
+                entry for entry in entries.records
+                if regex.search(entry.task_name)
+            ]
         if len(matches) is 1:
             return matches[0]
         elif len(matches) >= 2:
@@ -52,26 +87,83 @@ def get_entry(ts, entryid):
             return None
     else:
         # the entry is an ID.
-        for entry in entries:
-            if entry.id == id:
-                return entry
+        if id < 0 and ts.journal:
+            # made offline, and maybe sent since.
+            return entries.get(id) or entries.get(ts.journal.remote_id(id) or id)
+        return entries.get(id)
+
+def get_task(ts, project_id, task_id):
+    '''Finds a task on one of the timesheet's projects, or returns None.'''
+    project = ts.projects_index().get(project_id)
+    if project:
+        return project.tasks_index().get(task_id)
+
+def parse_hours(text):
+    '''Reads hours given as HH:MM or as a decimal number.'''
+    if ':' in text:
+        split = text.split(':')
+        hours = float(split[0])
+        minutes = float(split[1])
+        return hours + minutes / 60
+    return float(text)
+
+def read_rows(path, format = None):
+    '''Reads the rows of a CSV file with a header line, or a JSON list.'''
+    if not format:
+        format = 'json' if path.lower().endswith('.json') else 'csv'
+    with open(path, 'rb') as file:
+        if format == 'json':
+            rows = json.load(file)
+        else:
+            rows = [row for row in csv.DictReader(file)]
+    return [
+        dict(
+            (field, row[field]) for field in IMPORT_FIELDS
+            if row.get(field) not in (None, '')
+        )
+        for row in rows
+    ]
+
+def row_key(row):
+    return hashlib.sha1(json.dumps(row, sort_keys = True)).hexdigest()
+
+def load_progress(path):
+    '''Returns the rows an earlier import created, as (key, occurrence) pairs.'''
+    finished = set()
+    if os.path.exists(path):
+        with open(path, 'r') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # cut short when that import was interrupted.
+                    continue
+                finished.add((record['key'], record['occurrence']))
+    return finished
 
 def login(args):
+    import getpass
+    import keyring
+    from reap.api.timesheet import Timesheet
     password = getpass.getpass()
     try:
-        ts = reap.api.timesheet.Timesheet(args.baseuri, args.username, password)
+        ts = Timesheet(args.baseuri, args.username, password)
+    except TransportError:
+        print 'Unable to communicate. Check information and try again.'
+        return
     except ValueError:
         print 'Invalid Credentials.'
         return
-    except urllib2.URLError:
-        print 'Unable to communicate. Check information and try again.'
-        return
     keyring.set_password(args.baseuri, args.username, password)
-    save_info(args.baseuri, args.username)
+    if getattr(args, 'profile', None):
+        save_profile(args.profile, args.baseuri, args.username)
+    else:
+        save_info(args.baseuri, args.username)
+    save_identity(args.baseuri, args.username, ts.identity)
     print 'You are now logged in.'
 
 def status(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         total = 0
         running_entry = None
@@ -82,32 +174,33 @@ def status(args):
             else:
                 stopped_entries += [entry]
             total += entry.hours
-        if running_entry:
-            print 'Currently Running Timer:'
-            print str.format(
-                STATUS_TASK_FORMAT,
-                entry = running_entry,
-                hours = int(running_entry.hours),
-                minutes = int(running_entry.hours % 1 * 60),
-                indicator = ' '
-            )
-        if len(stopped_entries) > 0:
-            print 'Stopped Entries:'
-            for entry in stopped_entries:
+        with timed('format'):
+            if running_entry:
+                print 'Currently Running Timer:'
                 print str.format(
                     STATUS_TASK_FORMAT,
-                    entry = entry,
-                    hours = int(entry.hours),
-                    minutes = int(entry.hours % 1 * 60),
-                    indicator = '-'
+                    entry = running_entry,
+                    hours = int(running_entry.hours),
+                    minutes = int(running_entry.hours % 1 * 60),
+                    indicator = ' '
                 )
-        if total:
-            total_hours = int(total)
-            total_minutes = int(total % 1 * 60)
-            print str.format('Total Daily Hours: {}:{:02d}\n', total_hours, total_minutes)
+            if len(stopped_entries) > 0:
+                print 'Stopped Entries:'
+                for entry in stopped_entries:
+                    print str.format(
+                        STATUS_TASK_FORMAT,
+                        entry = entry,
+                        hours = int(entry.hours),
+                        minutes = int(entry.hours % 1 * 60),
+                        indicator = '-'
+                    )
+            if total:
+                total_hours = int(total)
+                total_minutes = int(total % 1 * 60)
+                print str.format('Total Daily Hours: {}:{:02d}\n', total_hours, total_minutes)
 
 def start(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         found = get_entry(ts, args.entryid)
         if found:
@@ -120,7 +213,7 @@ def start(args):
             print 'No entry with that ID or matching that regex.'
 
 def stop(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         found = None
         for entry in ts.entries():
@@ -134,43 +227,40 @@ def stop(args):
             print 'No timers to stop.'
 
 def list(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
-        print 'Projects and Tasks:'
-        for proj in ts.projects():
-            print '    - ' + proj.name + ':'
-            for task in proj.tasks():
-                print str.format('        - {} ({} {})', task.name, proj.id, task.id)
-            print ''
+        projects = ts.projects()
+        with timed('format'):
+            print 'Projects and Tasks:'
+            for proj in projects:
+                print '    - ' + proj.name + ':'
+                for task in proj.tasks():
+                    print str.format('        - {} ({} {})', task.name, proj.id, task.id)
+                print ''
 
 def create(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         dec_time = 0.0
         if args.time:
-            split = args.time.split(':')
-            hours = float(split[0])
-            minutes = float(split[1])
-            dec_time = hours + minutes / 60
+            dec_time = parse_hours(args.time)
         notes = args.notes or ''
-        for proj in ts.projects():
-            if proj.id == int(args.projectid):
-                for task in proj.tasks():
-                    if task.id == int(args.taskid):
-                        entry = ts.create_entry(proj.id, task.id, hours = dec_time, notes = notes)
-                        print 'Added Entry:'
-                        print str.format(
-                            STATUS_TASK_FORMAT,
-                            entry = entry,
-                            hours = int(entry.hours),
-                            minutes = int(entry.hours % 1 * 60),
-                            indicator = ' '
-                        )
-                        return
+        task = get_task(ts, args.projectid, args.taskid)
+        if task:
+            entry = ts.create_entry(task.project.id, task.id, hours = dec_time, notes = notes)
+            print 'Added Entry:'
+            print str.format(
+                STATUS_TASK_FORMAT,
+                entry = entry,
+                hours = int(entry.hours),
+                minutes = int(entry.hours % 1 * 60),
+                indicator = ' '
+            )
+            return
         print 'No project/task found with those IDs.'
 
 def delete(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         found = get_entry(ts, args.entryid)
         if found:
@@ -180,7 +270,7 @@ def delete(args):
             print 'No entry with that ID.'
 
 def update(args):
-    ts = get_timesheet()
+    ts = get_timesheet(args)
     if ts:
         found = get_entry(ts, args.entryid)
         if found:
@@ -196,21 +286,12 @@ def update(args):
                     notes = args.notes
             # check for time
             if args.time:
-                split = args.time.split(':')
-                hours = float(split[0])
-                minutes = float(split[1])
-                time = hours + minutes / 60
+                time = parse_hours(args.time)
                 if args.append:
                     time = found.hours + time
             # check for task.
             if args.task:
-                found_task = None
-                for proj in ts.projects():
-                    if proj.id == int(args.task[0]):
-                        for task in proj.tasks():
-                            if task.id == int(args.task[1]):
-                                found_task = task
-                                break
+                found_task = get_task(ts, args.task[0], args.task[1])
                 if found_task:
                     proj_id = args.task[0]
                     task_id = args.task[1]
@@ -229,3 +310,98 @@ def update(args):
         else:
             print 'No entry with that ID.'
 
+def import_entries(args):
+    ts = get_timesheet(args)
+    if ts:
+        progress = args.progress or args.file + '.progress'
+        finished = load_progress(progress)
+        pending = []
+        failed = 0
+        skipped = 0
+        seen = {}
+        for number, row in enumerate(read_rows(args.file, args.format), 1):
+            # rows are known by their content, and identical rows by how many
+            # 	came before them, so adding or removing rows elsewhere in the
+            # 	file does not make imported ones look new.
+            key = row_key(row)
+            occurrence = seen[key] = seen.get(key, 0) + 1
+            if (key, occurrence) in finished:
+                skipped += 1
+                continue
+            try:
+                if 'hours' in row:
+                    row = dict(row, hours = parse_hours(unicode(row['hours'])))
+            except ValueError:
+                print str.format('Row {}: invalid hours {}', number, row['hours'])
+                failed += 1
+                continue
+            pending.append((number, key, occurrence, row))
+        with open(progress, 'a') as log:
+            def done(result):
+                number, key, occurrence, row = pending[result.index]
+                if result.error:
+                    print str.format('Row {}: {}', number, result.error)
+                    return
+                log.write(json.dumps({
+                    'row': number,
+                    'key': key,
+                    'occurrence': occurrence,
+                    'id': result.entry.id,
+                }) + '\n')
+                log.flush()
+                print str.format('Row {}: created entry {}', number, result.entry.id)
+            results = ts.create_entries(
+                [row for number, key, occurrence, row in pending],
+                args.concurrency,
+                done,
+            )
+        failed += len([result for result in results if result.error])
+        print str.format(
+            IMPORT_SUMMARY_FORMAT,
+            created = len(results) - len([r for r in results if r.error]),
+            failed = failed,
+            skipped = skipped,
+        )
+        if failed:
+            print 'Fix the failed rows, then run the same import again to retry them.'
+
+def sync(args):
+    ts = get_timesheet(args)
+    if ts:
+        for key in args.drop or []:
+            if not ts.journal.drop(key):
+                print 'No unsent change with key ' + key
+        for key in args.retry or []:
+            if not ts.journal.retry(key):
+                print 'No conflicting change with key ' + key
+        try:
+            sent = ts.sync()
+        except ReapError as e:
+            if args.quiet:
+                return
+            print 'Unable to talk to Harvest, changes kept for later: ' + str(e)
+        else:
+            if args.quiet:
+                return
+            print str.format('Sent {} changes.', sent)
+        pending = ts.journal.pending()
+        conflicts = ts.journal.conflicts()
+        if pending:
+            print 'Waiting To Be Sent:'
+            for change in pending:
+                print str.format(
+                    SYNC_CHANGE_FORMAT,
+                    change = change,
+                    details = json.dumps(change.data, sort_keys = True),
+                    indicator = ' ',
+                )
+        if conflicts:
+            print 'Refused By Harvest:'
+            for change in conflicts:
+                print str.format(
+                    SYNC_CHANGE_FORMAT,
+                    change = change,
+                    details = change.error,
+                    indicator = '!',
+                )
+            print 'Fix these in Harvest, then sync with --retry KEY to send one again or --drop KEY to forget it.'
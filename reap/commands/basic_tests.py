@@ -0,0 +1,149 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import unittest
+import StringIO
+from reap.api.journal import Journal
+from reap.api.timesheet import Timesheet
+from reap.api.base_tests import FakeHarvestTest
+from reap.commands.basic import *
+
+class TestImport(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.ts.limiter = None
+        self.project = self.fake.projects[0]['id']
+        self.task = self.fake.tasks[0]['id']
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        FakeHarvestTest.tearDown(self)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def run_import(self, path):
+        args = argparse.Namespace(
+            file = path,
+            format = None,
+            progress = None,
+            concurrency = 2,
+            timesheet = self.ts,
+        )
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            import_entries(args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_resume(self):
+        rows = [
+            'project_id,task_id,hours,notes,spent_at',
+            '%d,%d,1:30,First,2013-02-01' % (self.project, self.task),
+            '%d,%d,abc,Second,2013-02-01' % (self.project, self.task),
+            '%d,999,2,Third,2013-02-02' % self.project,
+        ]
+        path = self.write('entries.csv', '\n'.join(rows) + '\n')
+        output = self.run_import(path)
+        self.assertTrue('Created 1 entries, 2 failed, 0 already imported.' in output)
+        self.assertEqual(self.fake.count('POST /daily/add'), 1)
+        self.assertEqual(self.fake.entries[-1]['hours'], 1.5)
+        rows[2] = rows[2].replace('abc', '0.5')
+        rows[3] = rows[3].replace('999', str(self.task))
+        self.write('entries.csv', '\n'.join(rows) + '\n')
+        output = self.run_import(path)
+        self.assertTrue('Created 2 entries, 0 failed, 1 already imported.' in output)
+        self.assertEqual(self.fake.count('POST /daily/add'), 3)
+
+    def test_rows_moved(self):
+        row = '%d,%d,1,Same,2013-02-01' % (self.project, self.task)
+        rows = ['project_id,task_id,hours,notes,spent_at', row, row]
+        path = self.write('entries.csv', '\n'.join(rows) + '\n')
+        self.assertTrue('Created 2 entries' in self.run_import(path))
+        # rows added ahead of imported ones, including another copy of them.
+        rows[1:1] = ['%d,%d,3,New,2013-02-03' % (self.project, self.task), row]
+        self.write('entries.csv', '\n'.join(rows) + '\n')
+        output = self.run_import(path)
+        self.assertTrue('Created 2 entries, 0 failed, 2 already imported.' in output)
+        self.assertEqual(self.fake.count('POST /daily/add'), 4)
+
+    def test_json(self):
+        path = self.write('entries.json', str.format(
+            '[{{"project_id": {0}, "task_id": {1}, "hours": 2}}]',
+            self.project,
+            self.task,
+        ))
+        self.assertTrue('Created 1 entries' in self.run_import(path))
+        self.assertEqual(self.fake.entries[-1]['hours'], 2.0)
+
+class TestSync(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal('account', os.path.join(self.dir, 'journal.db'))
+        self.ts = Timesheet(
+            self.fake.base_uri,
+            self.fake.username,
+            self.fake.password,
+            journal = self.journal,
+        )
+        self.ts.limiter = None
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.dir)
+        FakeHarvestTest.tearDown(self)
+
+    def run_command(self, command, **fields):
+        args = argparse.Namespace(timesheet = self.ts, **fields)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            command(args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_conflict(self):
+        gone = self.fake.entries[0]
+        self.run_command(update, entryid = str(gone['id']), notes = 'Memo', time = None, task = None, append = False)
+        self.run_command(create, projectid = self.fake.projects[0]['id'], taskid = self.fake.tasks[0]['id'], time = '1:00', notes = 'TPS')
+        self.assertEqual(self.fake.count('POST /daily/update'), 0)
+        # deleted in Harvest while the update waited.
+        self.fake.entries.remove(gone)
+        output = self.run_command(sync, drop = None, retry = None, quiet = False)
+        self.assertTrue('Sent 1 changes.' in output)
+        self.assertTrue('Refused By Harvest:' in output)
+        self.assertEqual(self.fake.entries[-1]['notes'], 'TPS')
+        conflict, = self.journal.conflicts()
+        self.assertTrue('Key:        ' + conflict.key in output)
+        output = self.run_command(sync, drop = [conflict.key], retry = None, quiet = False)
+        self.assertEqual(output, 'Sent 0 changes.\n')
+        self.assertEqual(self.journal.changes(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
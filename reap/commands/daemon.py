@@ -0,0 +1,263 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+'''An optional background process that runs reap commands for the CLI.
+
+The daemon keeps one logged in Timesheet, with its warm connection pool and
+	a daily snapshot it refreshes in the background. The reap script sends
+	it each command over a Unix socket, and runs the command itself when no
+	daemon is listening.'''
+
+import os
+import os.path
+import sys
+import json
+import errno
+import socket
+import argparse
+import threading
+import StringIO
+import SocketServer
+import exceptions
+from reap.api.errors import ReapError, LoginError, TransportError
+import reap.commands.basic
+
+SOCKET_FILE = os.path.expanduser('~/.reap/daemon.sock')
+
+# Seconds between background refreshes of the daily snapshot.
+REFRESH_INTERVAL = 60
+
+# Seconds to wait for a daemon to accept before running the command directly.
+CONNECT_TIMEOUT = 0.5
+
+# Commands the daemon runs on behalf of the reap script.
+COMMANDS = ('status', 'start', 'stop', 'list', 'create', 'delete', 'update')
+
+def _connect(path):
+    '''Returns a socket connected to the daemon at path, or None.'''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    sock.settimeout(None)
+    return sock
+
+def send(command, fields = None, path = SOCKET_FILE):
+    '''Sends one command to the daemon and returns its response.
+
+    Returns None if no daemon is listening at path. Once the command has been
+    	sent it may have run, so losing the daemon after that raises a
+    	TransportError rather than returning None.'''
+    sock = _connect(path)
+    if sock is None:
+        return None
+    try:
+        sock.sendall(json.dumps({'command': command, 'args': fields or {}}) + '\n')
+        return json.loads(sock.makefile('rb').readline())
+    except (socket.error, ValueError) as e:
+        raise TransportError('Lost the reap daemon: ' + str(e))
+    finally:
+        sock.close()
+
+def call(args, path = SOCKET_FILE):
+    '''Runs a parsed reap command in the daemon, if one is running.
+
+    Prints the command's output and re-raises its errors. Returns False
+    	without doing anything when the command should run directly instead,
+    	including when the daemon's timesheet was not set up with the same
+    	--offline and --no-cache options.'''
+    command = args.func.__name__
+    if command not in COMMANDS or getattr(args, 'no_daemon', False):
+        return False
+    if getattr(args, 'stats', False):
+        # the requests would be made, and traced, in the daemon.
+        return False
+    fields = dict(
+        (name, value) for name, value in vars(args).iteritems()
+        if name != 'func'
+    )
+    response = send(command, fields, path)
+    if response is None:
+        return False
+    error = response['error']
+    if error and error['type'] == 'declined':
+        return False
+    sys.stdout.write(response['output'].encode('utf-8'))
+    if error:
+        if error['type'] == 'login':
+            raise LoginError(error['message'], error.get('base_uri'), error.get('username'))
+        if error['type'] == 'error':
+            # the built-in exception the command raised, where it was one.
+            cls = getattr(exceptions, error['name'], None)
+            if isinstance(cls, type) and issubclass(cls, Exception):
+                raise cls(error['message'])
+            raise ReapError(error['name'] + ': ' + error['message'])
+        raise ReapError(error['message'])
+    return True
+
+class _Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        response = self.server.run(request['command'], request['args'])
+        self.wfile.write(json.dumps(response) + '\n')
+
+class Daemon(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''Serves reap commands for one Timesheet over a Unix socket.
+
+    Commands run one at a time, so they see each other's writes in order.
+    	The socket is only accessible to the user running the daemon.'''
+    daemon_threads = True
+
+    def __init__(self, ts, path = SOCKET_FILE, refresh_interval = REFRESH_INTERVAL):
+        if os.path.exists(path):
+            if send('ping', path = path) is not None:
+                raise ReapError('A reap daemon is already running.')
+            # left behind by a daemon that did not shut down cleanly.
+            os.remove(path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        umask = os.umask(077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+        self.ts = ts
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.__stopped = threading.Event()
+        self.__changed = threading.Event()
+
+    def serve(self):
+        '''Serves commands until shutdown is called or stop is sent.'''
+        refresher = threading.Thread(target = self.__refresh_loop)
+        refresher.daemon = True
+        refresher.start()
+        syncer = threading.Thread(target = self.__sync_loop)
+        syncer.daemon = True
+        syncer.start()
+        try:
+            self.serve_forever(0.1)
+        finally:
+            self.__stopped.set()
+            self.__changed.set()
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def run(self, command, fields):
+        '''Runs one command and returns its output and any error.'''
+        if command == 'ping':
+            return {'output': '', 'error': None}
+        if command == 'shutdown':
+            # shutdown waits for the serving loop, so it can not run in it.
+            threading.Thread(target = self.shutdown).start()
+            return {'output': 'Reap daemon stopped.\n', 'error': None}
+        if command not in COMMANDS:
+            return {'output': '', 'error': {
+                'type': 'reap',
+                'message': 'The daemon does not run ' + command,
+            }}
+        offline = self.ts.journal is not None
+        cached = self.ts.cache is not None
+        if bool(fields.get('offline')) != offline or bool(fields.get('no_cache')) == cached:
+            # the client asked for a timesheet unlike this one.
+            return {'output': '', 'error': {
+                'type': 'declined',
+                'message': 'The daemon was started with other options',
+            }}
+        args = argparse.Namespace(**fields)
+        args.timesheet = self.ts
+        output = StringIO.StringIO()
+        error = None
+        with self.lock:
+            stdout = sys.stdout
+            sys.stdout = output
+            try:
+                if getattr(args, 'refresh', False):
+                    self.ts.refresh()
+                getattr(reap.commands.basic, command)(args)
+            except LoginError as e:
+                error = {
+                    'type': 'login',
+                    'message': str(e),
+                    'base_uri': e.base_uri,
+                    'username': e.username,
+                }
+            except ReapError as e:
+                error = {'type': 'reap', 'message': str(e)}
+            except Exception as e:
+                # sent back for the client to raise, rather than lost here.
+                error = {'type': 'error', 'name': type(e).__name__, 'message': str(e)}
+            finally:
+                sys.stdout = stdout
+        if self.ts.journal:
+            self.__changed.set()
+        return {'output': output.getvalue(), 'error': error}
+
+    def __refresh_loop(self):
+        while not self.__stopped.wait(self.refresh_interval):
+            with self.lock:
+                self.ts.refresh()
+                try:
+                    self.ts.daily()
+                except ReapError:
+                    # tried again on the next command or refresh.
+                    pass
+
+    def __sync_loop(self):
+        # sends journaled changes soon after each command, and retries them
+        # 	every refresh interval while Harvest can not be reached.
+        while not self.__stopped.is_set():
+            self.__changed.wait(self.refresh_interval)
+            self.__changed.clear()
+            if not self.ts.journal:
+                continue
+            # sending rewrites the journal and snapshot commands work on.
+            with self.lock:
+                try:
+                    sent = self.ts.sync()
+                except ReapError:
+                    continue
+                if sent:
+                    # pick up the ids Harvest gave entries created offline.
+                    self.ts.refresh()
+
+def daemon(args):
+    if args.stop:
+        response = send('shutdown')
+        print response['output'].strip() if response else 'No reap daemon is running.'
+        return
+    ts = reap.commands.basic.get_timesheet(args)
+    if ts:
+        ts.daily()
+        server = Daemon(ts)
+        print 'Reap daemon listening on ' + server.path
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,129 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import unittest
+import StringIO
+from reap.api.base import ReapError
+from reap.api.journal import Journal
+from reap.api.timesheet import Timesheet
+from reap.api.base_tests import FakeHarvestTest
+from reap.commands.basic import status, start, update, login
+from reap.commands.daemon import *
+
+class TestDaemon(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'daemon.sock')
+        self.ts = Timesheet(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.ts.limiter = None
+        self.server = Daemon(self.ts, self.path)
+        self.thread = threading.Thread(target = self.server.serve)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+        FakeHarvestTest.tearDown(self)
+
+    def call(self, func, **fields):
+        # the daemon's timesheet has no cache.
+        fields.setdefault('no_cache', True)
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            handled = call(argparse.Namespace(func = func, **fields), self.path)
+            return handled, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_status(self):
+        self.fake.reset_counts()
+        for i in range(3):
+            handled, output = self.call(status)
+            self.assertTrue(handled)
+            self.assertTrue('Task:       Admin' in output)
+        # the daemon's snapshot answers every status after the first.
+        self.assertEqual(self.fake.count('GET /daily'), 1)
+
+    def test_write(self):
+        entry = self.fake.entries[0]
+        handled, output = self.call(start, entryid = str(entry['id']))
+        self.assertEqual(output, 'Entry timer started.\n')
+        handled, output = self.call(status)
+        self.assertTrue('Currently Running Timer:' in output)
+
+    def test_errors(self):
+        entry = self.fake.entries[0]
+        self.assertRaises(ValueError, self.call, update,
+        	entryid = str(entry['id']), notes = None, time = 'abc', task = None, append = False)
+        self.assertRaises(ReapError, self.call, start, entryid = '[unclosed')
+        # the daemon is still serving.
+        self.assertTrue(self.call(status)[0])
+
+    def test_direct(self):
+        self.assertEqual(self.call(login), (False, ''))
+        self.assertEqual(
+            self.call(status, no_daemon = True),
+            (False, ''),
+        )
+        missing = os.path.join(self.dir, 'missing.sock')
+        self.assertFalse(call(argparse.Namespace(func = status), missing))
+
+    def test_offline(self):
+        journal = Journal('account', os.path.join(self.dir, 'journal.db'))
+        self.ts.journal = journal
+        try:
+            entry = self.fake.entries[0]
+            handled, output = self.call(start, entryid = str(entry['id']), offline = True)
+            self.assertEqual(output, 'Entry timer started.\n')
+            # sent by the daemon in the background, soon after.
+            for i in range(100):
+                if not journal.changes():
+                    break
+                time.sleep(0.05)
+            self.assertEqual(journal.changes(), [])
+            self.assertTrue(entry.get('timer_started_at'))
+        finally:
+            self.ts.journal = None
+            journal.close()
+
+    def test_other_options(self):
+        # run directly, rather than online by a daemon started without them.
+        self.assertEqual(self.call(status, offline = True), (False, ''))
+        self.assertEqual(self.call(status, no_cache = False), (False, ''))
+        self.assertTrue(self.call(status)[0])
+
+    def test_one_daemon(self):
+        self.assertRaises(ReapError, Daemon, self.ts, self.path)
+
+    def test_shutdown(self):
+        self.assertEqual(send('shutdown', path = self.path)['error'], None)
+        self.thread.join()
+        self.server.server_close()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(send('ping', path = self.path), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,11 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import keyring
-import getpass
-import urllib2
-import reap.api.admin
 import datetime
+from reap.api.fetch import fetch_all
+from reap.api.trace import timed
 from reap.commands.support import *
 
 REPORT_HEADER = '''{} Report:
@@ -25,7 +23,7 @@ REPORT_HEADER = '''{} Report:
     Results:'''
 
 HOURS_REPORT_FORMAT = '''    -   Name:           {person.first_name} {person.last_name}
-        ID:             {person.id}
+{account}        ID:             {person.id}
         Total Hours:    {total}
         Billable:       {billable}
         Non-billable:   {unbillable}
@@ -35,49 +33,342 @@ HOURS_REPORT_FORMAT = '''    -   Name:           {person.first_name} {person.las
 
 PROJECTS_REPORT_HEADING_FORMAT = \
 '''    -   Name:           {person.first_name} {person.last_name}
-        Projects:'''
+{account}        Projects:'''
 
 PROJECTS_REPORT_BODY_FORMAT = '''        -   Name:       {name}
             Hours:      {hours}'''
 
 TASKS_HEADER_FORMAT = '''    -   Name:   {person.first_name} {person.last_name}
-        Tasks:'''
+{account}        Tasks:'''
 
 PROJECT_BY_TASKS_HEADER_FORMAT = '''    - Name:   {project.name}
-      Tasks:'''
+{account}      Tasks:'''
 
 TASKS_BODY_FORMAT = '''        - Task:   {name}
           Hours:  {hours}'''
 
-def get_harvest():
+# Entries a person logs on an average day, for estimating response sizes.
+ENTRIES_PER_PERSON_DAY = 2.0
+
+# How many entries a request costs about as much time as receiving, so plans
+# 	are weighed by both.
+REQUEST_COST_ENTRIES = 100
+
+PLAN_FORMAT = '''Fetch Plan:
+{account}    Chosen:     {chosen}'''
+
+PLAN_OTHER_FORMAT = '''    Instead of: {}'''
+
+PLAN_KEEP_FORMAT = '''    Keeping:    entries of the {count} requested {owners}'''
+
+# The account of a result, in a report across several; the first lines up
+# 	with the fields of person results, the second with those of projects.
+ACCOUNT_FORMAT = '''        Account:        {}
+'''
+
+PROJECT_ACCOUNT_FORMAT = '''      Account: {}
+'''
+
+PLAN_ACCOUNT_FORMAT = '''    Account:    {}
+'''
+
+def account_names(value):
+    '''Parses the comma separated profile names given to --accounts.'''
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def account_line(name, format = ACCOUNT_FORMAT):
+    '''Formats the account of a result, or nothing outside multi account reports.'''
+    return str.format(format, name) if name else ''
+
+def open_harvest(args, base_uri, username, pool = None):
+    identity = load_identity(base_uri, username)
+    from reap.api.admin import Harvest
+    hv = Harvest(
+        base_uri,
+        username,
+        saved_password(base_uri, username),
+        pool = pool,
+        cache = get_cache(args),
+        identity = identity,
+    )
+    if not identity:
+        save_identity(base_uri, username, hv.identity)
+    return hv
+
+def get_harvest(args):
     info = load_info()
     if info:
-        base_uri = info[0]
-        username = info[1]
-        passwd = keyring.get_password(base_uri, username)
-        return reap.api.admin.Harvest(base_uri, username, passwd)
+        return open_harvest(args, info[0], info[1])
+
+def get_accounts(args):
+    '''Returns a (name, Harvest) pair for each account a report covers.
+
+    Without --accounts that is the logged in account, with no name. With it,
+    	each named profile is logged in to at once, with a connection pool of
+    	its own; each account's base URI already has its own rate limit.
+    	Returns an empty list if any account can not be used.'''
+    names = getattr(args, 'accounts', None)
+    if not names:
+        hv = get_harvest(args)
+        return [(None, hv)] if hv else []
+    profiles = load_profiles()
+    missing = [name for name in names if not profiles.has_key(name)]
+    if missing:
+        print 'No such profile(s): ' + ', '.join(missing) + '. Save one with reap login --profile NAME.'
+        return []
+    from reap.api.base import ConnectionPool
+    def login(name):
+        profile = profiles[name]
+        return (name, open_harvest(args, profile['base_uri'], profile['username'], ConnectionPool()))
+    return fetch_all(login, names, len(names))
+
+def each_account(accounts, collect):
+    '''Calls collect(hv) for every account at once.
+
+    Returns (name, result) pairs in the order of accounts, leaving out those
+    	collect returned None for.'''
+    results = fetch_all(lambda account: collect(account[1]), accounts, len(accounts))
+    return [
+        (name, result)
+        for (name, hv), result in zip(accounts, results)
+        if result is not None
+    ]
 
 def get_people(hv, ids):
-    people = []
-    all_people = hv.people()
-    for pid in set(ids):
-        id = int(pid)
-        for p in all_people:
-            if p.id == id:
-                people += [p]
-                break
-    return people
+    return hv.people_index().get_all(ids)
 
 def get_projects(hv, ids):
-    projects = []
-    all_projects = hv.projects()
-    for pid in set(ids):
-        id = int(pid)
-        for p in all_projects:
-            if p.id == id:
-                projects += [p]
-                break
-    return projects
+    return hv.projects_index().get_all(ids)
+
+def get_store(hv, args):
+    if getattr(args, 'local', False):
+        from reap.api.store import EntryStore
+        return EntryStore(hv)
+
+def get_entries(owners, start, end, concurrency, store = None, full = False):
+    '''Fetches entries for each person or project, in parallel.
+
+    With a store, owners are synced into it (fetching only what changed,
+    	or everything again if full is set) and their entries read back from
+    	it instead. Returns an EntryTable of the
+    	entries of every owner. Entries are streamed into the table as they
+    	are decoded, so no owner's full response is held in memory.'''
+    # NumPy, if installed, is slow to import, so only load it for a report.
+    from reap.api.table import EntryTable
+    if store:
+        fetch_all(
+            lambda owner: store.sync(owner, start, end, full),
+            owners,
+            concurrency,
+        )
+        tables = [EntryTable(store.entries(owner, start, end)) for owner in owners]
+    else:
+        tables = fetch_all(
+            lambda owner: EntryTable(owner.iter_entries(start = start, end = end)),
+            owners,
+            concurrency,
+        )
+    table = EntryTable()
+    for owner_table in tables:
+        table.merge(owner_table)
+    return table
+
+class Plan(object):
+    '''One way of fetching the entries a report needs.
+
+    Entries are fetched for each of owners, all people or all projects. If
+    	keep is set to a (column, ids) pair, only entries with one of those
+    	ids in that column are reported on. per_day is how many entries each
+    	owner is expected to have a day, for estimating the responses' size,
+    	or None if that isn't known.'''
+    def __init__(self, by, owners, start, end, keep = None,
+    	per_day = ENTRIES_PER_PERSON_DAY):
+        self.by = by
+        self.owners = owners
+        self.keep = keep
+        self.requests = sum(count_requests(owner, start, end) for owner in owners)
+        self.entries = None
+        if per_day is not None:
+            self.entries = int(per_day * sum(
+                count_days(owner, start, end) for owner in owners
+            ))
+
+    @property
+    def cost(self):
+        return self.requests * REQUEST_COST_ENTRIES + (self.entries or 0)
+
+    def describe(self):
+        description = str.format(
+            'by {}, {} {}, about {} requests',
+            self.by,
+            len(self.owners),
+            'people' if self.by == 'person' else 'projects',
+            self.requests,
+        )
+        if self.entries is not None:
+            description += str.format(' and {} entries', self.entries)
+        return description
+
+def record_span(project):
+    '''Returns the (first, last) days a project's record hints cover, or None.
+
+    The hints may be as old as the cached project list, so active projects
+    	are taken to have entries up to today.'''
+    if not project.earliest_record:
+        return None
+    latest = project.latest_record
+    if project.active:
+        latest = datetime.datetime.today()
+    return (project.earliest_record, latest)
+
+def count_requests(owner, start, end):
+    '''Estimates how many requests fetching an owner's entries takes.'''
+    from reap.api.admin import Project, shard_range
+    span = None
+    if isinstance(owner, Project):
+        span = (owner.earliest_record, owner.latest_record)
+    return len(shard_range(start, end, span))
+
+def count_days(owner, start, end):
+    '''Counts the days from start to end an owner could have entries on.'''
+    from reap.api.admin import Project
+    first, last = start.date(), end.date()
+    if isinstance(owner, Project):
+        span = record_span(owner)
+        if not span:
+            return 0
+        first = max(first, span[0].date())
+        last = min(last, span[1].date())
+    return max(0, (last - first).days + 1)
+
+def may_have_entries(project, start, end):
+    '''Tells from its record hints whether a project has entries in range.'''
+    return count_days(project, start, end) > 0
+
+def project_rate(people, projects, start, end):
+    '''Estimates the entries a project has a day, in an account with people.
+
+    The people's entries are taken to be spread evenly over the projects
+    	that may have entries in range.'''
+    active = [p for p in projects if may_have_entries(p, start, end)]
+    return ENTRIES_PER_PERSON_DAY * len(people) / max(1, len(active))
+
+def plan_entries(hv, start, end, people = None, projects = None):
+    '''Picks the cheaper way to fetch the entries of people or of projects.
+
+    Entries of some people can also be had from every project they could
+    	have logged time to, and entries of some projects from every person.
+    	Plans are weighed by their estimated requests and entries, from the
+    	people and projects already fetched; the cheaper is returned along
+    	with the other one. For projects, the other is None if the people
+    	would have to be fetched just to plan it.
+
+    Project record hints may be stale, so the projects are fetched again
+    	before a plan by project is picked for people.'''
+    if people is not None:
+        everyone = hv.people_index().records
+        direct = Plan('person', people, start, end)
+        def by_project():
+            found = hv.projects()
+            return Plan(
+                'project',
+                [p for p in found if may_have_entries(p, start, end)],
+                start,
+                end,
+                ('user_id', [p.id for p in people]),
+                project_rate(everyone, found, start, end),
+            )
+        other = by_project()
+        if other.cost < direct.cost:
+            hv.invalidate('projects/')
+            other = by_project()
+    elif not hv.known('people/'):
+        return (Plan('project', projects, start, end, per_day = None), None)
+    else:
+        everyone = hv.people_index().records
+        direct = Plan(
+            'project',
+            projects,
+            start,
+            end,
+            per_day = project_rate(everyone, hv.projects_index().records, start, end),
+        )
+        other = Plan(
+            'person',
+            everyone,
+            start,
+            end,
+            ('project_id', [p.id for p in projects]),
+        )
+    if other.cost < direct.cost:
+        return (other, direct)
+    return (direct, other)
+
+def explain(results, args):
+    '''Prints each account's plans if --explain was given, returning whether it was.
+
+    results are (account name, plans) pairs.'''
+    if not getattr(args, 'explain', False):
+        return False
+    for name, (chosen, other) in results:
+        print str.format(
+            PLAN_FORMAT,
+            account = account_line(name, PLAN_ACCOUNT_FORMAT),
+            chosen = chosen.describe(),
+        )
+        if other:
+            print str.format(PLAN_OTHER_FORMAT, other.describe())
+        if chosen.keep:
+            print str.format(
+                PLAN_KEEP_FORMAT,
+                count = len(chosen.keep[1]),
+                owners = 'people' if chosen.keep[0] == 'user_id' else 'projects',
+            )
+    return True
+
+def get_planned_entries(plan, start, end, concurrency, store = None, full = False):
+    '''Fetches the entries of a plan, keeping only those it asks for.'''
+    table = get_entries(plan.owners, start, end, concurrency, store, full)
+    if plan.keep:
+        table = table.where(*plan.keep)
+    return table
+
+def get_task_assignments(hv, table, concurrency):
+    '''Indexes task assignments by (project_id, task_id).
+
+    Assignments are fetched once for each project that has any of the given
+    	entries logged to it, rather than once per person.'''
+    projects = hv.projects_index().get_all(table.unique('project_id'))
+    assignments = {}
+    for task_assignments in fetch_all(
+        lambda project: project.task_assignments(),
+        projects,
+        concurrency,
+    ):
+        for ta in task_assignments:
+            assignments[(ta.project_id, ta.task_id)] = ta
+    return assignments
+
+def sum_billable(table, assignments, key):
+    '''Totals hours for each value of the key column, split by billability.
+
+    Returns a dict from key value to a (total, billable, unbillable) tuple.
+    	Entries whose task is no longer assigned to their project are left
+    	out.'''
+    sums = {}
+    for (owner_id, project_id, task_id), hours in table.group_sum(
+        (key, 'project_id', 'task_id')
+    ).iteritems():
+        assignment = assignments.get((project_id, task_id))
+        if not assignment:
+            continue
+        total, billable, unbillable = sums.get(owner_id, (0.0, 0.0, 0.0))
+        if assignment.billable:
+            billable += hours
+        else:
+            unbillable += hours
+        sums[owner_id] = (total + hours, billable, unbillable)
+    return sums
 
 def parse_time_inputs(startstr, endstr):
     if startstr:
@@ -90,175 +381,206 @@ def parse_time_inputs(startstr, endstr):
         end = datetime.datetime.today()
     return (start, end)
 
+def collect_entries(args, owners, start, end, totals, people = False):
+    '''Returns a function gathering one account's part of a report.
+
+    The function picks the account's owners with owners(hv), people if
+    	people is set and projects otherwise, plans how to fetch their
+    	entries and, unless the report is only being explained, fetches them
+    	and passes the table to totals(hv, table). It returns (owners, plans,
+    	totals) for the account, with totals None when only explaining, or
+    	None if the account has none of the owners.'''
+    def collect(hv):
+        found = owners(hv)
+        if len(found) == 0:
+            return None
+        if people:
+            plans = plan_entries(hv, start, end, people = found)
+        else:
+            plans = plan_entries(hv, start, end, projects = found)
+        if getattr(args, 'explain', False):
+            return (found, plans, None)
+        table = get_planned_entries(
+            plans[0],
+            start,
+            end,
+            args.concurrency,
+            get_store(hv, args),
+            getattr(args, 'resync', False),
+        )
+        return (found, plans, totals(hv, table))
+    return collect
+
 def hours(args):
-    hv = get_harvest()
-    if hv:
-        people = get_people(hv, args.personids)
-        if len(people) > 0:
-            times = parse_time_inputs(args.start, args.end)
-            start = times[0]
-            end = times[1]
-            entries_collection = [
-                (person, person.entries(start = start, end = end))
-                for person in people
-            ]
-            if len(entries_collection) > 0:
-                print str.format(
-                    REPORT_HEADER,
-                    'Hours',
-                    start.strftime('%Y-%m-%d'),
-                    end.strftime('%Y-%m-%d'),
-                )
-                overall_hours = 0.0
-                overall_billable = 0.0
-                projects = hv.projects()
-                for person, entries in entries_collection:
-                    map = {
-                        p: {
-                            t: [
-                                e for e in entries 
-                                if e.project_id == p.id and e.task_id == t.task_id
-                            ] 
-                            for t in p.task_assignments()
-                        }
-                        for p in projects
-                    }
-                    total = 0.0
-                    billable = 0.0
-                    unbillable = 0.0
-                    for proj in map:
-                        for task in map[proj]:
-                            for entry in map[proj][task]:
-                                if task.billable:
-                                    billable += entry.hours
-                                    overall_billable += entry.hours
-                                else:
-                                    unbillable += entry.hours
-                                total += entry.hours
-                                overall_hours += entry.hours
-                    # Divide by zero is undefined, but fudge it a little bit
-                    # for easier output.
-                    ratio = billable / unbillable if unbillable > 0.0 else 0.0
-                    percent = billable / total if total > 0.0 else 0.0
-                    print str.format(
-                        HOURS_REPORT_FORMAT,
-                        total = total,
-                        billable = billable,
-                        unbillable = unbillable,
-                        ratio = ratio,
-                        person = person,
-                        percent = percent,
-                    )
+    accounts = get_accounts(args)
+    if accounts:
+        start, end = parse_time_inputs(args.start, args.end)
+        def totals(hv, table):
+            if len(table) > 0:
+                assignments = get_task_assignments(hv, table, args.concurrency)
+                return (len(table), sum_billable(table, assignments, 'user_id'))
+            return (0, {})
+        results = each_account(accounts, collect_entries(
+            args,
+            lambda hv: get_people(hv, args.personids),
+            start,
+            end,
+            totals,
+            people = True,
+        ))
+        if len(results) > 0:
+            if explain([(name, plans) for name, (people, plans, sums) in results], args):
+                return
+            print str.format(
+                REPORT_HEADER,
+                'Hours',
+                start.strftime('%Y-%m-%d'),
+                end.strftime('%Y-%m-%d'),
+            )
+            overall_hours = 0.0
+            overall_billable = 0.0
+            with timed('format'):
+                for name, (people, plans, (count, sums)) in results:
+                    for person in people:
+                        total, billable, unbillable = sums.get(
+                            person.id,
+                            (0.0, 0.0, 0.0),
+                        )
+                        overall_hours += total
+                        overall_billable += billable
+                        # Divide by zero is undefined, but fudge it a little bit
+                        # for easier output.
+                        ratio = billable / unbillable if unbillable > 0.0 else 0.0
+                        percent = billable / total if total > 0.0 else 0.0
+                        print str.format(
+                            HOURS_REPORT_FORMAT,
+                            total = total,
+                            billable = billable,
+                            unbillable = unbillable,
+                            ratio = ratio,
+                            person = person,
+                            percent = percent,
+                            account = account_line(name),
+                        )
                 print str.format(
                     'Overall Billable: {:.2%}',
                     overall_billable / overall_hours if overall_hours != 0.0 else 0
                 )
-            else:
-                print 'No entries for that time period.'
         else:
             print 'No such person ID(s).'
 
 def projects(args):
-    hv = get_harvest()
-    if hv:
-        people = get_people(hv, args.personids)
-        if len(people) > 0:
-            times = parse_time_inputs(args.start, args.end)
-            start = times[0]
-            end = times[1]
-            projects = hv.projects()
-            projects_by_id = {project.id: project for project in projects}
+    accounts = get_accounts(args)
+    if accounts:
+        start, end = parse_time_inputs(args.start, args.end)
+        results = each_account(accounts, collect_entries(
+            args,
+            lambda hv: get_people(hv, args.personids),
+            start,
+            end,
+            lambda hv, table: (hv.projects(), table.group_sum(('user_id', 'project_id'))),
+            people = True,
+        ))
+        if len(results) > 0:
+            if explain([(name, plans) for name, (people, plans, sums) in results], args):
+                return
             print str.format(
                 REPORT_HEADER,
                 'Projects',
                 start.strftime('%Y-%m-%d'),
                 end.strftime('%Y-%m-%d'),
             )
-            for person in people:
-                print str.format(PROJECTS_REPORT_HEADING_FORMAT, person = person)
-                person_projects = {}
-                for entry in person.entries(start = start, end = end):
-                    project = projects_by_id[entry.project_id]
-                    if person_projects.has_key(project):
-                        person_projects[project] += entry.hours
-                    else:
-                        person_projects[project] = entry.hours
-                for project in person_projects.keys():
-                    print str.format(
-                        PROJECTS_REPORT_BODY_FORMAT,
-                        name = project.name,
-                        hours = person_projects[project]
-                    )
+            with timed('format'):
+                for name, (people, plans, (projects, sums)) in results:
+                    for person in people:
+                        print str.format(
+                            PROJECTS_REPORT_HEADING_FORMAT,
+                            person = person,
+                            account = account_line(name),
+                        )
+                        for project in projects:
+                            if sums.has_key((person.id, project.id)):
+                                print str.format(
+                                    PROJECTS_REPORT_BODY_FORMAT,
+                                    name = project.name,
+                                    hours = sums[(person.id, project.id)]
+                                )
         else:
             print 'No such person ID(s).'
 
 def tasks(args):
-    hv = get_harvest()
-    if hv:
-        people = get_people(hv, args.personids)
-        if len(people) > 0:
-            times = parse_time_inputs(args.start, args.end)
-            start = times[0]
-            end = times[1]
-            tasks = hv.tasks()
-            tasks_by_id = {task.id: task for task in tasks}
+    accounts = get_accounts(args)
+    if accounts:
+        start, end = parse_time_inputs(args.start, args.end)
+        results = each_account(accounts, collect_entries(
+            args,
+            lambda hv: get_people(hv, args.personids),
+            start,
+            end,
+            lambda hv, table: (hv.tasks(), table.group_sum(('user_id', 'task_id'))),
+            people = True,
+        ))
+        if len(results) > 0:
+            if explain([(name, plans) for name, (people, plans, sums) in results], args):
+                return
             print str.format(
                 REPORT_HEADER,
                 'Tasks',
                 start.strftime('%Y-%m-%d'),
                 end.strftime('%Y-%m-%d'),
             )
-            for person in people:
-                print str.format(TASKS_HEADER_FORMAT, person = person)
-                person_tasks = {}
-                for entry in person.entries(start = start, end = end):
-                    task = tasks_by_id[entry.task_id]
-                    if person_tasks.has_key(task):
-                        person_tasks[task] += entry.hours
-                    else:
-                        person_tasks[task] = entry.hours
-                for task in person_tasks.keys():
-                    print str.format(
-                        TASKS_BODY_FORMAT,
-                        name = task.name,
-                        hours = person_tasks[task]
-                    )
+            with timed('format'):
+                for name, (people, plans, (tasks, sums)) in results:
+                    for person in people:
+                        print str.format(
+                            TASKS_HEADER_FORMAT,
+                            person = person,
+                            account = account_line(name),
+                        )
+                        for task in tasks:
+                            if sums.has_key((person.id, task.id)):
+                                print str.format(
+                                    TASKS_BODY_FORMAT,
+                                    name = task.name,
+                                    hours = sums[(person.id, task.id)]
+                                )
         else:
             print 'No such person ID(s).'
 
 def tasks_by_proj(args):
-    hv = get_harvest()
-    if hv:
-        projects = get_projects(hv, args.projectids)
-        if len(projects) > 0:
-            times = parse_time_inputs(args.start, args.end)
-            start = times[0]
-            end = times[1]
-            tasks_by_id = {task.id: task for task in hv.tasks()}
+    accounts = get_accounts(args)
+    if accounts:
+        start, end = parse_time_inputs(args.start, args.end)
+        results = each_account(accounts, collect_entries(
+            args,
+            lambda hv: get_projects(hv, args.projectids),
+            start,
+            end,
+            lambda hv, table: (hv.tasks(), table.group_sum(('project_id', 'task_id'))),
+        ))
+        if len(results) > 0:
+            if explain([(name, plans) for name, (projects, plans, sums) in results], args):
+                return
             print str.format(
                 REPORT_HEADER,
                 'Tasks By Project',
                 start.strftime('%Y-%m-%d'),
                 end.strftime('%Y-%m-%d'),
             )
-            for project in projects:
-                print str.format(
-                    PROJECT_BY_TASKS_HEADER_FORMAT,
-                    project = project
-                )
-                entries = project.entries(start = start, end = end)
-                project_tasks = {}
-                for entry in entries:
-                    task = tasks_by_id[entry.task_id]
-                    if project_tasks.has_key(task):
-                        project_tasks[task] += entry.hours
-                    else:
-                        project_tasks[task] = entry.hours
-                for task in project_tasks:
-                    print str.format(
-                        TASKS_BODY_FORMAT,
-                        name = task.name,
-                        hours = project_tasks[task]
-                    )
+            with timed('format'):
+                for name, (projects, plans, (tasks, sums)) in results:
+                    for project in projects:
+                        print str.format(
+                            PROJECT_BY_TASKS_HEADER_FORMAT,
+                            project = project,
+                            account = account_line(name, PROJECT_ACCOUNT_FORMAT),
+                        )
+                        for task in tasks:
+                            if sums.has_key((project.id, task.id)):
+                                print str.format(
+                                    TASKS_BODY_FORMAT,
+                                    name = task.name,
+                                    hours = sums[(project.id, task.id)]
+                                )
         else:
             print 'No such project ID(s).'
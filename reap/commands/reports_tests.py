@@ -0,0 +1,219 @@
+# Copyright 2012-2013 Jake Basile
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import unittest
+import datetime
+import StringIO
+from reap.api.admin import Harvest
+from reap.api.errors import LoginError
+from reap.api.fake import FakeHarvest
+from reap.api.base_tests import FakeHarvestTest
+from reap.commands.reports import *
+import reap.commands.reports
+import reap.commands.support
+
+class TestPlan(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.fake.seed(people = 12, projects = 2, tasks = 3, entries = 300, days = 60)
+        self.hv = Harvest(self.fake.base_uri, self.fake.username, self.fake.password)
+        self.hv.limiter = None
+        days = sorted(e['spent_at'] for e in self.fake.entries)
+        self.start = datetime.datetime.strptime(days[0], '%Y-%m-%d')
+        self.end = datetime.datetime.strptime(days[-1], '%Y-%m-%d')
+
+    def hours_by_person(self, plan):
+        table = get_planned_entries(plan, self.start, self.end, 4)
+        return dict(
+            (person, round(hours, 6))
+            for person, hours in table.group_sum('user_id').iteritems()
+        )
+
+    def test_many_people(self):
+        people = self.hv.people()
+        chosen, other = plan_entries(self.hv, self.start, self.end, people = people)
+        self.assertEqual(chosen.by, 'project')
+        self.assertTrue(chosen.requests < other.requests)
+        # the same hours, however they were fetched.
+        self.assertEqual(
+            self.hours_by_person(chosen),
+            self.hours_by_person(other),
+        )
+
+    def test_few_people(self):
+        people = self.hv.people()[:1]
+        chosen, other = plan_entries(self.hv, self.start, self.end, people = people)
+        self.assertEqual(chosen.by, 'person')
+        self.assertEqual(chosen.keep, None)
+
+    def test_entries_weighed(self):
+        # fewer requests by project, but for every person's entries.
+        people = self.hv.people()[:4]
+        chosen, other = plan_entries(self.hv, self.start, self.end, people = people)
+        self.assertEqual(chosen.by, 'person')
+        self.assertTrue(other.requests < chosen.requests)
+        self.assertTrue(other.entries > chosen.entries)
+        self.assertIn(str.format('{} entries', chosen.entries), chosen.describe())
+
+    def test_fresh_hints(self):
+        self.hv.people_index()
+        self.hv.projects()
+        self.fake.reset_counts()
+        plan_entries(self.hv, self.start, self.end, people = self.hv.people()[:1])
+        self.assertEqual(self.fake.count('projects/'), 0)
+        # a plan by project is only picked from hints fetched again.
+        plan_entries(self.hv, self.start, self.end, people = self.hv.people())
+        self.assertEqual(self.fake.count('projects/'), 1)
+
+    def test_projects(self):
+        self.hv.people_index()
+        projects = self.hv.projects()[:1]
+        chosen, other = plan_entries(self.hv, self.start, self.end, projects = projects)
+        self.assertEqual(chosen.by, 'project')
+        self.assertEqual(other.keep, ('project_id', [projects[0].id]))
+
+    def test_projects_without_people(self):
+        projects = self.hv.projects()[:1]
+        self.fake.reset_counts()
+        chosen, other = plan_entries(self.hv, self.start, self.end, projects = projects)
+        # people are not fetched just to plan.
+        self.assertEqual(self.fake.count('people/'), 0)
+        self.assertEqual(chosen.by, 'project')
+        self.assertEqual(other, None)
+
+    def test_may_have_entries(self):
+        old = self.fake.add_project('Old', self.fake.clients[0]['id'])
+        self.fake.add_entry(self.fake.user, old, self.fake.tasks[0], 1.0, spent_at = '2013-01-10')
+        project = [p for p in self.hv.projects() if p.id == old['id']][0]
+        self.assertTrue(may_have_entries(
+            project,
+            datetime.datetime(2013, 1, 1),
+            datetime.datetime(2013, 1, 31),
+        ))
+        self.assertFalse(may_have_entries(
+            project,
+            datetime.datetime(2012, 1, 1),
+            datetime.datetime(2012, 12, 31),
+        ))
+        # active projects may have gained entries since the hints were read.
+        later = (datetime.datetime(2013, 6, 1), datetime.datetime(2013, 6, 30))
+        self.assertTrue(may_have_entries(project, *later))
+        project.active = False
+        self.assertFalse(may_have_entries(project, *later))
+
+class TestAccounts(FakeHarvestTest):
+    def setUp(self):
+        FakeHarvestTest.setUp(self)
+        self.other = FakeHarvest(password = 'hunter2').start()
+        client = self.other.add_client('Initrode')
+        project = self.other.add_project('Cover Sheets', client['id'])
+        task = self.other.add_task('Filing')
+        self.other.assign_task(project, task)
+        self.other.add_entry(self.other.user, project, task, 4.0)
+        # profiles and sessions go to a scratch directory, passwords come
+        # 	from the fakes rather than the keyring.
+        self.dir = tempfile.mkdtemp()
+        self.saved = (
+            reap.commands.support.PROFILES_FILE,
+            reap.commands.support.SESSION_FILE,
+            reap.commands.reports.saved_password,
+        )
+        reap.commands.support.PROFILES_FILE = os.path.join(self.dir, 'profiles')
+        reap.commands.support.SESSION_FILE = os.path.join(self.dir, 'session')
+        passwords = {
+            self.fake.base_uri: self.fake.password,
+            self.other.base_uri: self.other.password,
+        }
+        reap.commands.reports.saved_password = lambda base_uri, username: passwords[base_uri]
+        save_profile('acme', self.fake.base_uri, self.fake.username)
+        save_profile('globex', self.other.base_uri, self.other.username)
+
+    def tearDown(self):
+        reap.commands.support.PROFILES_FILE, reap.commands.support.SESSION_FILE, \
+            reap.commands.reports.saved_password = self.saved
+        shutil.rmtree(self.dir)
+        self.other.stop()
+        FakeHarvestTest.tearDown(self)
+
+    def args(self, accounts, **kwargs):
+        return argparse.Namespace(
+            accounts = accounts,
+            no_cache = True,
+            concurrency = 2,
+            start = None,
+            end = None,
+            **kwargs
+        )
+
+    def report(self, function, args):
+        stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        try:
+            function(args)
+            return sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def test_login(self):
+        accounts = get_accounts(self.args(['acme', 'globex']))
+        self.assertEqual([name for name, hv in accounts], ['acme', 'globex'])
+        acme, globex = [hv for name, hv in accounts]
+        # each account has its own connections and rate limit.
+        self.assertIsNot(acme.pool, globex.pool)
+        self.assertIsNot(acme.limiter, globex.limiter)
+        # and both sessions are kept, so the next run skips logging in.
+        self.assertIsNotNone(load_identity(self.fake.base_uri, self.fake.username))
+        self.assertIsNotNone(load_identity(self.other.base_uri, self.other.username))
+
+    def test_login_failed(self):
+        acme, globex = [hv for name, hv in get_accounts(self.args(['acme', 'globex']))]
+        self.other.password = 'swordfish'
+        with self.assertRaises(LoginError) as raised:
+            globex.people()
+        self.assertEqual(raised.exception.base_uri, self.other.base_uri)
+        output = self.report(login_failed, raised.exception)
+        self.assertIn(self.other.username, output)
+        self.assertIn(self.other.base_uri, output)
+        # only the rejected account has to log in again.
+        self.assertIsNotNone(load_identity(self.fake.base_uri, self.fake.username))
+        self.assertIsNone(load_identity(self.other.base_uri, self.other.username))
+
+    def test_missing(self):
+        output = self.report(hours, self.args(['acme', 'initech'], personids = [1]))
+        self.assertIn('No such profile(s): initech.', output)
+
+    def test_merged(self):
+        ids = [self.fake.user['id'], self.other.user['id']]
+        output = self.report(hours, self.args(['acme', 'globex'], personids = ids))
+        self.assertEqual(output.count('Hours Report:'), 1)
+        self.assertIn('Account:        acme', output)
+        self.assertIn('Account:        globex', output)
+        self.assertIn('Total Hours:    4.0', output)
+        self.assertIn('Total Hours:    2.5', output)
+        output = self.report(tasks_by_proj, self.args(
+            ['acme', 'globex'],
+            projectids = [self.fake.projects[0]['id'], self.other.projects[0]['id']],
+        ))
+        self.assertIn('Account: globex', output)
+        self.assertIn('Filing', output)
+        self.assertIn('Admin', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
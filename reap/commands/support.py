@@ -12,7 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import os.path
+import json
+import time
+import threading
+from reap.api.cache import Cache
+
+SESSION_FILE = os.path.expanduser('~/.reapsession')
+
+# Named logins, for reports across several accounts.
+PROFILES_FILE = os.path.expanduser('~/.reapprofiles')
+
+STATS_FORMAT = '''Stats:
+    Wall Time:      {wall:.3f}s
+    Requests:       {requests} ({revalidated} not modified), {bytes} bytes received
+    From Cache:     {hits} cached, {shared} shared with another request
+    Request Time:   {seconds:.3f}s (DNS {dns:.3f}s, connect {connect:.3f}s, TLS {tls:.3f}s, waiting {wait:.3f}s, body {body:.3f}s)
+    JSON Parsing:   {json:.3f}s
+    Models:         {models:.3f}s
+    Formatting:     {format:.3f}s'''
+
+STATS_ENDPOINT_FORMAT = '''        {seconds:8.3f}s {count:6d}  {endpoint}'''
+
+STATS_SLOWEST_FORMAT = '''        {trace.total:8.3f}s {status:>6}  {trace.method} {trace.path}'''
+
+# How long a saved login is trusted before checking it with Harvest again.
+SESSION_TTL = 24 * 60 * 60
+
+# Accounts are logged in to at once, each saving its session.
+_sessions_lock = threading.Lock()
 
 def save_info(base_uri, username):
     with open(os.path.expanduser('~/.reaprc'), 'w') as file:
@@ -28,4 +57,154 @@ def load_info():
     else:
         print 'Please login first.'
 
+def save_profile(name, base_uri, username):
+    profiles = load_profiles()
+    profiles[name] = {'base_uri': base_uri, 'username': username}
+    with open(PROFILES_FILE, 'w') as file:
+        json.dump(profiles, file, indent = 4, sort_keys = True)
+
+def load_profiles():
+    '''Returns the logins saved with login --profile, by name.'''
+    try:
+        with open(PROFILES_FILE, 'r') as file:
+            return json.load(file)
+    except (IOError, ValueError):
+        return {}
+
+def _load_sessions():
+    try:
+        with open(SESSION_FILE, 'r') as file:
+            sessions = json.load(file)
+    except (IOError, ValueError):
+        return {}
+    if sessions.has_key('base_uri'):
+        # saved by an older reap, which kept only one.
+        sessions = {sessions['base_uri'] + ' ' + sessions['username']: sessions}
+    return sessions
+
+def save_identity(base_uri, username, identity):
+    with _sessions_lock:
+        sessions = _load_sessions()
+        sessions[base_uri + ' ' + username] = {
+            'base_uri': base_uri,
+            'username': username,
+            'identity': identity,
+            'expires': time.time() + SESSION_TTL,
+        }
+        with open(SESSION_FILE, 'w') as file:
+            json.dump(sessions, file)
+
+def load_identity(base_uri, username):
+    session = _load_sessions().get(base_uri + ' ' + username)
+    if not session or session['expires'] < time.time():
+        return None
+    return session['identity']
+
+def saved_password(base_uri, username):
+    '''Returns a function that reads the password saved at login.
+
+    Looking the password up loads keyring and its backends, which is slow, so
+        it is left until a request to Harvest actually needs it.'''
+    def password():
+        import keyring
+        return keyring.get_password(base_uri, username)
+    return password
+
+def clear_identity(base_uri, username):
+    '''Forgets the session of one account, so its login is checked next time.'''
+    with _sessions_lock:
+        sessions = _load_sessions()
+        if sessions.pop(base_uri + ' ' + username, None) is None:
+            return
+        with open(SESSION_FILE, 'w') as file:
+            json.dump(sessions, file)
+
+def login_failed(error):
+    '''Handles a LoginError from a command, forgetting the failed session.'''
+    if error.base_uri and error.username:
+        clear_identity(error.base_uri, error.username)
+        print str.format(
+            'Harvest rejected the credentials of {} at {}. Please login again.',
+            error.username,
+            error.base_uri,
+        )
+    else:
+        print 'Harvest rejected your credentials. Please login again.'
+
+def get_cache(args):
+    if getattr(args, 'no_cache', False):
+        return None
+    return Cache(refresh = getattr(args, 'refresh', False))
+
+def get_journal(args, base_uri, username):
+    '''Returns the journal offline changes are kept in, if --offline was given.'''
+    if not getattr(args, 'offline', False):
+        return None
+    from reap.api.journal import Journal
+    return Journal(base_uri + ' ' + username)
+
+def sync_later():
+    '''Starts reap sync in the background, to send journaled changes.'''
+    import sys
+    import subprocess
+    with open(os.devnull, 'r+') as devnull:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(sys.argv[0]), '--offline', '--no-daemon', 'sync', '--quiet'],
+            stdin = devnull,
+            stdout = devnull,
+            stderr = devnull,
+            close_fds = True,
+            preexec_fn = os.setsid,
+        )
+
+def start_stats(args):
+    '''Starts collecting request traces and phase times, if --stats was given.'''
+    if getattr(args, 'stats', False):
+        from reap.api.trace import Stats, add_tracer
+        stats = Stats()
+        add_tracer(stats)
+        return stats
 
+def print_stats(stats, out = None):
+    '''Prints a summary of what start_stats collected, to stderr by default.'''
+    if not stats:
+        return
+    import sys
+    out = out or sys.stderr
+    requests = stats.requests()
+    def total(step):
+        return sum(getattr(trace, step) for trace in requests)
+    print >> out, str.format(
+        STATS_FORMAT,
+        wall = time.time() - stats.began,
+        requests = len(requests),
+        revalidated = len([t for t in requests if t.cache == 'revalidated']),
+        bytes = sum(trace.bytes for trace in requests),
+        hits = len([t for t in stats.traces if t.cache == 'hit']),
+        shared = len([t for t in stats.traces if t.cache == 'shared']),
+        seconds = total('total'),
+        dns = total('dns'),
+        connect = total('connect'),
+        tls = total('tls'),
+        wait = total('wait'),
+        body = total('body'),
+        json = stats.phases.get('json', 0.0),
+        models = stats.phases.get('models', 0.0),
+        format = stats.phases.get('format', 0.0),
+    )
+    if requests:
+        print >> out, '    By Endpoint:'
+        for endpoint, count, seconds in stats.endpoints():
+            print >> out, str.format(
+                STATS_ENDPOINT_FORMAT,
+                seconds = seconds,
+                count = count,
+                endpoint = endpoint,
+            )
+        print >> out, '    Slowest:'
+        for trace in stats.slowest():
+            print >> out, str.format(
+                STATS_SLOWEST_FORMAT,
+                trace = trace,
+                status = trace.status or 'failed',
+            )